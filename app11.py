@@ -1,17 +1,27 @@
 import sys
-import sqlite3
 import pandas as pd
 import os
 import datetime
 from PyQt5 import QtWidgets, QtGui, QtCore
 
+import memory_budget
+import perftrace
+from case_data import CASE_COLUMN, convert_timestamp
+from cases import load_registry, open_case, case_choices, media_paths, tables_memory
+
 CHATS_BATCH_SIZE = 500
 MESSAGES_BATCH_SIZE = 500
 BASE_MEDIA_PATH = r'F:\Nuevacarpeta\media'  # Ajustar ruta
-DATABASE_PATH = 'msgstore.db'
 
 MAX_IMAGE_WIDTH = 300
 
+CASE_ROLE = QtCore.Qt.UserRole + 1
+# (caso, _id) del mensaje: clave de la caché de tamaños del delegado
+MESSAGE_KEY_ROLE = QtCore.Qt.UserRole + 2
+
+# Refresco de la barra de estado con el uso de memoria (ms)
+MEMORY_STATUS_INTERVAL_MS = 2000
+
 class ChatsModel(QtCore.QAbstractListModel):
     def __init__(self, chats_df, parent=None):
         super().__init__(parent)
@@ -27,6 +37,9 @@ class ChatsModel(QtCore.QAbstractListModel):
             return self.chats_df.iloc[index.row()]['chat_display_name']
         if role == QtCore.Qt.UserRole:
             return self.chats_df.iloc[index.row()]['chat_jid']
+        if role == CASE_ROLE:
+            # Teléfono del chat en la vista combinada (None con un solo caso)
+            return self.chats_df.iloc[index.row()].get(CASE_COLUMN)
         return None
 
     def update_chats(self, new_df):
@@ -35,12 +48,28 @@ class ChatsModel(QtCore.QAbstractListModel):
         self.endResetModel()
 
 class MessagesModel(QtCore.QAbstractListModel):
-    def __init__(self, messages_df, parent=None):
+    def __init__(self, messages_df, text_loader=None, parent=None):
         super().__init__(parent)
-        self.messages_df = messages_df
+        # Con límite de memoria los textos largos se piden a la base
+        # (text_loader) solo para las filas que se van mostrando
+        self.text_loader = text_loader
+        self.messages_df = self.with_text_columns(messages_df)
         self.loaded_count = 0
         self.messages_batch_size = MESSAGES_BATCH_SIZE
 
+    def with_text_columns(self, messages_df):
+        if self.text_loader is None:
+            return messages_df
+        missing = [c for c in memory_budget.LARGE_TEXT_COLUMNS if c not in messages_df.columns]
+        return messages_df.assign(**{c: '' for c in missing}) if missing else messages_df
+
+    def load_texts(self, first, last):
+        if self.text_loader is None or last <= first:
+            return
+        texts = self.text_loader(self.messages_df.iloc[first:last])
+        for column in texts.columns:
+            self.messages_df.iloc[first:last, self.messages_df.columns.get_loc(column)] = texts[column].to_numpy()
+
     def rowCount(self, parent=QtCore.QModelIndex()):
         return self.loaded_count
 
@@ -51,6 +80,7 @@ class MessagesModel(QtCore.QAbstractListModel):
         remainder = len(self.messages_df) - self.loaded_count
         items_to_fetch = min(self.messages_batch_size, remainder)
         if items_to_fetch > 0:
+            self.load_texts(self.loaded_count, self.loaded_count + items_to_fetch)
             self.beginInsertRows(QtCore.QModelIndex(), self.loaded_count, self.loaded_count + items_to_fetch - 1)
             self.loaded_count += items_to_fetch
             self.endInsertRows()
@@ -60,25 +90,42 @@ class MessagesModel(QtCore.QAbstractListModel):
             return None
         if index.row() >= self.loaded_count:
             return None
+        if role == MESSAGE_KEY_ROLE:
+            row = index.row()
+            case_name = self.messages_df[CASE_COLUMN].iat[row] if CASE_COLUMN in self.messages_df.columns else None
+            return case_name, int(self.messages_df['_id'].iat[row])
         msg = self.messages_df.iloc[index.row()]
         if role == QtCore.Qt.UserRole:
-            return msg.to_dict()
+            msg = msg.to_dict()
+            if 'display_timestamp' not in msg:
+                # Con límite de memoria la fecha se formatea al mostrar la fila
+                msg['display_timestamp'] = convert_timestamp(msg['timestamp_raw']) or ''
+            return msg
         if role == QtCore.Qt.DisplayRole:
             return msg['text_data']
         return None
 
     def update_messages(self, new_df):
         self.beginResetModel()
-        self.messages_df = new_df
+        self.messages_df = self.with_text_columns(new_df)
         self.loaded_count = 0
         self.endResetModel()
 
 class MessageDelegate(QtWidgets.QStyledItemDelegate):
-    def __init__(self, base_media_path, parent=None):
+    def __init__(self, base_media_path, case_media_paths=None, parent=None):
         super().__init__(parent)
         self.base_media_path = base_media_path
-        self.image_cache = {}
-
+        # Carpeta de medios de cada teléfono en la vista combinada
+        self.case_media_paths = case_media_paths or {}
+        # Imágenes escaladas por ruta y altos por mensaje; con límite de
+        # memoria descartan lo menos usado al pasar su parte del límite
+        self.image_cache = memory_budget.LruCache(memory_budget.share(memory_budget.IMAGE_CACHE_SHARE),
+                                                  sizeof=pixmap_nbytes)
+        self.size_cache = memory_budget.LruCache(memory_budget.share(memory_budget.SIZE_CACHE_SHARE),
+                                                 sizeof=lambda _: memory_budget.SIZE_ENTRY_BYTES)
+        self.size_cache_width = None
+
+    @perftrace.traced('pintado')
     def paint(self, painter, option, index):
         painter.save()
         msg = index.data(QtCore.Qt.UserRole)
@@ -122,7 +169,7 @@ class MessageDelegate(QtWidgets.QStyledItemDelegate):
         text_width = content_rect.width()
 
         if message_type == 1 and file_path:
-            pix = self.load_image(index.row(), file_path)
+            pix = self.load_image(index.row(), file_path, msg.get(CASE_COLUMN))
             if pix:
                 painter.drawPixmap(x, y, pix)
                 y += pix.height() + 5
@@ -155,7 +202,21 @@ class MessageDelegate(QtWidgets.QStyledItemDelegate):
 
         painter.restore()
 
+    @perftrace.traced('pintado')
     def sizeHint(self, option, index):
+        # El alto depende del ancho: al cambiar el ancho se recalcula todo
+        if option.rect.width() != self.size_cache_width:
+            self.size_cache.clear()
+            self.size_cache_width = option.rect.width()
+        key = index.data(MESSAGE_KEY_ROLE)
+        size = self.size_cache.get(key)
+        if size is None:
+            size = self.compute_size_hint(option, index)
+            if key is not None:
+                self.size_cache.put(key, size)
+        return size
+
+    def compute_size_hint(self, option, index):
         msg = index.data(QtCore.Qt.UserRole)
         if not msg:
             return super().sizeHint(option, index)
@@ -182,7 +243,7 @@ class MessageDelegate(QtWidgets.QStyledItemDelegate):
         image_height = 0
         button_height_for_image = 0
         if message_type == 1 and file_path:
-            pix = self.load_image(index.row(), file_path)
+            pix = self.load_image(index.row(), file_path, msg.get(CASE_COLUMN))
             if pix:
                 image_height = pix.height() + 5
                 button_height_for_image = self.button_height("Ver Imagen", fm)
@@ -247,24 +308,27 @@ class MessageDelegate(QtWidgets.QStyledItemDelegate):
             display_text = text_data if text_data else "[Mensaje vacío]"
         return display_text
 
-    def load_image(self, row, file_path):
-        if row in self.image_cache:
-            return self.image_cache[row]
+    def load_image(self, row, file_path, case_name=None):
+        full_path = self.adjust_media_path(file_path, case_name)
+        if full_path in self.image_cache:
+            return self.image_cache.get(full_path)
 
-        full_path = self.adjust_media_path(file_path)
         if os.path.exists(full_path):
-            pix = QtGui.QPixmap(full_path)
+            with perftrace.span('MessageDelegate.load_image', 'imagen', archivo=os.path.basename(full_path)):
+                pix = QtGui.QPixmap(full_path)
+                if not pix.isNull():
+                    pix = pix.scaledToWidth(MAX_IMAGE_WIDTH, QtCore.Qt.SmoothTransformation)
             if not pix.isNull():
-                pix = pix.scaledToWidth(MAX_IMAGE_WIDTH, QtCore.Qt.SmoothTransformation)
-                self.image_cache[row] = pix
+                self.image_cache.put(full_path, pix)
                 return pix
-        self.image_cache[row] = None
+        self.image_cache.put(full_path, None)
         return None
 
-    def adjust_media_path(self, path):
+    def adjust_media_path(self, path, case_name=None):
         if path.startswith('Media/'):
             path = path[len('Media/'):]
-        adjusted_path = os.path.join(self.base_media_path, *path.split('/'))
+        base_media_path = self.case_media_paths.get(case_name, self.base_media_path)
+        adjusted_path = os.path.join(base_media_path, *path.split('/'))
         return adjusted_path
 
     def draw_green_button(self, painter, x, y, text, fm):
@@ -287,121 +351,76 @@ class MessageDelegate(QtWidgets.QStyledItemDelegate):
     def button_height(self, text, fm):
         return fm.height() + 10 + 5
 
+def pixmap_nbytes(pix):
+    return pix.width() * pix.height() * max(pix.depth(), 8) // 8
+
 class WhatsAppViewer(QtWidgets.QMainWindow):
-    def __init__(self):
+    def __init__(self, case_key=None):
         super().__init__()
         self.setWindowTitle("Visualizador de WhatsApp (Rango Fecha 01/01/2020 y Ubicaciones)")
         self.setGeometry(100, 100, 1000, 600)
+
+        # Teléfonos del caso (casos.json) y vista mostrada
+        self.sources, active = load_registry()
+        self.case_key = case_key or active
         self.base_media_path = BASE_MEDIA_PATH
+        self.case_media_paths = {}
 
         self.all_conversations = pd.DataFrame()
         self.filtered_chats = pd.DataFrame()
         self.messages_df = pd.DataFrame()
         self.selected_chat_jid = None
+        self.selected_case = None
         self.scroll_loading_messages = False
 
         self.load_data()
         self.create_widgets()
 
     def load_data(self):
+        # Mensajes y conversaciones compartidos con los demás visores (case_data)
         try:
-            conn = sqlite3.connect(DATABASE_PATH)
-            query = """
-            SELECT
-                message._id,
-                message.key_id,
-                message.chat_row_id,
-                message.from_me,
-                message.sender_jid_row_id,
-                message.status,
-                message.timestamp,
-                message.message_type,
-                message.text_data,
-                jid.raw_string AS sender_jid,
-                chat.subject AS chat_name,
-                chat_jid.raw_string AS chat_jid,
-                message_media.file_path,
-                message_media.media_name,
-                message_media.file_size AS media_size,
-                message_media.media_caption,
-                message_media.media_duration,
-                message_media.mime_type AS media_mime_type,
-                message_media.width,
-                message_media.height,
-                message_location.latitude,
-                message_location.longitude,
-                message_location.place_name,
-                message_location.place_address,
-                message_location.url,
-                message_location.live_location_share_duration,
-                message_location.live_location_sequence_number,
-                message_location.live_location_final_latitude,
-                message_location.live_location_final_longitude,
-                message_location.live_location_final_timestamp,
-                message_location.map_download_status
-            FROM message
-            LEFT JOIN jid ON message.sender_jid_row_id = jid._id
-            LEFT JOIN chat ON message.chat_row_id = chat._id
-            LEFT JOIN jid AS chat_jid ON chat.jid_row_id = chat_jid._id
-            LEFT JOIN message_media ON message._id = message_media.message_row_id
-            LEFT JOIN message_location ON message._id = message_location.message_row_id
-            """
-            df_messages = pd.read_sql_query(query, conn)
-            conn.close()
+            case = open_case(self.case_key, self.sources)
+            df_messages = case.messages()
+            conversaciones = case.conversations()
         except Exception as e:
             QtWidgets.QMessageBox.critical(self, "Error al leer los mensajes", str(e))
-            sys.exit(1)
-
-        df_messages['timestamp'] = pd.to_numeric(df_messages['timestamp'], errors='coerce')
-        df_messages['timestamp_raw'] = df_messages['timestamp']
-        df_messages['display_timestamp'] = df_messages['timestamp_raw'].apply(self.convert_timestamp)
-
-        df_messages['from_me'] = df_messages['from_me'].fillna(0).astype(int)
-        df_messages['text_data'] = df_messages['text_data'].fillna('')
-        df_messages['sender_jid'] = df_messages['sender_jid'].fillna('Desconocido')
-        df_messages['chat_name'] = df_messages['chat_name'].fillna('')
-        df_messages['chat_jid'] = df_messages['chat_jid'].fillna('')
-        df_messages['message_type'] = df_messages['message_type'].fillna(0).astype(int)
-        df_messages['media_name'] = df_messages['media_name'].fillna('')
-        df_messages['media_caption'] = df_messages['media_caption'].fillna('')
-        df_messages['file_path'] = df_messages['file_path'].fillna('')
-        df_messages['media_mime_type'] = df_messages['media_mime_type'].fillna('')
-        df_messages['media_duration'] = df_messages['media_duration'].fillna(0).astype(int)
-        df_messages['media_size'] = df_messages.get('media_size', 0).fillna(0).astype(int)
-
-        location_cols = [
-            'latitude','longitude','place_name','place_address','url',
-            'live_location_share_duration','live_location_sequence_number',
-            'live_location_final_latitude','live_location_final_longitude',
-            'live_location_final_timestamp','map_download_status'
-        ]
-        for col in location_cols:
-            if col in df_messages.columns:
-                df_messages[col] = df_messages[col].fillna('')
-
-        df_messages['latitude'] = pd.to_numeric(df_messages['latitude'], errors='coerce')
-        df_messages['longitude'] = pd.to_numeric(df_messages['longitude'], errors='coerce')
-
-        df_messages['chat_display_name'] = df_messages.apply(
-            lambda row: row['chat_name'] if row['chat_name'] else row['chat_jid'], axis=1
-        )
-
-        conversaciones = df_messages.sort_values('timestamp_raw', ascending=False).drop_duplicates('chat_jid')
-        conversaciones = conversaciones.sort_values(by='timestamp_raw', ascending=False).reset_index(drop=True)
-        conversaciones = conversaciones[['chat_jid', 'chat_display_name', 'text_data', 'display_timestamp', 'timestamp_raw']]
+            if self.df_messages is None:
+                sys.exit(1)
+            return False
 
         self.all_conversations = conversaciones
         self.filtered_chats = self.all_conversations
         self.df_messages = df_messages
 
-    def convert_timestamp(self, ts):
-        if pd.notnull(ts) and ts > 0:
-            try:
-                return datetime.datetime.fromtimestamp(ts / 1000).strftime('%d/%m/%Y %H:%M:%S')
-            except Exception:
-                return None
-        else:
-            return None
+        # Carpeta de medios de la vista (la de BASE_MEDIA_PATH si no tiene propia)
+        self.case_media_paths = media_paths(self.sources)
+        self.base_media_path = self.case_media_paths.get(self.case_key, BASE_MEDIA_PATH)
+        return True
+
+    def switch_case(self, combo_index):
+        case_key = self.case_combo.itemData(combo_index)
+        if case_key == self.case_key:
+            return
+        previous = self.case_key
+        self.case_key = case_key
+        if not self.load_data():
+            self.case_key = previous
+            self.case_combo.blockSignals(True)
+            self.case_combo.setCurrentIndex(self.case_combo.findData(previous))
+            self.case_combo.blockSignals(False)
+            return
+
+        delegate = self.messages_view.itemDelegate()
+        delegate.base_media_path = self.base_media_path
+        delegate.case_media_paths = self.case_media_paths
+        delegate.image_cache.clear()
+        delegate.size_cache.clear()
+
+        self.messages_view.setModel(None)
+        self.selected_chat_jid = None
+        self.selected_case = None
+        self.message_header.setText("Seleccione un chat")
+        self.filter_chats()
 
     def create_widgets(self):
         self.setStyleSheet("""
@@ -426,6 +445,22 @@ class WhatsAppViewer(QtWidgets.QMainWindow):
 
         # Panel izquierdo: Chats
         left_layout = QtWidgets.QVBoxLayout()
+
+        # Selector de teléfono (solo si el caso tiene más de uno)
+        case_layout = QtWidgets.QHBoxLayout()
+        case_label = QtWidgets.QLabel("Caso:")
+        case_label.setStyleSheet("font-weight: bold; color: #075E54;")
+        self.case_combo = QtWidgets.QComboBox()
+        for key, label in case_choices(self.sources):
+            self.case_combo.addItem(label, key)
+        self.case_combo.setCurrentIndex(max(self.case_combo.findData(self.case_key), 0))
+        self.case_combo.currentIndexChanged.connect(self.switch_case)
+        case_layout.addWidget(case_label)
+        case_layout.addWidget(self.case_combo, 1)
+        case_label.setVisible(len(self.sources) > 1)
+        self.case_combo.setVisible(len(self.sources) > 1)
+        left_layout.addLayout(case_layout)
+
         chat_header = QtWidgets.QLabel("Chats")
         chat_header.setStyleSheet("background-color: #075E54; color: #FFFFFF; font-size: 16px; padding: 10px;")
         left_layout.addWidget(chat_header)
@@ -496,7 +531,7 @@ class WhatsAppViewer(QtWidgets.QMainWindow):
 
         self.messages_view = QtWidgets.QListView()
         self.messages_view.setWordWrap(True)
-        self.messages_view.setItemDelegate(MessageDelegate(self.base_media_path))
+        self.messages_view.setItemDelegate(MessageDelegate(self.base_media_path, self.case_media_paths))
         self.messages_view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.messages_view.verticalScrollBar().valueChanged.connect(self.check_scroll_position_messages)
         self.messages_view.doubleClicked.connect(self.handle_message_double_click)
@@ -505,11 +540,29 @@ class WhatsAppViewer(QtWidgets.QMainWindow):
         main_layout.addLayout(left_layout, 1)
         main_layout.addLayout(right_layout, 3)
 
+        # Uso de memoria por componente (y el límite, si hay)
+        self.memory_label = QtWidgets.QLabel()
+        self.statusBar().addPermanentWidget(self.memory_label)
+        self.memory_timer = QtCore.QTimer(self)
+        self.memory_timer.setInterval(MEMORY_STATUS_INTERVAL_MS)
+        self.memory_timer.timeout.connect(self.update_memory_status)
+        self.memory_timer.start()
+        self.update_memory_status()
+
         self.load_chats()
 
+    def update_memory_status(self):
+        delegate = self.messages_view.itemDelegate()
+        components = tables_memory()
+        components['imágenes'] = delegate.image_cache.nbytes
+        components['tamaños'] = delegate.size_cache.nbytes
+        self.memory_label.setText(memory_budget.format_usage(components))
+        self.memory_label.setStyleSheet("color: #B00020;" if memory_budget.over_budget() else "")
+
     def load_chats(self):
         self.chat_model.update_chats(self.filtered_chats)
 
+    @perftrace.traced('filtro')
     def filter_chats(self):
         filtro = self.chat_search_input.text().lower()
         if filtro:
@@ -525,18 +578,33 @@ class WhatsAppViewer(QtWidgets.QMainWindow):
         chat_jid = index.data(QtCore.Qt.UserRole)
         chat_name = index.data(QtCore.Qt.DisplayRole)
         self.selected_chat_jid = chat_jid
+        self.selected_case = index.data(CASE_ROLE)
         self.message_header.setText(chat_name)
 
-        self.filtered_data = self.get_messages_for_chat(chat_jid)
+        self.filtered_data = self.get_messages_for_chat(chat_jid, self.selected_case)
 
-        self.messages_model = MessagesModel(self.filtered_data)
+        self.messages_model = MessagesModel(self.filtered_data, self.text_loader())
         self.messages_view.setModel(self.messages_model)
         self.messages_model.fetchMore(QtCore.QModelIndex())
 
         self.clear_filters()
 
-    def get_messages_for_chat(self, chat_jid):
-        chat_messages = self.df_messages[self.df_messages['chat_jid'] == chat_jid]
+    def text_loader(self):
+        """Con límite de memoria, función que pide los textos de unas filas a la base."""
+        if not memory_budget.limited():
+            return None
+        case = open_case(self.case_key, self.sources)
+        return case.message_texts
+
+    def chat_mask(self, chat_jid, case_name=None):
+        mask = self.df_messages['chat_jid'] == chat_jid
+        if case_name is not None and CASE_COLUMN in self.df_messages.columns:
+            mask &= self.df_messages[CASE_COLUMN] == case_name
+        return mask
+
+    @perftrace.traced('filtro')
+    def get_messages_for_chat(self, chat_jid, case_name=None):
+        chat_messages = self.df_messages[self.chat_mask(chat_jid, case_name)]
         chat_messages = chat_messages.sort_values(by='timestamp_raw', ascending=True).reset_index(drop=True)
         return chat_messages
 
@@ -546,14 +614,20 @@ class WhatsAppViewer(QtWidgets.QMainWindow):
             if scrollbar.value() + scrollbar.pageStep() >= scrollbar.maximum() - 50:
                 self.messages_view.model().fetchMore(QtCore.QModelIndex())
 
+    @perftrace.traced('filtro')
     def filter_messages(self):
         if not self.selected_chat_jid or not hasattr(self, 'messages_model'):
             return
 
-        datos_a_filtrar = self.df_messages[self.df_messages['chat_jid'] == self.selected_chat_jid]
+        datos_a_filtrar = self.df_messages[self.chat_mask(self.selected_chat_jid, self.selected_case)]
 
         filtro_texto = self.message_search_input.text().lower()
-        if filtro_texto:
+        if filtro_texto and memory_budget.limited():
+            # Los textos no están cargados: la búsqueda se hace en la base
+            case = open_case(self.case_key, self.sources)
+            ids = case.search_messages(filtro_texto, self.selected_chat_jid, self.selected_case)
+            datos_a_filtrar = datos_a_filtrar[datos_a_filtrar['_id'].isin(ids)]
+        elif filtro_texto:
             datos_a_filtrar = datos_a_filtrar[
                 datos_a_filtrar['text_data'].str.contains(filtro_texto, case=False, na=False) |
                 datos_a_filtrar['media_caption'].str.contains(filtro_texto, case=False, na=False)
@@ -602,14 +676,15 @@ class WhatsAppViewer(QtWidgets.QMainWindow):
             osm_url = f"https://www.openstreetmap.org/?mlat={latitude}&mlon={longitude}#map=15/{latitude}/{longitude}"
             QtGui.QDesktopServices.openUrl(QtCore.QUrl(osm_url))
         elif message_type in (1, 2, 3) and file_path:
-            adjusted_path = self.adjust_media_path(file_path)
+            adjusted_path = self.adjust_media_path(file_path, msg.get(CASE_COLUMN))
             if os.path.exists(adjusted_path):
                 QtGui.QDesktopServices.openUrl(QtCore.QUrl.fromLocalFile(adjusted_path))
 
-    def adjust_media_path(self, path):
+    def adjust_media_path(self, path, case_name=None):
         if path.startswith('Media/'):
             path = path[len('Media/'):]
-        adjusted_path = os.path.join(self.base_media_path, *path.split('/'))
+        base_media_path = self.case_media_paths.get(case_name, self.base_media_path)
+        adjusted_path = os.path.join(base_media_path, *path.split('/'))
         return adjusted_path
 
     @property
@@ -0,0 +1,232 @@
+"""
+Pruebas de rendimiento sin pantalla (Qt offscreen) de los visores:
+
+    python benchmark.py prueba.db
+    python benchmark.py prueba.db --repeticiones 5 --salida resultados.json
+    python benchmark.py prueba.db --comparar resultados_anterior.json
+
+Mide load_data (lectura desde cero), selección del chat más grande y
+filter_messages en app11.py, plot_star_diagram en call7.py y
+update_map_markers en loc4.py, varias veces cada uno. El resultado (mediana
+y mínimo en ms, tamaño de la base, commit de git) se guarda en JSON para
+comparar entre versiones; --comparar muestra la relación con otro JSON.
+
+Las bases de prueba se generan con synth_msgstore.py.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Sin ventana: debe fijarse antes de importar Qt
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REPEATS = 3
+# Espera máxima (s) a que loc4 cargue las ubicaciones y la página del mapa
+LOAD_TIMEOUT_S = 120
+SEARCH_TEXT = "hola"
+
+
+def measure(function, repeats, setup=None):
+    """Tiempos (ms) de `repeats` ejecuciones de function (setup no se mide)."""
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def summarize(times):
+    return {
+        'mediana_ms': round(statistics.median(times), 2),
+        'min_ms': round(min(times), 2),
+        'repeticiones': len(times),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def wait_until(app, condition, timeout_s=LOAD_TIMEOUT_S):
+    deadline = time.perf_counter() + timeout_s
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        app.processEvents()
+        time.sleep(0.01)
+    return True
+
+
+def bench_messages(app, db_path, repeats, results):
+    import app11
+    from case_data import get_case
+
+    viewer = None
+
+    def load():
+        nonlocal viewer
+        if viewer is not None:
+            viewer.deleteLater()
+        viewer = app11.WhatsAppViewer()
+
+    # Cada repetición lee la base desde cero (sin las tablas compartidas)
+    results['app11.load_data'] = summarize(measure(load, repeats, setup=get_case(db_path).release))
+
+    counts = viewer.df_messages['chat_jid'].value_counts()
+    row = int(viewer.all_conversations.index[viewer.all_conversations['chat_jid'] == counts.index[0]][0])
+    index = viewer.chat_model.index(row)
+    results['app11.select_chat'] = summarize(measure(lambda: viewer.select_chat(index), repeats))
+
+    def set_search(text):
+        viewer.message_search_input.blockSignals(True)
+        viewer.message_search_input.setText(text)
+        viewer.message_search_input.blockSignals(False)
+
+    results['app11.filter_messages'] = summarize(
+        measure(viewer.filter_messages, repeats, setup=lambda: set_search(SEARCH_TEXT)))
+    viewer.close()
+
+
+def bench_calls(app, repeats, results):
+    import call7
+
+    window = call7.CallsAnalyzer()
+    sizes = iter([10, 50] * repeats)
+
+    def plot():
+        # Alterna el top N para que cada paso agregue o quite rayos
+        window.plot_star_diagram(call7.MY_NUMBER, next(sizes), '', None)
+        window.finish_layout_animation()
+        window.canvas.draw()
+
+    results['call7.plot_star_diagram'] = summarize(measure(plot, repeats))
+    window.close()
+
+
+def bench_locations(app, repeats, results):
+    try:
+        import loc4
+    except ImportError as e:
+        results['loc4.update_map_markers'] = {'omitido': f"QtWebEngine no disponible: {e}"}
+        return
+
+    window = loc4.MainWindow()
+    if not wait_until(app, lambda: window.data_loaded and window.page_ready):
+        results['loc4.update_map_markers'] = {'omitido': "la carga no terminó a tiempo"}
+        window.close()
+        return
+    window.cluster_check.setChecked(False)
+    window.heatmap_check.setChecked(False)
+    window.number_list.blockSignals(True)
+    for i in range(window.number_list.count()):
+        window.number_list.item(i).setCheckState(loc4.Qt.Checked)
+    window.number_list.blockSignals(False)
+
+    # Todos los contactos desde un mapa vacío
+    results['loc4.update_map_markers'] = summarize(
+        measure(window.update_map_markers, repeats, setup=window.reset_map_markers))
+    window.close()
+
+
+def run(db_path, repeats):
+    from PyQt5.QtWidgets import QApplication
+    try:
+        # QtWebEngine debe importarse antes de crear la QApplication
+        from PyQt5 import QtWebEngineWidgets  # noqa: F401
+        from map_tiles import register_mbtiles_scheme
+        register_mbtiles_scheme()
+    except ImportError:
+        pass
+    from cases import CaseSource, save_registry
+    from msgstore import get_repository
+
+    db_path = os.path.abspath(db_path)
+    repository = get_repository(db_path)
+    info = {
+        'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'base': db_path,
+        'esquema': repository.version,
+        'tamaño': {entity: repository.count(entity) for entity in ('messages', 'calls', 'locations')},
+    }
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    results = {}
+    # Los visores abren la vista activa de casos.json: uno temporal con esta base
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            save_registry([CaseSource('benchmark', db_path)], 'benchmark')
+            for name, bench in (('mensajes', lambda: bench_messages(app, db_path, repeats, results)),
+                                ('llamadas', lambda: bench_calls(app, repeats, results)),
+                                ('ubicaciones', lambda: bench_locations(app, repeats, results))):
+                print(f"[benchmark] {name}...", flush=True)
+                try:
+                    bench()
+                except SystemExit:
+                    results[name] = {'omitido': "el visor no pudo abrir la base"}
+        finally:
+            os.chdir(previous_dir)
+    info['resultados'] = results
+    return info
+
+
+def compare(current, previous):
+    """Líneas con la relación actual / anterior de cada medición."""
+    lines = []
+    for name, result in current['resultados'].items():
+        before = previous.get('resultados', {}).get(name, {})
+        if 'mediana_ms' not in result or 'mediana_ms' not in before:
+            continue
+        ratio = result['mediana_ms'] / before['mediana_ms'] if before['mediana_ms'] else float('inf')
+        lines.append(f"{name:28s} {before['mediana_ms']:10.1f} -> {result['mediana_ms']:10.1f} ms  x{ratio:.2f}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el rendimiento de los visores sin pantalla.")
+    parser.add_argument('base', help="msgstore.db de prueba (ver synth_msgstore.py)")
+    parser.add_argument('--repeticiones', type=int, default=DEFAULT_REPEATS)
+    parser.add_argument('--salida', default='benchmark.json', help="Archivo JSON de resultados")
+    parser.add_argument('--comparar', metavar='JSON', help="Resultados anteriores para comparar")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, BASE_DIR)
+    info = run(args.base, max(1, args.repeticiones))
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2, ensure_ascii=False)
+
+    for name, result in info['resultados'].items():
+        if 'mediana_ms' in result:
+            print(f"{name:28s} {result['mediana_ms']:10.1f} ms (mín. {result['min_ms']:.1f})")
+        else:
+            print(f"{name:28s} omitido: {result['omitido']}")
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            previous = json.load(f)
+        print(f"\nComparación con {previous.get('commit') or args.comparar}:")
+        for line in compare(info, previous):
+            print(line)
+    print(f"Resultados en {args.salida}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
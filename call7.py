@@ -1,5 +1,5 @@
 import sys
-import sqlite3
+import argparse
 import pandas as pd
 import datetime
 import math
@@ -8,8 +8,18 @@ from PyQt5.QtWidgets import QFileDialog
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
+from call_stats import (CallStatsEngine, CallTimeIndex, classify_calls, local_datetimes, DIAS_SEMANA,
+                        export_call_details, EXPORT_CHUNK_SIZE, EXPORT_FORMATS)
+import memory_budget
+from cases import load_registry, open_case, case_choices, tables_memory
+
 DATABASE_PATH = 'msgstore.db'
 MY_NUMBER = 'mi_numero@c.us'  # Ajustar con su número propio
+WEEK_MS = 7 * 24 * 3600 * 1000
+UPDATE_DEBOUNCE_MS = 150
+LAYOUT_ANIMATION_MS = 250
+# Refresco de la barra de estado con el uso de memoria (ms)
+MEMORY_STATUS_INTERVAL_MS = 2000
 
 class PandasTableModel(QtCore.QAbstractTableModel):
     def __init__(self, df=pd.DataFrame(), parent=None):
@@ -86,14 +96,141 @@ class MplCanvas(FigureCanvas):
         FigureCanvas.updateGeometry(self)
 
 
+def format_duration(seconds):
+    return str(datetime.timedelta(seconds=int(round(seconds))))
+
+
+def format_ms(ts):
+    if ts is None:
+        return "-"
+    return datetime.datetime.fromtimestamp(ts / 1000).strftime('%d/%m/%Y %H:%M:%S')
+
+
+class CallStatsPanel(QtWidgets.QGroupBox):
+    """
+    Panel de estadísticas (globales o del contacto seleccionado) en un rango de
+    fechas. Los cálculos los hace CallStatsEngine, que guarda cada resultado por
+    (contacto, rango), así que cambiar de contacto o de rango no recalcula.
+    """
+
+    def __init__(self, engine, parent=None):
+        super().__init__("Estadísticas", parent)
+        self.engine = engine
+        self.contact_jid = None
+
+        layout = QtWidgets.QVBoxLayout(self)
+
+        self.contact_label = QtWidgets.QLabel()
+        self.contact_label.setWordWrap(True)
+        layout.addWidget(self.contact_label)
+
+        # Rango de fechas
+        first_date, last_date = self.engine_dates()
+
+        range_layout = QtWidgets.QHBoxLayout()
+        self.date_from = QtWidgets.QDateEdit(first_date)
+        self.date_from.setCalendarPopup(True)
+        self.date_to = QtWidgets.QDateEdit(last_date)
+        self.date_to.setCalendarPopup(True)
+        self.date_from.dateChanged.connect(self.refresh)
+        self.date_to.dateChanged.connect(self.refresh)
+        range_layout.addWidget(QtWidgets.QLabel("Desde:"))
+        range_layout.addWidget(self.date_from)
+        range_layout.addWidget(QtWidgets.QLabel("Hasta:"))
+        range_layout.addWidget(self.date_to)
+        layout.addLayout(range_layout)
+
+        form = QtWidgets.QFormLayout()
+        self.value_labels = {}
+        for key, title in [
+            ('total_llamadas', "Total llamadas:"),
+            ('salientes', "Salientes / Entrantes:"),
+            ('videollamadas', "Videollamadas:"),
+            ('contestadas', "Contestadas:"),
+            ('duracion_total', "Duración total:"),
+            ('duracion_promedio', "Duración promedio:"),
+            ('primer_contacto', "Primer contacto:"),
+            ('ultimo_contacto', "Último contacto:"),
+        ]:
+            lbl = QtWidgets.QLabel("-")
+            self.value_labels[key] = lbl
+            form.addRow(title, lbl)
+        layout.addLayout(form)
+
+        # Mapa de calor hora del día x día de la semana
+        self.heatmap_canvas = MplCanvas(self, width=4, height=2.2)
+        layout.addWidget(self.heatmap_canvas)
+
+        self.global_button = QtWidgets.QPushButton("Ver estadísticas globales")
+        self.global_button.clicked.connect(lambda: self.set_contact(None))
+        layout.addWidget(self.global_button)
+
+        self.refresh()
+
+    def engine_dates(self):
+        min_ts, max_ts = self.engine.time_range
+        first_date = QtCore.QDateTime.fromMSecsSinceEpoch(min_ts).date() if min_ts else QtCore.QDate.currentDate()
+        last_date = QtCore.QDateTime.fromMSecsSinceEpoch(max_ts).date() if max_ts else QtCore.QDate.currentDate()
+        return first_date, last_date
+
+    def set_engine(self, engine):
+        """Cambia de registro de llamadas (otro caso): rango completo y vista global."""
+        self.engine = engine
+        self.contact_jid = None
+        first_date, last_date = self.engine_dates()
+        for edit, date in ((self.date_from, first_date), (self.date_to, last_date)):
+            edit.blockSignals(True)
+            edit.setDate(date)
+            edit.blockSignals(False)
+        self.refresh()
+
+    def current_range(self):
+        from_date = self.date_from.date()
+        to_date = self.date_to.date()
+        from_ts = int(datetime.datetime(from_date.year(), from_date.month(), from_date.day(), 0, 0).timestamp() * 1000)
+        to_ts = int(datetime.datetime(to_date.year(), to_date.month(), to_date.day(), 23, 59, 59).timestamp() * 1000)
+        return from_ts, to_ts
+
+    def set_contact(self, contact_jid):
+        self.contact_jid = contact_jid
+        self.refresh()
+
+    def refresh(self):
+        start_ts, end_ts = self.current_range()
+        stats = self.engine.stats(self.contact_jid, start_ts, end_ts)
+
+        self.contact_label.setText(f"<b>{self.contact_jid}</b>" if self.contact_jid else "<b>Todos los contactos</b>")
+        self.value_labels['total_llamadas'].setText(str(stats['total_llamadas']))
+        self.value_labels['salientes'].setText(f"{stats['salientes']} / {stats['entrantes']}")
+        self.value_labels['videollamadas'].setText(str(stats['videollamadas']))
+        self.value_labels['contestadas'].setText(f"{stats['contestadas']} ({stats['tasa_respuesta']:.0%})")
+        self.value_labels['duracion_total'].setText(format_duration(stats['duracion_total']))
+        self.value_labels['duracion_promedio'].setText(format_duration(stats['duracion_promedio']))
+        self.value_labels['primer_contacto'].setText(format_ms(stats['primer_contacto']))
+        self.value_labels['ultimo_contacto'].setText(format_ms(stats['ultimo_contacto']))
+
+        ax = self.heatmap_canvas.ax
+        ax.clear()
+        ax.imshow(stats['mapa_calor'], aspect='auto', cmap='Reds', interpolation='nearest')
+        ax.set_yticks(range(7))
+        ax.set_yticklabels(DIAS_SEMANA, fontsize=7)
+        ax.set_xticks(range(0, 24, 3))
+        ax.set_xticklabels([f"{h}h" for h in range(0, 24, 3)], fontsize=7)
+        self.heatmap_canvas.figure.tight_layout()
+        self.heatmap_canvas.draw()
+
+
 class CallsAnalyzer(QtWidgets.QMainWindow):
-    def __init__(self):
+    def __init__(self, case_key=None):
         super().__init__()
         self.setWindowTitle("Gráfico Estrella: Mi línea al centro (Top N contactos con detalle, búsqueda y arrastre)")
         self.setGeometry(100, 100, 1000, 700)
 
-        self.df_calls = self.load_calls()
-        if self.df_calls is None or self.df_calls.empty:
+        # Teléfonos del caso (casos.json) y vista mostrada
+        self.sources, active = load_registry()
+        self.case_key = case_key or active
+
+        if not self.load_case():
             QtWidgets.QMessageBox.critical(self, "Error", "No se pudo cargar la tabla de llamadas. Verifique la BD.")
             sys.exit(1)
 
@@ -103,10 +240,21 @@ class CallsAnalyzer(QtWidgets.QMainWindow):
 
         # Barra de búsqueda
         search_layout = QtWidgets.QHBoxLayout()
+        # Selector de teléfono (solo si el caso tiene más de uno)
+        lbl_case = QtWidgets.QLabel("Caso:")
+        self.case_combo = QtWidgets.QComboBox()
+        for key, label in case_choices(self.sources):
+            self.case_combo.addItem(label, key)
+        self.case_combo.setCurrentIndex(max(self.case_combo.findData(self.case_key), 0))
+        self.case_combo.currentIndexChanged.connect(self.switch_case)
+        lbl_case.setVisible(len(self.sources) > 1)
+        self.case_combo.setVisible(len(self.sources) > 1)
+        search_layout.addWidget(lbl_case)
+        search_layout.addWidget(self.case_combo)
         lbl_search = QtWidgets.QLabel("Buscar contacto:")
         self.search_input = QtWidgets.QLineEdit()
         self.search_input.setPlaceholderText("Escriba parte del número/contacto...")
-        self.search_input.textChanged.connect(self.update_plot)
+        self.search_input.textChanged.connect(self.schedule_update)
         search_layout.addWidget(lbl_search)
         search_layout.addWidget(self.search_input)
 
@@ -116,15 +264,41 @@ class CallsAnalyzer(QtWidgets.QMainWindow):
         self.spin_top = QtWidgets.QSpinBox()
         self.spin_top.setRange(1, 1000)
         self.spin_top.setValue(10)  # Por defecto, top 10
-        self.spin_top.valueChanged.connect(self.update_plot)
+        self.spin_top.valueChanged.connect(self.schedule_update)
         controls_layout.addWidget(lbl_top)
         controls_layout.addWidget(self.spin_top)
 
+        # Ventana de tiempo (semanas) para recorrer la evolución de los contactos
+        window_layout = QtWidgets.QHBoxLayout()
+        self.window_check = QtWidgets.QCheckBox("Ventana de tiempo")
+        self.window_check.toggled.connect(self.update_plot)
+        self.window_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.window_slider.setRange(0, self.total_weeks() - 1)
+        self.window_slider.valueChanged.connect(self.update_plot)
+        lbl_weeks = QtWidgets.QLabel("Semanas:")
+        self.spin_weeks = QtWidgets.QSpinBox()
+        self.spin_weeks.setRange(1, 520)
+        self.spin_weeks.setValue(4)
+        self.spin_weeks.valueChanged.connect(self.schedule_update)
+        self.window_label = QtWidgets.QLabel()
+        window_layout.addWidget(self.window_check)
+        window_layout.addWidget(self.window_slider, 1)
+        window_layout.addWidget(lbl_weeks)
+        window_layout.addWidget(self.spin_weeks)
+        window_layout.addWidget(self.window_label)
+
         main_layout.addLayout(search_layout)
         main_layout.addLayout(controls_layout)
+        main_layout.addLayout(window_layout)
 
+        content_layout = QtWidgets.QHBoxLayout()
         self.canvas = MplCanvas(self, width=5, height=4)
-        main_layout.addWidget(self.canvas)
+        content_layout.addWidget(self.canvas, 3)
+
+        # Panel de estadísticas (global o del contacto seleccionado)
+        self.stats_panel = CallStatsPanel(self.stats_engine)
+        content_layout.addWidget(self.stats_panel, 1)
+        main_layout.addLayout(content_layout)
 
         # Diccionario/Lista para mapear objetos asociados a cada contacto
         self.contact_objects = []
@@ -132,6 +306,23 @@ class CallsAnalyzer(QtWidgets.QMainWindow):
         self.last_picked_line = None
         self.dragged_contact = None
         self.dragging = False
+        self.center_artists = None
+        self.empty_text = None
+        self.current_radius = None
+
+        # Las búsquedas y cambios de top N se agrupan antes de redibujar
+        self.update_timer = QtCore.QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(UPDATE_DEBOUNCE_MS)
+        self.update_timer.timeout.connect(self.update_plot)
+
+        # Animación de recolocación de los rayos
+        self.anim_timer = QtCore.QTimer(self)
+        self.anim_timer.setInterval(30)
+        self.anim_timer.timeout.connect(self.animate_layout_step)
+        self.anim_clock = QtCore.QElapsedTimer()
+        self.anim_start = []
+        self.anim_targets = []
 
         # Eventos de interacción
         self.canvas.mpl_connect('pick_event', self.pick_event_callback)
@@ -139,123 +330,219 @@ class CallsAnalyzer(QtWidgets.QMainWindow):
         self.canvas.mpl_connect('motion_notify_event', self.on_motion)
         self.canvas.mpl_connect('button_release_event', self.on_release)
 
+        # Uso de memoria de las tablas compartidas (y el límite, si hay)
+        self.memory_label = QtWidgets.QLabel()
+        self.statusBar().addPermanentWidget(self.memory_label)
+        self.memory_timer = QtCore.QTimer(self)
+        self.memory_timer.setInterval(MEMORY_STATUS_INTERVAL_MS)
+        self.memory_timer.timeout.connect(self.update_memory_status)
+        self.memory_timer.start()
+        self.update_memory_status()
+
         self.update_plot()
 
+    def update_memory_status(self):
+        self.memory_label.setText(memory_budget.format_usage(tables_memory()))
+        self.memory_label.setStyleSheet("color: #B00020;" if memory_budget.over_budget() else "")
+
     def load_calls(self):
+        # Registro de llamadas compartido con los demás visores (case_data)
         try:
-            conn = sqlite3.connect(DATABASE_PATH)
-            query = """
-            SELECT
-                call_log._id,
-                call_log.jid_row_id,
-                call_log.from_me,
-                call_log.call_id,
-                call_log.timestamp,
-                call_log.duration,
-                call_log.video_call,
-                call_log.call_result,
-                call_log.call_type,
-                jid.raw_string AS caller_jid
-            FROM call_log
-            LEFT JOIN jid ON call_log.jid_row_id = jid._id
-            """
-            df_calls = pd.read_sql_query(query, conn)
-            conn.close()
-            df_calls['timestamp'] = pd.to_numeric(df_calls['timestamp'], errors='coerce')
-            return df_calls
+            return open_case(self.case_key, self.sources).calls()
         except Exception as e:
             print("Error:", e)
             return pd.DataFrame()
 
-    def update_plot(self):
-        search_text = self.search_input.text().strip().lower()
-        top_n = self.spin_top.value()
-        self.plot_star_diagram(MY_NUMBER, top_n, search_text)
-
-    def convert_timestamp_to_datetime(self, ts):
-        if pd.notnull(ts) and ts > 0:
-            try:
-                return datetime.datetime.fromtimestamp(ts/1000)
-            except:
-                return None
-        return None
+    def load_case(self):
+        """Llamadas, motor de estadísticas e índice temporal de la vista (False si no hay llamadas)."""
+        df_calls = self.load_calls()
+        if df_calls is None or df_calls.empty:
+            return False
+        self.df_calls = df_calls
+        # Motor de estadísticas e índice temporal: también compartidos
+        case = open_case(self.case_key, self.sources)
+        self.stats_engine = case.table('call_stats', lambda _: CallStatsEngine(df_calls))
+        self.call_index = case.table('call_index', lambda _: CallTimeIndex(df_calls))
+        return True
+
+    def switch_case(self, combo_index):
+        case_key = self.case_combo.itemData(combo_index)
+        if case_key == self.case_key:
+            return
+        previous = self.case_key
+        self.case_key = case_key
+        if not self.load_case():
+            QtWidgets.QMessageBox.warning(self, "Error", "No se pudo cargar la tabla de llamadas de ese caso.")
+            self.case_key = previous
+            self.case_combo.blockSignals(True)
+            self.case_combo.setCurrentIndex(self.case_combo.findData(previous))
+            self.case_combo.blockSignals(False)
+            return
 
-    def plot_star_diagram(self, my_number, top_n, search_text):
-        self.canvas.ax.clear()
-        self.line_data_map.clear()
+        self.stats_panel.set_engine(self.stats_engine)
+        self.window_slider.setRange(0, self.total_weeks() - 1)
         self.last_picked_line = None
         self.dragged_contact = None
-        self.contact_objects = []
+        self.update_plot()
+
+    def total_weeks(self):
+        if self.call_index.min_ts is None:
+            return 1
+        return (self.call_index.max_ts - self.call_index.min_ts) // WEEK_MS + 1
+
+    def current_time_window(self):
+        """(inicio, fin) en ms de la ventana activa, o None si está desactivada."""
+        enabled = self.window_check.isChecked() and self.call_index.min_ts is not None
+        self.window_slider.setEnabled(enabled)
+        self.spin_weeks.setEnabled(enabled)
+        if not enabled:
+            self.window_label.setText("")
+            return None
+        start_ts = self.call_index.min_ts + self.window_slider.value() * WEEK_MS
+        end_ts = start_ts + self.spin_weeks.value() * WEEK_MS - 1
+        self.window_label.setText(f"{format_ms(start_ts)[:10]} - {format_ms(end_ts)[:10]}")
+        return start_ts, end_ts
 
-        df_agrup = self.df_calls.groupby('caller_jid').size().reset_index(name='total_llamadas')
-        df_agrup = df_agrup[df_agrup['caller_jid'] != my_number]
+    def schedule_update(self):
+        self.update_timer.start()
 
-        # Filtro por search_text
-        if search_text:
-            df_agrup = df_agrup[df_agrup['caller_jid'].str.contains(search_text, case=False, na=False)]
+    def update_plot(self):
+        self.update_timer.stop()
+        search_text = self.search_input.text().strip().lower()
+        top_n = self.spin_top.value()
+        self.plot_star_diagram(MY_NUMBER, top_n, search_text, self.current_time_window())
+
+    def plot_star_diagram(self, my_number, top_n, search_text, time_window=None):
+        """
+        Actualiza el diagrama de forma incremental: solo se crean o eliminan los
+        rayos de los contactos que entran o salen del top N; los que se mantienen
+        conservan sus artistas y se recolocan con una animación corta.
+        """
+        self.finish_layout_animation()
+        ax = self.canvas.ax
+        if self.center_artists is None:
+            ax.clear()
+            ax.set_aspect('equal')
+            ax.axis('off')
+            self.center_artists = [
+                ax.plot(0, 0, 'o', color='black')[0],
+                ax.text(0, 0, my_number, ha='center', va='center', fontsize=10, fontweight='bold'),
+            ]
+
+        # Conteo por contacto desde el índice temporal (sin groupby por cada cambio)
+        start_ts, end_ts = time_window if time_window else (None, None)
+        df_agrup = self.call_index.ranking(top_n, start_ts, end_ts, exclude=my_number, search_text=search_text)
+
+        new_contacts = dict(zip(df_agrup['caller_jid'], df_agrup['total_llamadas']))
+        for obj in list(self.contact_objects):
+            if obj['contact_jid'] not in new_contacts:
+                self.remove_contact_artists(obj)
 
         if df_agrup.empty:
-            self.canvas.ax.text(0.5,0.5,"No se han encontrado contactos con ese criterio.", 
-                                ha='center', va='center')
-            self.canvas.draw()
+            self.contact_objects = []
+            if self.empty_text is None:
+                self.empty_text = ax.text(0.5, 0.5, "No se han encontrado contactos con ese criterio.",
+                                          ha='center', va='center', transform=ax.transAxes)
+            for artist in self.center_artists:
+                artist.set_visible(False)
+            self.canvas.draw_idle()
             return
 
-        # Ordenar por total_llamadas y tomar top N
-        df_agrup = df_agrup.sort_values('total_llamadas', ascending=False).head(top_n)
-
-        num_contacts = len(df_agrup)
+        if self.empty_text is not None:
+            self.empty_text.remove()
+            self.empty_text = None
+        for artist in self.center_artists:
+            artist.set_visible(True)
+
+        by_jid = {obj['contact_jid']: obj for obj in self.contact_objects}
+        objects = []
+        for contact_jid, total_calls in new_contacts.items():
+            obj = by_jid.get(contact_jid)
+            if obj is None:
+                obj = self.create_contact_artists(contact_jid, total_calls)
+            elif obj['total_calls'] != total_calls:
+                obj['total_calls'] = total_calls
+                obj['calls_text'].set_text(str(total_calls))
+            objects.append(obj)
+        self.contact_objects = objects
+
+        num_contacts = len(objects)
         radius = 5 + num_contacts * 0.2
         angle_step = 2*math.pi / num_contacts
-        center_x, center_y = 0,0
-
-        # Centro (mi línea)
-        self.canvas.ax.plot(center_x, center_y, 'o', color='black')
-        self.canvas.ax.text(center_x, center_y, my_number, ha='center', va='center', fontsize=10, fontweight='bold')
-
-        i = 0
-        for _, row in df_agrup.iterrows():
-            contact_jid = row['caller_jid']
-            total_calls = row['total_llamadas']
-            angle = i * angle_step
-            oc_x = center_x + radius*math.cos(angle)
-            oc_y = center_y + radius*math.sin(angle)
-
-            # Crear la línea con picker=False para la línea, porque arrastramos el contacto (texto)
-            # La detección del arrastre será sobre el texto, no la línea.
-            line = self.canvas.ax.plot([center_x, oc_x],[center_y, oc_y], color='blue', linestyle='-')[0]
-
-            # Texto del contacto (con picker=True para arrastrar)
-            contact_text = self.canvas.ax.text(oc_x, oc_y, contact_jid, ha='center', va='center', fontsize=9, color='blue', picker=True)
-            mid_x = (center_x+oc_x)/2
-            mid_y = (center_y+oc_y)/2
-            calls_text = self.canvas.ax.text(mid_x, mid_y, str(total_calls), ha='center', va='center', fontsize=9, color='red')
-
-            # Preparar detalle de las llamadas para este contacto
-            df_detail = self.get_detail_df_for_contact(contact_jid)
-            self.line_data_map[line] = df_detail
-
-            obj = {
-                'contact_jid': contact_jid,
-                'line': line,
-                'contact_text': contact_text,
-                'calls_text': calls_text,
-                'center_x': center_x,
-                'center_y': center_y,
-                'oc_x': oc_x,
-                'oc_y': oc_y,
-                'mid_x': mid_x,
-                'mid_y': mid_y,
-                'total_calls': total_calls,
-                'df_detail': df_detail
-            }
-            self.contact_objects.append(obj)
-            i += 1
+        targets = [(radius*math.cos(i*angle_step), radius*math.sin(i*angle_step)) for i in range(num_contacts)]
+        self.start_layout_animation(targets, radius)
+
+    def create_contact_artists(self, contact_jid, total_calls):
+        # Los rayos nuevos nacen en el centro y la animación los lleva a su sitio.
+        # La detección del arrastre es sobre el texto (picker=True), no sobre la línea.
+        ax = self.canvas.ax
+        line = ax.plot([0, 0], [0, 0], color='blue', linestyle='-')[0]
+        contact_text = ax.text(0, 0, contact_jid, ha='center', va='center', fontsize=9, color='blue', picker=True)
+        calls_text = ax.text(0, 0, str(total_calls), ha='center', va='center', fontsize=9, color='red')
+        return {
+            'contact_jid': contact_jid,
+            'line': line,
+            'contact_text': contact_text,
+            'calls_text': calls_text,
+            'center_x': 0,
+            'center_y': 0,
+            'oc_x': 0,
+            'oc_y': 0,
+            'mid_x': 0,
+            'mid_y': 0,
+            'total_calls': total_calls,
+            # El detalle se calcula al abrirlo (doble clic), no al dibujar
+            'df_detail': None
+        }
+
+    def remove_contact_artists(self, obj):
+        for key in ('line', 'contact_text', 'calls_text'):
+            obj[key].remove()
+        self.line_data_map.pop(obj['line'], None)
+        if self.dragged_contact is obj:
+            self.dragged_contact = None
+            self.dragging = False
 
+    def move_contact(self, obj, x, y):
+        cx, cy = obj['center_x'], obj['center_y']
+        mid_x = (cx + x)/2
+        mid_y = (cy + y)/2
+        obj['oc_x'], obj['oc_y'] = x, y
+        obj['mid_x'], obj['mid_y'] = mid_x, mid_y
+        obj['contact_text'].set_position((x, y))
+        obj['calls_text'].set_position((mid_x, mid_y))
+        obj['line'].set_data([cx, x], [cy, y])
+
+    def start_layout_animation(self, targets, radius):
+        self.anim_start = [(obj['oc_x'], obj['oc_y']) for obj in self.contact_objects]
+        self.anim_targets = targets
+        self.anim_start_radius = self.current_radius if self.current_radius is not None else radius
+        self.anim_radius = radius
+        self.anim_clock.start()
+        self.anim_timer.start()
+        self.animate_layout_step()
+
+    def animate_layout_step(self):
+        t = min(self.anim_clock.elapsed() / LAYOUT_ANIMATION_MS, 1.0)
+        eased = 1 - (1 - t)**3
+        for obj, (x0, y0), (x1, y1) in zip(self.contact_objects, self.anim_start, self.anim_targets):
+            self.move_contact(obj, x0 + (x1 - x0)*eased, y0 + (y1 - y0)*eased)
+        radius = self.anim_start_radius + (self.anim_radius - self.anim_start_radius)*eased
+        self.current_radius = radius
         self.canvas.ax.set_xlim(-radius-2, radius+2)
         self.canvas.ax.set_ylim(-radius-2, radius+2)
-        self.canvas.ax.set_aspect('equal')
-        self.canvas.ax.axis('off')
-        self.canvas.draw()
+        self.canvas.draw_idle()
+        if t >= 1.0:
+            self.anim_timer.stop()
+
+    def finish_layout_animation(self):
+        if self.anim_timer.isActive():
+            self.anim_timer.stop()
+            for obj, (x1, y1) in zip(self.contact_objects, self.anim_targets):
+                self.move_contact(obj, x1, y1)
+            self.current_radius = self.anim_radius
+            self.canvas.ax.set_xlim(-self.anim_radius-2, self.anim_radius+2)
+            self.canvas.ax.set_ylim(-self.anim_radius-2, self.anim_radius+2)
 
     def get_detail_df_for_contact(self, contact_jid):
         # Filtrar llamadas con este contacto
@@ -263,7 +550,7 @@ class CallsAnalyzer(QtWidgets.QMainWindow):
         if df_contact.empty:
             return pd.DataFrame()
 
-        df_contact['datetime'] = df_contact['timestamp'].apply(self.convert_timestamp_to_datetime)
+        df_contact['datetime'] = local_datetimes(df_contact['timestamp'])
         df_contact['fecha'] = df_contact['datetime'].dt.date
         df_contact['hora'] = df_contact['datetime'].dt.time
 
@@ -272,20 +559,7 @@ class CallsAnalyzer(QtWidgets.QMainWindow):
         # from_me=0 => Entrante
         # call_result=5 => Contestada
         # call_result en [0,1,2,3,4] => No contestada (Perdida)
-
-        def tipo_llamada(row):
-            if row['from_me'] == 1:
-                if row['call_result'] == 5:
-                    return "Saliente Contestada"
-                else:
-                    return "Saliente No Contestada"
-            else:
-                if row['call_result'] == 5:
-                    return "Entrante Contestada"
-                else:
-                    return "Entrante Perdida"
-
-        df_contact['tipo_llamada'] = df_contact.apply(tipo_llamada, axis=1)
+        df_contact['tipo_llamada'] = classify_calls(df_contact)
 
         df_detail = df_contact[['fecha','hora','tipo_llamada','duration']]
         return df_detail
@@ -295,12 +569,14 @@ class CallsAnalyzer(QtWidgets.QMainWindow):
         artist = event.artist
         for obj in self.contact_objects:
             if obj['contact_text'] == artist:
-                # Iniciar arrastre
+                # Iniciar arrastre (desde la posición final de la animación)
+                self.finish_layout_animation()
                 self.dragging = True
                 self.dragged_contact = obj
                 mouse_x, mouse_y = event.mouseevent.xdata, event.mouseevent.ydata
                 self.drag_start_pos = (obj['oc_x'], obj['oc_y'])
                 self.drag_offset = (mouse_x, mouse_y)
+                self.stats_panel.set_contact(obj['contact_jid'])
                 break
 
     def on_plot_click(self, event):
@@ -328,8 +604,12 @@ class CallsAnalyzer(QtWidgets.QMainWindow):
         # Pickeamos el texto. Guardaremos last_picked_contact en pick_event para doble clic.
 
         if event.dblclick and self.dragged_contact is not None:
-            # Mostrar detalle del contacto actual
+            # Mostrar detalle del contacto actual (se calcula la primera vez)
             df_detail = self.dragged_contact['df_detail']
+            if df_detail is None:
+                df_detail = self.get_detail_df_for_contact(self.dragged_contact['contact_jid'])
+                self.dragged_contact['df_detail'] = df_detail
+                self.line_data_map[self.dragged_contact['line']] = df_detail
             if df_detail is not None and not df_detail.empty:
                 dlg = CallDetailDialog(df_detail)
                 dlg.exec_()
@@ -366,7 +646,31 @@ class CallsAnalyzer(QtWidgets.QMainWindow):
             self.dragged_contact = None
 
 
+def export_main(argv):
+    """
+    Exportación sin interfaz gráfica del detalle de todas las llamadas:
+        python call7.py --exportar llamadas.csv
+        python call7.py --exportar salida/ --formato parquet --por-contacto
+    """
+    parser = argparse.ArgumentParser(description="Exporta el detalle clasificado de todas las llamadas.")
+    parser.add_argument('--exportar', required=True, metavar='SALIDA',
+                        help="Archivo de salida (o directorio con --por-contacto)")
+    parser.add_argument('--formato', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--por-contacto', action='store_true', help="Un archivo por contacto")
+    parser.add_argument('--db', default=DATABASE_PATH, help="Ruta de msgstore.db")
+    parser.add_argument('--bloque', type=int, default=EXPORT_CHUNK_SIZE, help="Filas leídas por bloque")
+    args = parser.parse_args(argv)
+
+    rows, files = export_call_details(args.db, args.exportar, args.formato, args.por_contacto, args.bloque)
+    print(f"{rows} llamadas exportadas en {files} archivo(s): {args.exportar}")
+    return 0
+
+
 if __name__ == '__main__':
+    # También la forma --exportar=SALIDA, que argparse acepta
+    if any(arg == '--exportar' or arg.startswith('--exportar=') for arg in sys.argv[1:]):
+        sys.exit(export_main(sys.argv[1:]))
+
     app = QtWidgets.QApplication(sys.argv)
     window = CallsAnalyzer()
     window.show()
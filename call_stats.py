@@ -0,0 +1,450 @@
+import datetime
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import perftrace
+from memory_budget import LruCache
+from msgstore import get_repository
+
+# call_result == 5 => Contestada; cualquier otro valor => No contestada / Perdida
+CALL_RESULT_CONTESTADA = 5
+
+TIPOS_LLAMADA = [
+    "Saliente Contestada",
+    "Saliente No Contestada",
+    "Entrante Contestada",
+    "Entrante Perdida",
+]
+
+DIAS_SEMANA = ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom']
+
+STATS_CACHE_SIZE = 256
+
+
+def _utc_offset_ms(seconds):
+    """Desfase (ms) de la hora local respecto a UTC en un instante dado."""
+    try:
+        local = datetime.datetime.fromtimestamp(seconds)
+        utc = datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).replace(tzinfo=None)
+        return int((local - utc).total_seconds() * 1000)
+    except (OverflowError, OSError, ValueError):
+        return 0
+
+
+def local_datetimes(timestamps):
+    """
+    Convierte timestamps (milisegundos) a datetime local de forma vectorizada.
+    Equivale a datetime.fromtimestamp(ts/1000) fila por fila, pero solo calcula
+    el desfase horario una vez por hora distinta. Valores nulos o <= 0 => NaT.
+    """
+    ts = pd.to_numeric(pd.Series(timestamps), errors='coerce')
+    valid = ts.notna() & (ts > 0)
+    ms = ts[valid].astype('int64').to_numpy()
+    if len(ms) == 0:
+        return pd.Series(pd.NaT, index=ts.index, dtype='datetime64[ns]')
+    uniq_hours, inverse = np.unique(ms // 3_600_000, return_inverse=True)
+    offsets = np.array([_utc_offset_ms(int(h) * 3600) for h in uniq_hours], dtype='int64')
+    local = pd.Series(pd.to_datetime(ms + offsets[inverse], unit='ms'), index=ts.index[valid])
+    return local.reindex(ts.index)
+
+
+@perftrace.traced('pandas', 'call_stats.classify_calls')
+def classify_calls(df_calls):
+    """
+    Clasificación vectorizada de las llamadas (misma lógica que tipo_llamada):
+    from_me=1 => Saliente, from_me=0 => Entrante,
+    call_result=5 => Contestada, otro valor => No contestada (Perdida).
+    """
+    saliente = (df_calls['from_me'] == 1).to_numpy()
+    contestada = (df_calls['call_result'] == CALL_RESULT_CONTESTADA).to_numpy()
+    tipos = np.select(
+        [saliente & contestada, saliente, contestada],
+        TIPOS_LLAMADA[:3],
+        default=TIPOS_LLAMADA[3],
+    )
+    return pd.Series(tipos, index=df_calls.index)
+
+
+class CallStatsEngine:
+    """
+    Estadísticas de llamadas globales y por contacto sobre df_calls.
+
+    Las columnas derivadas (fecha local, día de la semana, hora, contestada)
+    se calculan una sola vez; cada consulta es un filtro por máscara más
+    bincount/groupby, y el resultado se guarda por (contacto, inicio, fin).
+    """
+
+    @perftrace.traced('pandas', 'CallStatsEngine')
+    def __init__(self, df_calls, cache_size=STATS_CACHE_SIZE):
+        self._cache = LruCache(max_items=cache_size)
+
+        # Se cuentan todas las llamadas; las que no tienen timestamp válido
+        # (nulo o <= 0) solo quedan fuera de los filtros por fecha y del mapa de calor
+        ts = pd.to_numeric(df_calls['timestamp'], errors='coerce')
+        self._has_ts = (ts.notna() & (ts > 0)).to_numpy()
+
+        self.contacts, self._codes = self._factorize(df_calls['caller_jid'])
+        self._ts = ts.where(self._has_ts, 0).astype('int64').to_numpy()
+        self._duration = pd.to_numeric(df_calls['duration'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+        self._answered = (df_calls['call_result'] == CALL_RESULT_CONTESTADA).to_numpy()
+        self._outgoing = (df_calls['from_me'] == 1).to_numpy()
+        self._video = (pd.to_numeric(df_calls['video_call'], errors='coerce').fillna(0) == 1).to_numpy()
+
+        local = local_datetimes(self._ts)
+        self._weekday = local.dt.weekday.fillna(-1).to_numpy(dtype='int64')
+        self._hour = local.dt.hour.fillna(-1).to_numpy(dtype='int64')
+        self._contact_index = {jid: i for i, jid in enumerate(self.contacts)}
+
+    @staticmethod
+    def _factorize(caller_jid):
+        codes, uniques = pd.factorize(caller_jid.fillna(''))
+        return list(uniques), codes
+
+    @property
+    def time_range(self):
+        """(min_ts, max_ts) en milisegundos, o (None, None) si no hay llamadas."""
+        ts = self._ts[self._has_ts]
+        if len(ts) == 0:
+            return None, None
+        return int(ts.min()), int(ts.max())
+
+    def _mask(self, contact_jid, start_ts, end_ts):
+        mask = np.ones(len(self._ts), dtype=bool)
+        if contact_jid is not None:
+            code = self._contact_index.get(contact_jid)
+            if code is None:
+                return np.zeros(len(self._ts), dtype=bool)
+            mask &= self._codes == code
+        if start_ts is not None or end_ts is not None:
+            mask &= self._has_ts
+        if start_ts is not None:
+            mask &= self._ts >= start_ts
+        if end_ts is not None:
+            mask &= self._ts <= end_ts
+        return mask
+
+    def stats(self, contact_jid=None, start_ts=None, end_ts=None):
+        """
+        Estadísticas de un contacto (o globales si contact_jid es None) en el
+        rango [start_ts, end_ts] en milisegundos. El resultado es un dict.
+        """
+        key = ('stats', contact_jid, start_ts, end_ts)
+        return self._cache.get_or_compute(key, lambda: self._compute_stats(contact_jid, start_ts, end_ts))
+
+    @perftrace.traced('filtro', 'CallStatsEngine.stats')
+    def _compute_stats(self, contact_jid, start_ts, end_ts):
+        mask = self._mask(contact_jid, start_ts, end_ts)
+        total = int(mask.sum())
+        answered = int(self._answered[mask].sum())
+        total_duration = float(self._duration[mask].sum())
+
+        timed = mask & self._has_ts
+        slots = self._weekday[timed] * 24 + self._hour[timed]
+        heatmap = np.bincount(slots, minlength=7 * 24).reshape(7, 24)
+
+        ts = self._ts[timed]
+        first_ts = int(ts.min()) if len(ts) else None
+        last_ts = int(ts.max()) if len(ts) else None
+
+        return {
+            'contacto': contact_jid,
+            'total_llamadas': total,
+            'salientes': int(self._outgoing[mask].sum()),
+            'entrantes': total - int(self._outgoing[mask].sum()),
+            'videollamadas': int(self._video[mask].sum()),
+            'contestadas': answered,
+            'tasa_respuesta': answered / total if total else 0.0,
+            'duracion_total': total_duration,
+            # Promedio sobre las llamadas contestadas (las demás duran 0)
+            'duracion_promedio': total_duration / answered if answered else 0.0,
+            'primer_contacto': first_ts,
+            'ultimo_contacto': last_ts,
+            'mapa_calor': heatmap,
+        }
+
+    def contacts_table(self, start_ts=None, end_ts=None):
+        """Tabla por contacto (un groupby vectorizado) para el rango dado."""
+        key = ('tabla', None, start_ts, end_ts)
+        return self._cache.get_or_compute(key, lambda: self._compute_contacts_table(start_ts, end_ts))
+
+    @perftrace.traced('filtro', 'CallStatsEngine.contacts_table')
+    def _compute_contacts_table(self, start_ts, end_ts):
+        mask = self._mask(None, start_ts, end_ts)
+        codes = self._codes[mask]
+        n = len(self.contacts)
+        total = np.bincount(codes, minlength=n)
+        answered = np.bincount(codes, weights=self._answered[mask], minlength=n)
+        duration = np.bincount(codes, weights=self._duration[mask], minlength=n)
+
+        timed = mask & self._has_ts
+        first_ts = np.full(n, np.iinfo('int64').max, dtype='int64')
+        last_ts = np.full(n, np.iinfo('int64').min, dtype='int64')
+        np.minimum.at(first_ts, self._codes[timed], self._ts[timed])
+        np.maximum.at(last_ts, self._codes[timed], self._ts[timed])
+        has_time = np.bincount(self._codes[timed], minlength=n) > 0
+
+        table = pd.DataFrame({
+            'caller_jid': self.contacts,
+            'total_llamadas': total,
+            'contestadas': answered.astype('int64'),
+            'duracion_total': duration,
+            # Nulo si el contacto no tiene ninguna llamada con fecha
+            'primer_contacto': pd.Series(first_ts, dtype='Int64').where(has_time),
+            'ultimo_contacto': pd.Series(last_ts, dtype='Int64').where(has_time),
+        })
+        table = table[table['total_llamadas'] > 0].copy()
+        table['tasa_respuesta'] = table['contestadas'] / table['total_llamadas']
+        table['duracion_promedio'] = (table['duracion_total'] / table['contestadas'].where(table['contestadas'] > 0)).fillna(0.0)
+        return table.sort_values('total_llamadas', ascending=False).reset_index(drop=True)
+
+    def clear_cache(self):
+        self._cache.clear()
+
+
+def compute_call_stats(db_path=None, contact_jid=None, start_ts=None, end_ts=None):
+    """
+    Atajo sin GUI: estadísticas de un contacto (o globales) de un msgstore.db.
+    Usa el motor compartido del caso (la misma tabla 'call_stats' que
+    call7.py), así que solo se calcula desde cero la primera vez.
+    """
+    from case_data import DATABASE_PATH, get_case
+    case = get_case(db_path or DATABASE_PATH)
+    engine = case.table('call_stats', lambda _: CallStatsEngine(case.calls()))
+    return engine.stats(contact_jid, start_ts, end_ts)
+
+
+class CallTimeIndex:
+    """
+    Conteo de llamadas por contacto en cualquier ventana de tiempo.
+
+    Las llamadas se ordenan por (contacto, timestamp) en un único arreglo de
+    claves. Dentro del bloque de cada contacto, la posición de un timestamp es
+    la cuenta acumulada de llamadas hasta ese instante (suma prefija), así que
+    el total de una ventana [inicio, fin] son dos searchsorted por contacto:
+    O(contactos · log llamadas), sin volver a agrupar df_calls.
+    """
+
+    @perftrace.traced('pandas', 'CallTimeIndex')
+    def __init__(self, df_calls):
+        codes, uniques = pd.factorize(df_calls['caller_jid'])
+        known = codes >= 0  # groupby('caller_jid') descarta los jid nulos
+        self.contacts = np.asarray(uniques, dtype=object)
+        self._codes_all = np.arange(len(self.contacts), dtype='int64')
+        # Total histórico (incluye llamadas sin timestamp válido, como el groupby original)
+        self.total_counts = np.bincount(codes[known], minlength=len(self.contacts))
+
+        ts = pd.to_numeric(df_calls['timestamp'], errors='coerce').to_numpy(dtype='float64')
+        valid = known & ~np.isnan(ts) & (ts > 0)
+        ts = ts[valid].astype('int64')
+        codes = codes[valid].astype('int64')
+
+        if len(ts):
+            self.min_ts, self.max_ts = int(ts.min()), int(ts.max())
+        else:
+            self.min_ts = self.max_ts = None
+        base = self.min_ts or 0
+        self._base = base
+        self._span = (self.max_ts - base + 1) if len(ts) else 1
+        self._keys = np.sort(codes * self._span + (ts - base))
+
+        self._contacts_lower = pd.Series(self.contacts).str.lower()
+
+    def counts(self, start_ts=None, end_ts=None):
+        """Llamadas por contacto (alineado con self.contacts) en [start_ts, end_ts]."""
+        if start_ts is None and end_ts is None:
+            return self.total_counts
+        if self.min_ts is None:
+            return np.zeros(len(self.contacts), dtype='int64')
+        start = 0 if start_ts is None else min(max(start_ts - self._base, 0), self._span)
+        end = self._span - 1 if end_ts is None else min(max(end_ts - self._base, -1), self._span - 1)
+        offsets = self._codes_all * self._span
+        lo = np.searchsorted(self._keys, offsets + start, side='left')
+        hi = np.searchsorted(self._keys, offsets + end, side='right')
+        return np.maximum(hi - lo, 0)
+
+    @perftrace.traced('filtro')
+    def ranking(self, top_n, start_ts=None, end_ts=None, exclude=None, search_text=''):
+        """DataFrame caller_jid/total_llamadas con los top_n contactos de la ventana."""
+        counts = self.counts(start_ts, end_ts)
+        keep = counts > 0
+        if exclude is not None:
+            keep &= self.contacts != exclude
+        if search_text:
+            keep &= self._contacts_lower.str.contains(search_text.lower(), regex=False, na=False).to_numpy()
+        idx = np.flatnonzero(keep)
+        order = idx[np.argsort(-counts[idx], kind='stable')][:top_n]
+        return pd.DataFrame({
+            'caller_jid': self.contacts[order],
+            'total_llamadas': counts[order],
+        })
+
+
+# Columnas de call_log (msgstore.py) que usa la exportación
+CALL_DETAIL_COLUMNS = ['caller_jid', 'from_me', 'timestamp', 'duration', 'video_call', 'call_result']
+
+EXPORT_COLUMNS = ['caller_jid', 'fecha', 'hora', 'tipo_llamada', 'duration', 'video_call']
+EXPORT_CHUNK_SIZE = 50000
+EXPORT_FORMATS = ('csv', 'json', 'parquet')
+# Tipos Parquet del detalle exportado
+EXPORT_PARQUET_FIELDS = [('caller_jid', 'string'), ('fecha', 'string'), ('hora', 'string'),
+                         ('tipo_llamada', 'string'), ('duration', 'int64'), ('video_call', 'int64')]
+
+
+def call_details_chunk(df_calls):
+    """Aplica la clasificación y el formato de fecha/hora a un bloque de call_log."""
+    local = local_datetimes(df_calls['timestamp'])
+    return pd.DataFrame({
+        'caller_jid': df_calls['caller_jid'].fillna('Desconocido').astype(str),
+        'fecha': local.dt.strftime('%Y-%m-%d').fillna(''),
+        'hora': local.dt.strftime('%H:%M:%S').fillna(''),
+        'tipo_llamada': classify_calls(df_calls),
+        'duration': pd.to_numeric(df_calls['duration'], errors='coerce').fillna(0).astype('int64'),
+        'video_call': pd.to_numeric(df_calls['video_call'], errors='coerce').fillna(0).astype('int64'),
+    }, columns=EXPORT_COLUMNS)
+
+
+def _safe_file_name(contact_jid, used):
+    """
+    Nombre de archivo para un contacto, distinto de los de `used` (sin
+    distinguir mayúsculas, como en Windows): si dos contactos quedan con el
+    mismo nombre al reemplazar los caracteres no válidos, se agrega _2, _3...
+    """
+    base = re.sub(r'[^\w.@-]', '_', contact_jid) or 'Desconocido'
+    name, n = base, 2
+    while name.lower() in used:
+        name = f"{base}_{n}"
+        n += 1
+    used.add(name.lower())
+    return name
+
+
+class _CsvSink:
+    def __init__(self, path):
+        self.path = path
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.path, mode='w' if self.header else 'a', header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        pass
+
+
+class _JsonSink:
+    """Arreglo JSON de registros, escrito bloque por bloque."""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('[')
+        self.empty = True
+
+    def write(self, df):
+        if df.empty:
+            return
+        records = df.to_json(orient='records', force_ascii=False, date_format='iso')[1:-1]
+        self.file.write(records if self.empty else ',\n' + records)
+        self.empty = False
+
+    def close(self):
+        self.file.write(']\n')
+        self.file.close()
+
+
+class _ParquetSink:
+    """fields: [(columna, tipo pyarrow)]; sin fields, el esquema sale del primer bloque."""
+
+    def __init__(self, path, fields=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("La exportación a Parquet requiere pyarrow (pip install pyarrow)")
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in fields]) if fields else None
+        self.writer = pq.ParquetWriter(path, self.schema) if self.schema is not None else None
+
+    def write(self, df):
+        if self.writer is None:
+            self.schema = self._pa.Schema.from_pandas(df, preserve_index=False)
+            self.writer = self._pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(self._pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_sink(path, fmt, parquet_fields=None):
+    """Destino de escritura por bloques (write(df), close()) en formato csv, json o parquet."""
+    if fmt == 'csv':
+        return _CsvSink(path)
+    if fmt == 'json':
+        return _JsonSink(path)
+    if fmt == 'parquet':
+        return _ParquetSink(path, parquet_fields)
+    raise ValueError(f"Formato no soportado: {fmt}")
+
+
+def export_call_details(db_path, output, fmt='csv', by_contact=False, chunksize=EXPORT_CHUNK_SIZE):
+    """
+    Exporta el detalle clasificado de todas las llamadas en una sola pasada.
+
+    Las filas de call_log se leen en bloques de `chunksize` ordenadas por
+    contacto, así que la memoria usada no depende del tamaño de la base.
+    Con by_contact=True `output` es un directorio y se escribe un archivo por
+    contacto (solo hay uno abierto a la vez). Devuelve (filas, archivos).
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt}")
+
+    def new_sink(path):
+        return open_sink(path, fmt, EXPORT_PARQUET_FIELDS)
+    if by_contact:
+        os.makedirs(output, exist_ok=True)
+    elif os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    rows = 0
+    files = 0
+    sink = None
+    current_contact = None
+    used_names = set()
+    chunks = get_repository(db_path).chunks('calls', chunksize, columns=CALL_DETAIL_COLUMNS,
+                                            order_by=['caller_jid', 'timestamp'])
+    try:
+        for chunk in chunks:
+            detail = call_details_chunk(chunk)
+            rows += len(detail)
+            if not by_contact:
+                if sink is None:
+                    sink = new_sink(output)
+                    files = 1
+                sink.write(detail)
+                continue
+            # Las filas vienen ordenadas por contacto: cada grupo continúa el
+            # archivo abierto o abre el siguiente.
+            for contact_jid, group in detail.groupby('caller_jid', sort=False):
+                if contact_jid != current_contact:
+                    if sink is not None:
+                        sink.close()
+                    path = os.path.join(output, f"{_safe_file_name(contact_jid, used_names)}.{fmt}")
+                    sink = new_sink(path)
+                    current_contact = contact_jid
+                    files += 1
+                sink.write(group)
+        if sink is None and not by_contact:
+            # Base sin llamadas: archivo solo con encabezados
+            sink = new_sink(output)
+            sink.write(pd.DataFrame(columns=EXPORT_COLUMNS).astype({'duration': 'int64', 'video_call': 'int64'}))
+            files = 1
+    finally:
+        chunks.close()
+        if sink is not None:
+            sink.close()
+    return rows, files
@@ -0,0 +1,233 @@
+"""
+Datos del caso compartidos entre los visores.
+
+Cuando app11.py, call7.py y loc4.py se abren desde gui.py corren en el mismo
+proceso; este módulo lee cada tabla de msgstore.db una sola vez y entrega a
+todos los visores el mismo objeto (DataFrame, dataset o índice), sin copias.
+Los visores tratan estas tablas como de solo lectura: filtran o copian
+(df[...], .copy()) antes de modificar.
+
+Cada tabla se carga la primera vez que se pide, con un cerrojo propio, así
+que dos visores (o un hilo de carga) que la piden a la vez esperan una sola
+lectura. Si la carga falla no se guarda nada y el siguiente pedido reintenta.
+
+Con límite de memoria (memory_budget.py) los mensajes se cargan sin los
+textos largos; load_message_texts y search_message_ids los piden a la base.
+Tampoco se guardan la fecha y el nombre del chat como texto por mensaje: los
+visores los arman al mostrar cada fila (convert_timestamp, chat_display_names).
+
+Sin dependencias de Qt.
+"""
+import datetime
+import os
+import threading
+
+import pandas as pd
+
+import memory_budget
+import perftrace
+from call_stats import local_datetimes
+from msgstore import MESSAGE_SCHEMA, get_repository
+
+DATABASE_PATH = 'msgstore.db'
+
+DISPLAY_TIMESTAMP_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+# Fuente de cada fila en las vistas combinadas de varios teléfonos (cases.py)
+CASE_COLUMN = 'caso'
+
+# Mensajes por consulta al pedir textos a la base (tope de parámetros de SQLite)
+TEXT_BATCH_SIZE = 500
+
+
+def convert_timestamp(ts):
+    """Timestamp (ms) a texto dd/mm/aaaa hh:mm:ss; None si es nulo o <= 0."""
+    if pd.notnull(ts) and ts > 0:
+        try:
+            return datetime.datetime.fromtimestamp(ts / 1000).strftime(DISPLAY_TIMESTAMP_FORMAT)
+        except Exception:
+            return None
+    return None
+
+
+def display_timestamps(timestamps):
+    """convert_timestamp vectorizado (fila por fila solo si hay fechas fuera de rango)."""
+    try:
+        local = local_datetimes(timestamps)
+    except (OverflowError, ValueError, pd.errors.OutOfBoundsDatetime):
+        return timestamps.apply(convert_timestamp)
+    return local.dt.strftime(DISPLAY_TIMESTAMP_FORMAT)
+
+
+def chat_display_names(df):
+    """Nombre del chat para mostrar: chat_name, o el jid si no tiene nombre."""
+    return df['chat_name'].where(df['chat_name'] != '', df['chat_jid'])
+
+
+def load_messages(db_path):
+    """
+    Mensajes con medios y ubicaciones (esquema canónico de msgstore.py) para
+    app11.py. Con límite de memoria se leen sin los textos largos (ver
+    load_message_texts) y sin las columnas display_timestamp y
+    chat_display_name.
+    """
+    repository = get_repository(db_path)
+    limited = memory_budget.limited()
+    if limited:
+        columns = [spec[0] for spec in MESSAGE_SCHEMA if spec[0] not in memory_budget.LARGE_TEXT_COLUMNS]
+        df_messages = repository.query('messages', columns=columns)
+    else:
+        df_messages = repository.query('messages')
+
+    with perftrace.span('case_data.load_messages', 'pandas', filas=len(df_messages)):
+        df_messages['timestamp_raw'] = df_messages['timestamp']
+        if not limited:
+            df_messages['display_timestamp'] = display_timestamps(df_messages['timestamp_raw'])
+            df_messages['chat_display_name'] = chat_display_names(df_messages)
+    return df_messages
+
+
+@perftrace.traced('pandas', 'case_data.build_conversations')
+def build_conversations(df_messages):
+    """
+    Último mensaje de cada chat, del más reciente al más antiguo. En una vista
+    combinada cada teléfono tiene sus propios chats (nombre con "[caso]").
+    Con límite de memoria el nombre y la fecha se arman aquí (una fila por chat).
+    """
+    keys = ['chat_jid']
+    if CASE_COLUMN in df_messages.columns:
+        keys = [CASE_COLUMN, 'chat_jid']
+    conversaciones = df_messages.sort_values('timestamp_raw', ascending=False).drop_duplicates(keys)
+    conversaciones = conversaciones.sort_values(by='timestamp_raw', ascending=False).reset_index(drop=True)
+    if 'chat_display_name' not in conversaciones.columns:
+        conversaciones = conversaciones.assign(
+            chat_display_name=chat_display_names(conversaciones),
+            display_timestamp=display_timestamps(conversaciones['timestamp_raw']))
+    columns = [c for c in ['chat_jid', 'chat_display_name', 'text_data', 'display_timestamp', 'timestamp_raw']
+               if c in conversaciones.columns]
+    if CASE_COLUMN in conversaciones.columns:
+        columns.append(CASE_COLUMN)
+    conversaciones = conversaciones[columns]
+    if CASE_COLUMN in columns:
+        conversaciones = conversaciones.assign(chat_display_name=(
+            conversaciones['chat_display_name'] + ' [' + conversaciones[CASE_COLUMN] + ']'))
+    return conversaciones
+
+
+def load_message_texts(db_path, ids):
+    """Columnas de texto largo de los mensajes dados, indexadas por _id."""
+    repository = get_repository(db_path)
+    columns = ['_id', *memory_budget.LARGE_TEXT_COLUMNS]
+    ids = [int(i) for i in ids]
+    parts = [repository.query('messages', columns=columns,
+                              filters=[('_id', 'IN', ids[start:start + TEXT_BATCH_SIZE])])
+             for start in range(0, len(ids), TEXT_BATCH_SIZE)]
+    texts = pd.concat(parts, ignore_index=True) if parts else repository.query('messages', columns=columns, limit=0)
+    return texts.drop_duplicates('_id').set_index('_id')
+
+
+def search_message_ids(db_path, text, chat_jid=None):
+    """_id de los mensajes cuyo texto o pie de foto contiene `text` (búsqueda en la base)."""
+    repository = get_repository(db_path)
+    chat_filter = [('chat_jid', '=', chat_jid)] if chat_jid is not None else []
+    ids = set()
+    for column in ('text_data', 'media_caption'):
+        found = repository.query('messages', columns=['_id'],
+                                 filters=chat_filter + [(column, 'CONTAINS', text)])
+        ids.update(found['_id'].tolist())
+    return ids
+
+
+def load_calls(db_path):
+    """Registro de llamadas con el número del contacto (call7.py)."""
+    return get_repository(db_path).query('calls')
+
+
+class CaseData:
+    """Tablas de un msgstore.db, cargadas una vez y compartidas por referencia."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._tables = {}
+        self._sizes = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def table(self, name, loader, merge=None):
+        """
+        Tabla compartida `name`. La primera vez se obtiene con loader(db_path);
+        después se devuelve el mismo objeto a todos los que la pidan. (merge
+        solo lo usan las vistas combinadas, ver cases.MergedCase.)
+        """
+        with self._lock:
+            if name in self._tables:
+                return self._tables[name]
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._tables:
+                value = loader(self.db_path)
+                self._sizes[name] = memory_budget.estimate_nbytes(value)
+                self._tables[name] = value
+            return self._tables[name]
+
+    def is_loaded(self, name):
+        return name in self._tables
+
+    def put(self, name, value):
+        """Guarda una tabla ya cargada en otro lado (cases.load_sources)."""
+        with self._lock:
+            if name not in self._tables:
+                self._sizes[name] = memory_budget.estimate_nbytes(value)
+                self._tables[name] = value
+
+    def messages(self):
+        return self.table('messages', load_messages)
+
+    def conversations(self):
+        return self.table('conversations', lambda _: build_conversations(self.messages()))
+
+    def calls(self):
+        return self.table('calls', load_calls)
+
+    def message_texts(self, rows):
+        """Textos largos de las filas de mensajes dadas (alineados con rows)."""
+        texts = load_message_texts(self.db_path, rows['_id'].unique())
+        return texts.reindex(rows['_id']).fillna('').set_axis(rows.index)
+
+    def search_messages(self, text, chat_jid=None, case_name=None):
+        """_id de los mensajes que contienen `text` (case_name: solo vistas combinadas)."""
+        return search_message_ids(self.db_path, text, chat_jid)
+
+    def memory_usage(self):
+        """{tabla: bytes estimados} de las tablas cargadas."""
+        with self._lock:
+            return {name: self._sizes.get(name, 0) for name in self._tables}
+
+    def release(self, name=None):
+        """Libera una tabla (o todas); se volverá a leer si se pide de nuevo."""
+        with self._lock:
+            if name is None:
+                self._tables.clear()
+                self._sizes.clear()
+            else:
+                self._tables.pop(name, None)
+                self._sizes.pop(name, None)
+
+
+_cases = {}
+_cases_lock = threading.Lock()
+
+
+def get_case(db_path=DATABASE_PATH):
+    """CaseData compartido para una ruta de msgstore.db (uno por archivo)."""
+    key = os.path.abspath(db_path)
+    with _cases_lock:
+        if key not in _cases:
+            _cases[key] = CaseData(key)
+        return _cases[key]
+
+
+def open_cases():
+    """Los CaseData abiertos en este proceso."""
+    with _cases_lock:
+        return list(_cases.values())
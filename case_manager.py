@@ -0,0 +1,228 @@
+"""
+Administrador de casos del lanzador (gui.py).
+
+Registra los teléfonos del caso (msgstore.db + carpeta de medios), elige la
+vista que abren los módulos (un teléfono o todos combinados) y carga las
+bases en paralelo con cases.load_sources. Todo se guarda en casos.json.
+"""
+import datetime
+import os
+
+from PyQt5.QtCore import Qt, QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import (QApplication, QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+                             QPushButton, QLabel, QComboBox, QFileDialog, QHeaderView,
+                             QMessageBox, QAbstractItemView)
+
+from cases import CaseSource, load_registry, save_registry, case_choices, load_sources, MERGED
+
+NAME_COLUMN, DB_COLUMN, MEDIA_COLUMN, STATUS_COLUMN = range(4)
+
+
+def format_summary(summary):
+    """Texto de la columna Estado."""
+    if isinstance(summary, Exception):
+        return f"Error: {summary}"
+    text = f"{summary['mensajes']} mensajes, {summary['chats']} chats, {summary['llamadas']} llamadas"
+    if summary['desde'] is not None:
+        first = datetime.datetime.fromtimestamp(summary['desde'] / 1000).strftime('%d/%m/%Y')
+        last = datetime.datetime.fromtimestamp(summary['hasta'] / 1000).strftime('%d/%m/%Y')
+        text += f" ({first} - {last})"
+    return text
+
+
+class SourcesLoader(QObject):
+    """Corre cases.load_sources en un hilo (el diálogo sigue respondiendo)."""
+
+    progress = pyqtSignal(str, object)
+    finished = pyqtSignal()
+
+    def __init__(self, sources, parent=None):
+        super().__init__(parent)
+        self.sources = sources
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            load_sources(self.sources, progress=self.progress.emit)
+        except Exception as e:
+            for source in self.sources:
+                self.progress.emit(source.name, e)
+        self.finished.emit()
+
+
+class CaseManagerDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Casos")
+        self.resize(900, 400)
+
+        self.sources, self.active = load_registry()
+        self.loader_thread = None
+        # Estado de cada teléfono por nombre ("Cargando...", resumen o error)
+        self.status = {}
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Teléfonos del caso (msgstore.db y carpeta de medios)"))
+
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["Nombre", "Base de datos", "Medios", "Estado"])
+        self.table.horizontalHeader().setSectionResizeMode(STATUS_COLUMN, QHeaderView.Stretch)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.cellDoubleClicked.connect(self.on_cell_double_clicked)
+        self.table.itemChanged.connect(self.on_item_changed)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        add_btn = QPushButton("Agregar...")
+        add_btn.clicked.connect(self.add_source)
+        remove_btn = QPushButton("Quitar")
+        remove_btn.clicked.connect(self.remove_source)
+        self.load_btn = QPushButton("Cargar todos")
+        self.load_btn.setToolTip("Lee todas las bases a la vez, una por proceso")
+        self.load_btn.clicked.connect(self.load_all)
+        buttons.addWidget(add_btn)
+        buttons.addWidget(remove_btn)
+        buttons.addWidget(self.load_btn)
+        buttons.addStretch()
+        buttons.addWidget(QLabel("Vista:"))
+        self.view_combo = QComboBox()
+        self.view_combo.currentIndexChanged.connect(self.on_view_changed)
+        buttons.addWidget(self.view_combo)
+        layout.addLayout(buttons)
+
+        close_buttons = QHBoxLayout()
+        close_buttons.addStretch()
+        ok_btn = QPushButton("Aceptar")
+        ok_btn.clicked.connect(self.accept)
+        cancel_btn = QPushButton("Cancelar")
+        cancel_btn.clicked.connect(self.reject)
+        close_buttons.addWidget(ok_btn)
+        close_buttons.addWidget(cancel_btn)
+        layout.addLayout(close_buttons)
+
+        self.refresh()
+
+    def refresh(self):
+        self.table.blockSignals(True)
+        self.table.setRowCount(len(self.sources))
+        for row, source in enumerate(self.sources):
+            self.table.setItem(row, NAME_COLUMN, QTableWidgetItem(source.name))
+            for column, text in ((DB_COLUMN, source.db_path), (MEDIA_COLUMN, source.media_path or "(sin carpeta)")):
+                item = QTableWidgetItem(text)
+                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                self.table.setItem(row, column, item)
+            status = QTableWidgetItem(self.status.get(source.name, ""))
+            status.setFlags(status.flags() & ~Qt.ItemIsEditable)
+            self.table.setItem(row, STATUS_COLUMN, status)
+        self.table.resizeColumnsToContents()
+        self.table.blockSignals(False)
+
+        self.view_combo.blockSignals(True)
+        self.view_combo.clear()
+        for key, label in case_choices(self.sources):
+            self.view_combo.addItem(label, key)
+        index = self.view_combo.findData(self.active)
+        self.view_combo.setCurrentIndex(index if index >= 0 else 0)
+        self.view_combo.blockSignals(False)
+        self.active = self.view_combo.currentData()
+
+    def on_view_changed(self, index):
+        self.active = self.view_combo.itemData(index)
+
+    def unique_name(self, name):
+        names = {s.name for s in self.sources}
+        candidate, n = name, 2
+        while candidate in names or candidate == MERGED:
+            candidate = f"{name} ({n})"
+            n += 1
+        return candidate
+
+    def add_source(self):
+        db_path, _ = QFileDialog.getOpenFileName(self, "Base de datos msgstore.db", "",
+                                                 "Bases de datos (*.db);;Todos (*)")
+        if not db_path:
+            return
+        media_path = QFileDialog.getExistingDirectory(self, "Carpeta de medios (opcional)",
+                                                      os.path.dirname(db_path))
+        name = self.unique_name(os.path.basename(os.path.dirname(db_path)) or "Teléfono")
+        self.sources.append(CaseSource(name, db_path, media_path))
+        self.refresh()
+
+    def remove_source(self):
+        row = self.table.currentRow()
+        if row < 0 or len(self.sources) <= 1:
+            return
+        del self.sources[row]
+        self.refresh()
+
+    def on_cell_double_clicked(self, row, column):
+        if column == MEDIA_COLUMN:
+            media_path = QFileDialog.getExistingDirectory(self, "Carpeta de medios",
+                                                          self.sources[row].media_path)
+            if media_path:
+                self.sources[row].media_path = media_path
+                self.refresh()
+
+    def on_item_changed(self, item):
+        if item.column() != NAME_COLUMN:
+            return
+        source = self.sources[item.row()]
+        name = item.text().strip()
+        if name and name != source.name:
+            name = self.unique_name(name)
+            if self.active == source.name:
+                self.active = name
+            if source.name in self.status:
+                self.status[name] = self.status.pop(source.name)
+            source.name = name
+        self.refresh()
+
+    def load_all(self):
+        if self.loader_thread is not None and self.loader_thread.isRunning():
+            return
+        for row, source in enumerate(self.sources):
+            self.status[source.name] = "Cargando..."
+            self.table.item(row, STATUS_COLUMN).setText(self.status[source.name])
+        self.load_btn.setEnabled(False)
+        self.loader_thread = QThread(self)
+        self.loader = SourcesLoader(list(self.sources))
+        self.loader.moveToThread(self.loader_thread)
+        self.loader_thread.started.connect(self.loader.run)
+        self.loader.progress.connect(self.on_source_loaded)
+        self.loader.finished.connect(self.loader_thread.quit)
+        self.loader.finished.connect(self.on_load_finished)
+        self.loader_thread.start()
+
+    def on_load_finished(self):
+        self.load_btn.setEnabled(True)
+
+    def on_source_loaded(self, name, summary):
+        self.status[name] = format_summary(summary)
+        for row, source in enumerate(self.sources):
+            if source.name == name:
+                self.table.item(row, STATUS_COLUMN).setText(self.status[name])
+        self.table.resizeColumnToContents(STATUS_COLUMN)
+
+    def accept(self):
+        try:
+            save_registry(self.sources, self.active)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"No se pudo guardar casos.json:\n{e}")
+            return
+        super().accept()
+
+    def done(self, result):
+        if self.loader_thread is not None and self.loader_thread.isRunning():
+            # load_sources no se puede interrumpir: en lugar de esperarla (el
+            # lanzador quedaría congelado) la carga sigue en segundo plano y
+            # sus tablas quedan en memoria igual. El hilo pasa al lanzador y
+            # guarda al cargador hasta terminar; después se liberan los dos.
+            thread, loader = self.loader_thread, self.loader
+            loader.progress.disconnect(self.on_source_loaded)
+            loader.finished.disconnect(self.on_load_finished)
+            thread.setParent(self.parent() or QApplication.instance())
+            thread.loader = loader
+            thread.finished.connect(loader.deleteLater)
+            thread.finished.connect(thread.deleteLater)
+            self.loader_thread = self.loader = None
+        super().done(result)
@@ -0,0 +1,270 @@
+"""
+Casos con varios teléfonos.
+
+Cada fuente del caso es un par msgstore.db + carpeta de medios con un nombre
+(normalmente el del teléfono). Las fuentes y la vista activa se guardan en
+casos.json, que leen el lanzador, los visores y los procesos precalentados.
+
+Una vista es una fuente (su CaseData de case_data.py) o todas combinadas
+(MergedCase): las tablas combinadas se arman con las tablas ya cargadas de
+cada fuente, con la columna 'caso' indicando de qué fuente viene cada fila,
+así que cambiar de vista no vuelve a leer las bases de datos.
+
+load_sources() carga las tablas de varias fuentes a la vez en un grupo de
+procesos (una fuente por proceso) y las deja en el CaseData de cada una.
+
+Sin dependencias de Qt.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import memory_budget
+from case_data import (CASE_COLUMN, DATABASE_PATH, build_conversations, get_case,
+                       load_calls, load_messages, open_cases)
+
+CASES_FILE = 'casos.json'
+
+# Clave de la vista con todas las fuentes combinadas
+MERGED = '*'
+MERGED_LABEL = "Todas (combinadas)"
+
+# Tablas que load_sources carga en los procesos
+PRELOAD_TABLES = ('messages', 'conversations', 'calls')
+
+
+class CaseSource:
+    """Un teléfono del caso: nombre, msgstore.db y carpeta de medios."""
+
+    def __init__(self, name, db_path, media_path=''):
+        self.name = name
+        self.db_path = db_path
+        self.media_path = media_path
+
+    def to_dict(self):
+        return {'nombre': self.name, 'base_datos': self.db_path, 'medios': self.media_path}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['nombre'], data['base_datos'], data.get('medios', ''))
+
+
+def default_sources():
+    """Sin casos.json: solo msgstore.db del directorio actual."""
+    return [CaseSource(os.path.splitext(os.path.basename(DATABASE_PATH))[0], DATABASE_PATH)]
+
+
+def load_registry(path=CASES_FILE):
+    """(fuentes, vista activa) guardadas en casos.json."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        sources = [CaseSource.from_dict(item) for item in data.get('casos', [])]
+        active = data.get('activo')
+    except (OSError, ValueError, KeyError):
+        sources, active = [], None
+    if not sources:
+        sources = default_sources()
+    if active != MERGED and active not in [s.name for s in sources]:
+        active = sources[0].name
+    return sources, active
+
+
+def save_registry(sources, active, path=CASES_FILE):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'casos': [s.to_dict() for s in sources], 'activo': active}, f,
+                  indent=2, ensure_ascii=False)
+
+
+def case_choices(sources):
+    """[(clave, texto)] de las vistas posibles, para los selectores de los visores."""
+    choices = [(s.name, s.name) for s in sources]
+    if len(sources) > 1:
+        choices.append((MERGED, MERGED_LABEL))
+    return choices
+
+
+def media_paths(sources):
+    """{nombre de la fuente: carpeta de medios} (solo las que tienen carpeta)."""
+    return {s.name: s.media_path for s in sources if s.media_path}
+
+
+_merged = {}
+_merged_lock = threading.Lock()
+
+
+def open_case(key=None, sources=None):
+    """
+    Datos de una vista: el CaseData de una fuente o el MergedCase de todas.
+    Sin argumentos, la vista activa de casos.json.
+    """
+    if sources is None:
+        sources, active = load_registry()
+        key = key or active
+    if key == MERGED:
+        ident = tuple((s.name, os.path.abspath(s.db_path)) for s in sources)
+        with _merged_lock:
+            if ident not in _merged:
+                _merged[ident] = MergedCase(sources)
+            return _merged[ident]
+    for source in sources:
+        if source.name == key:
+            return get_case(source.db_path)
+    raise KeyError(f"Caso desconocido: {key}")
+
+
+def concat_frames(parts, names):
+    """Une las tablas de cada fuente, con la columna 'caso'."""
+    frames = [part.assign(**{CASE_COLUMN: name}) for part, name in zip(parts, names)]
+    return pd.concat(frames, ignore_index=True)
+
+
+class MergedCase:
+    """
+    Todas las fuentes combinadas, con la misma interfaz que CaseData.
+
+    table(name, loader, merge) combina la tabla ya cargada de cada fuente con
+    merge(partes, nombres); sin merge, la tabla se deriva de las combinadas y
+    loader recibe la lista de rutas.
+    """
+
+    def __init__(self, sources):
+        self.sources = list(sources)
+        self.names = [s.name for s in self.sources]
+        self.cases = [get_case(s.db_path) for s in self.sources]
+        self.db_path = [case.db_path for case in self.cases]
+        self._tables = {}
+        self._sizes = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def table(self, name, loader, merge=None):
+        with self._lock:
+            if name in self._tables:
+                return self._tables[name]
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._tables:
+                if merge is not None:
+                    parts = [case.table(name, loader) for case in self.cases]
+                    value = merge(parts, self.names)
+                else:
+                    value = loader(self.db_path)
+                self._sizes[name] = memory_budget.estimate_nbytes(value)
+                self._tables[name] = value
+            return self._tables[name]
+
+    def is_loaded(self, name):
+        return name in self._tables
+
+    def messages(self):
+        return self.table('messages', load_messages, concat_frames)
+
+    def conversations(self):
+        return self.table('conversations', lambda _: build_conversations(self.messages()))
+
+    def calls(self):
+        return self.table('calls', load_calls, concat_frames)
+
+    def message_texts(self, rows):
+        """Textos largos de las filas dadas, pedidos a la base de cada fuente."""
+        parts = [case.message_texts(rows[rows[CASE_COLUMN] == name])
+                 for name, case in zip(self.names, self.cases)]
+        return pd.concat(parts).reindex(rows.index)
+
+    def search_messages(self, text, chat_jid=None, case_name=None):
+        ids = set()
+        for name, case in zip(self.names, self.cases):
+            if case_name is None or name == case_name:
+                ids |= case.search_messages(text, chat_jid)
+        return ids
+
+    def memory_usage(self):
+        with self._lock:
+            return {name: self._sizes.get(name, 0) for name in self._tables}
+
+    def release(self, name=None):
+        """Libera las tablas combinadas (las de cada fuente siguen cargadas)."""
+        with self._lock:
+            if name is None:
+                self._tables.clear()
+                self._sizes.clear()
+            else:
+                self._tables.pop(name, None)
+                self._sizes.pop(name, None)
+
+
+def tables_memory():
+    """
+    {tabla: bytes} de todas las tablas cargadas en el proceso (cada fuente y
+    las vistas combinadas), con los nombres de la barra de estado.
+    """
+    usage = {}
+    with _merged_lock:
+        merged = list(_merged.values())
+    for case in open_cases() + merged:
+        for name, nbytes in case.memory_usage().items():
+            label = memory_budget.TABLE_LABELS.get(name, name)
+            usage[label] = usage.get(label, 0) + nbytes
+    return usage
+
+
+def case_summary(messages, calls):
+    """Resumen de una fuente para el administrador de casos."""
+    timestamps = messages['timestamp_raw'][messages['timestamp_raw'] > 0]
+    return {
+        'mensajes': len(messages),
+        'chats': int(messages['chat_jid'].nunique()),
+        'llamadas': len(calls),
+        'desde': int(timestamps.min()) if len(timestamps) else None,
+        'hasta': int(timestamps.max()) if len(timestamps) else None,
+    }
+
+
+def _load_tables(db_path, tables):
+    """Trabajo de cada proceso: lee las tablas de una fuente y su resumen."""
+    case = get_case(db_path)
+    loaded = {name: getattr(case, name)() for name in tables}
+    return loaded, case_summary(case.messages(), case.calls())
+
+
+def load_sources(sources, tables=PRELOAD_TABLES, workers=None, progress=None):
+    """
+    Carga las tablas de varias fuentes en paralelo (un proceso por fuente,
+    hasta `workers`) y las guarda en el CaseData de cada una. Las fuentes ya
+    cargadas no se vuelven a leer. Devuelve {nombre: resumen o Exception};
+    progress(nombre, resultado) se llama al terminar cada fuente.
+    """
+    results = {}
+    pending = []
+    for source in sources:
+        case = get_case(source.db_path)
+        if all(case.is_loaded(name) for name in tables):
+            results[source.name] = case_summary(case.messages(), case.calls())
+            if progress:
+                progress(source.name, results[source.name])
+        else:
+            pending.append(source)
+    if not pending:
+        return results
+
+    workers = min(len(pending), workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_load_tables, os.path.abspath(s.db_path), tables): s for s in pending}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                loaded, summary = future.result()
+            except Exception as e:
+                results[source.name] = e
+            else:
+                case = get_case(source.db_path)
+                for name, value in loaded.items():
+                    case.put(name, value)
+                results[source.name] = summary
+            if progress:
+                progress(source.name, results[source.name])
+    return results
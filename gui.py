@@ -1,27 +1,177 @@
-import sys
+import time
+
+# Inicio del arranque (para el informe de tiempos)
+STARTUP_T0 = time.perf_counter()
+
 import os
-import subprocess
+import sys
+import json
+import statistics
 
-from PySide6.QtWidgets import ( # type: ignore
+from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout,
-    QHBoxLayout, QPushButton, QLabel, QFrame, QGraphicsDropShadowEffect
+    QHBoxLayout, QPushButton, QLabel, QFrame, QGraphicsDropShadowEffect,
+    QMessageBox, QDialog
 )
-from PySide6.QtCore import Qt, QRect, QPropertyAnimation, QEasingCurve, QTimer, QSize # type: ignore
-from PySide6.QtGui import QIcon, QPixmap, QColor # type: ignore
+from PyQt5.QtCore import Qt, QRect, QPropertyAnimation, QEasingCurve, QTimer, QSize, QEvent
+from PyQt5.QtGui import QIcon, QPixmap, QColor
+
+# Trazas de rendimiento: WPA_TRAZA=1 o python gui.py --traza (ver perftrace.py)
+import perftrace
+# Límite de memoria: WPA_MEMORIA=MB o python gui.py --memoria MB (ver memory_budget.py)
+import memory_budget  # noqa: F401
+from module_host import ModuleHostPool, create_module_window, show_module_window, switch_module_view
 
 # --- Colores tecnológicos ---
 NEON_GREEN = "#39FF14"        # Verde neón
 BACKGROUND_BLACK = "#121212"  # Fondo oscuro
 BUTTON_HOVER = "#1F1F1F"      # Gris oscuro para hover en los botones
 
+def _read_prewarm():
+    """WPA_PREWARM como número de procesos (0 si no es un número)."""
+    try:
+        return max(0, int(float(os.environ.get("WPA_PREWARM", "0") or 0)))
+    except ValueError:
+        return 0
+
+
+# Procesos precalentados para los módulos (0 = todo en este proceso).
+# También con: python gui.py --precalentar N
+PREWARM_PROCESSES = _read_prewarm()
+
+# Modo ligero: sin sombra ni animaciones (también con: python gui.py --ligero)
+LEAN_MODE = os.environ.get("WPA_LEAN", "") not in ("", "0")
+
+# Íconos ya escalados y el historial de tiempos de arranque
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+ICON_CACHE_DIR = os.path.join(CACHE_DIR, "icons")
+STARTUP_HISTORY_PATH = os.path.join(CACHE_DIR, "arranque.json")
+STARTUP_HISTORY_SIZE = 20
+# Una fase es regresión si tarda más que REGRESSION_FACTOR veces la mediana
+# de los arranques anteriores (y al menos REGRESSION_MIN_MS más)
+REGRESSION_FACTOR = 1.5
+REGRESSION_MIN_MS = 50
+
+ICON_SIZE = 64
+LOGO_SIZE = 250
+
+_pixmap_cache = {}
+
+@perftrace.traced('imagen')
+def cached_pixmap(path, size):
+    """
+    Ícono escalado a size x size (en píxeles lógicos). El escalado suave se
+    hace una sola vez: el resultado se guarda en .cache/icons y los
+    arranques siguientes lo cargan ya con su tamaño.
+    """
+    app = QApplication.instance()
+    ratio = app.devicePixelRatio() if app else 1.0
+    pixels = int(round(size * ratio))
+    key = (path, pixels)
+    if key in _pixmap_cache:
+        return _pixmap_cache[key]
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    cached_path = os.path.join(ICON_CACHE_DIR, f"{name}_{pixels}.png")
+    pixmap = QPixmap()
+    if (os.path.exists(path) and os.path.exists(cached_path)
+            and os.path.getmtime(cached_path) >= os.path.getmtime(path)):
+        pixmap.load(cached_path)
+    if pixmap.isNull():
+        source = QPixmap(path)
+        if source.isNull():
+            return source
+        pixmap = source.scaled(pixels, pixels, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        try:
+            os.makedirs(ICON_CACHE_DIR, exist_ok=True)
+            pixmap.save(cached_path, "PNG")
+        except OSError:
+            pass
+    pixmap.setDevicePixelRatio(ratio)
+    _pixmap_cache[key] = pixmap
+    return pixmap
+
+class StartupReport:
+    """
+    Tiempos de arranque del lanzador: importación (Qt, QtWebEngine), 
+    construcción de la ventana y primer pintado. Se imprimen al terminar, se
+    guardan en .cache/arranque.json y se comparan con la mediana de los
+    arranques anteriores del mismo modo para avisar de regresiones.
+    """
+
+    PHASES = [
+        ("importacion", "importación"),
+        ("construccion", "construcción"),
+        ("primer_pintado", "primer pintado"),
+    ]
+
+    def __init__(self, lean=False, path=STARTUP_HISTORY_PATH):
+        self.lean = lean
+        self.path = path
+        self.times = {}
+        self.last = STARTUP_T0
+
+    def mark(self, phase):
+        """Cierra una fase: el tiempo desde la marca anterior."""
+        now = time.perf_counter()
+        self.times[phase] = round((now - self.last) * 1000, 1)
+        self.last = now
+
+    def finish(self):
+        history = self.load_history()
+        previous = [entry for entry in history if entry.get("ligero") == self.lean]
+
+        total = sum(self.times.values())
+        parts = ", ".join(f"{label} {self.times.get(phase, 0):.0f} ms" for phase, label in self.PHASES)
+        print(f"[ARRANQUE] {total:.0f} ms ({parts})")
+
+        for phase, label in self.PHASES:
+            past = [entry[phase] for entry in previous if phase in entry]
+            if not past or phase not in self.times:
+                continue
+            median = statistics.median(past)
+            if self.times[phase] > max(median * REGRESSION_FACTOR, median + REGRESSION_MIN_MS):
+                print(f"[ADVERTENCIA] Arranque más lento en {label}: "
+                      f"{self.times[phase]:.0f} ms (mediana anterior {median:.0f} ms)")
+
+        entry = dict(self.times, ligero=self.lean, fecha=time.strftime("%Y-%m-%d %H:%M:%S"))
+        self.save_history((history + [entry])[-STARTUP_HISTORY_SIZE:])
+
+    def load_history(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def save_history(self, history):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(history, f, indent=1)
+        except OSError:
+            pass
+
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, prewarm=0, lean=False, startup_report=None):
         super().__init__()
-        
+        self.lean = lean
+        self.startup_report = startup_report
+
         # Título y dimensiones de la ventana principal
         self.setWindowTitle("WPAnalyzer - Análisis de Base de Datos de WhatsApp v. 1.0")
         self.setGeometry(200, 100, 1000, 700)
 
+        # Ventanas de módulos ya abiertas (se conservan al cerrarlas)
+        self.module_windows = {}
+
+        # Procesos precalentados: se lanzan cuando el lanzador ya está en pantalla
+        self.host_pool = None
+        if prewarm > 0:
+            self.host_pool = ModuleHostPool(prewarm, self)
+            self.host_pool.failed.connect(self.on_module_failed)
+            QTimer.singleShot(0, self.host_pool.start)
+
         # Contenedor principal
         central_widget = QWidget()
         main_layout = QHBoxLayout(central_widget)
@@ -37,9 +187,7 @@ class MainWindow(QMainWindow):
         # Imagen / Logo principal
         self.logo_label = QLabel()
         self.logo_label.setAlignment(Qt.AlignCenter)
-        pixmap = QPixmap("icons/logo_neon.png")
-        pixmap = pixmap.scaled(250, 250, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        self.logo_label.setPixmap(pixmap)
+        self.logo_label.setPixmap(cached_pixmap("icons/logo_neon.png", LOGO_SIZE))
         self.main_layout.addWidget(self.logo_label)
 
         # Botones para abrir otros scripts
@@ -55,9 +203,11 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(self.main_frame, 1)
         self.setCentralWidget(central_widget)
 
-        # Botón flotante con animaciones
+        # Botón flotante con animaciones (en modo ligero, fijo y sin sombra)
+        self.timer = None
         self.floating_button = self.create_floating_button()
-        self.init_periodic_animation()
+        if not self.lean:
+            self.init_periodic_animation()
 
         # Aplicar estilos generales
         self.apply_style()
@@ -76,6 +226,17 @@ class MainWindow(QMainWindow):
         label_menu.setStyleSheet(f"color: {NEON_GREEN}; font-size: 20px; font-weight: bold;")
         layout.addWidget(label_menu)
 
+        # Teléfonos del caso y vista que abren los módulos (casos.json)
+        self.cases_button = QPushButton("Casos")
+        self.cases_button.clicked.connect(self.open_case_manager)
+        layout.addWidget(self.cases_button)
+        self.case_label = QLabel()
+        self.case_label.setWordWrap(True)
+        self.case_label.setStyleSheet("font-size: 12px;")
+        layout.addWidget(self.case_label)
+        # cases importa pandas: se lee después del primer pintado
+        QTimer.singleShot(0, self.update_case_label)
+
         layout.addStretch()
 
         # Texto de contacto con enlace
@@ -88,18 +249,53 @@ class MainWindow(QMainWindow):
 
         return frame
 
+    def update_case_label(self):
+        from cases import load_registry, MERGED, MERGED_LABEL
+        sources, active = load_registry()
+        self.case_label.setText(f"Vista: {MERGED_LABEL if active == MERGED else active}\n"
+                                f"{len(sources)} teléfono(s)")
+
+    def open_case_manager(self):
+        """
+        Administrador de casos. Si cambian los teléfonos, las ventanas de
+        módulos ya creadas se descartan (las tablas siguen en memoria, así que
+        reabrirlas es rápido), también las de los procesos precalentados; si
+        solo cambia la vista, se cambia en todas ellas.
+        """
+        from case_manager import CaseManagerDialog
+        from cases import load_registry
+        before = [s.to_dict() for s in load_registry()[0]]
+        dialog = CaseManagerDialog(self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        sources, active = load_registry()
+        if [s.to_dict() for s in sources] != before:
+            for window in self.module_windows.values():
+                window.close()
+                window.deleteLater()
+            self.module_windows.clear()
+            if self.host_pool:
+                self.host_pool.close_assigned()
+        else:
+            for window in self.module_windows.values():
+                switch_module_view(window, active)
+            if self.host_pool:
+                self.host_pool.switch_view(active)
+        if self.host_pool:
+            # Los procesos libres precargan la nueva vista
+            self.host_pool.restart_idle()
+        self.update_case_label()
+
     def create_button(self, text, icon_path, callback):
         """
         Crea un botón con un ícono y una función (callback).
         """
         button = QPushButton(text)
         
-        pixmap = QPixmap(icon_path)
+        pixmap = cached_pixmap(icon_path, ICON_SIZE)
         if not pixmap.isNull():
-            pixmap = pixmap.scaled(500, 500, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            icon = QIcon(pixmap)
-            button.setIcon(icon)
-            button.setIconSize(QSize(64, 64))
+            button.setIcon(QIcon(pixmap))
+            button.setIconSize(QSize(ICON_SIZE, ICON_SIZE))
         else:
             print(f"[ADVERTENCIA] No se encontró el ícono: {icon_path}")
         
@@ -111,12 +307,15 @@ class MainWindow(QMainWindow):
         Crea un botón flotante con animaciones.
         """
         button = QPushButton()
-        button.setIcon(QIcon("icons/logo_neon.png"))
-        button.setIconSize(QSize(64, 64))
+        button.setIcon(QIcon(cached_pixmap("icons/logo_neon.png", ICON_SIZE)))
+        button.setIconSize(QSize(ICON_SIZE, ICON_SIZE))
         button.setStyleSheet("border: none; background: transparent;")
         button.setParent(self)
         button.setGeometry(20, 20, 64, 64)
 
+        if self.lean:
+            return button
+
         # Sombra verde neón
         shadow = QGraphicsDropShadowEffect()
         shadow.setBlurRadius(25)
@@ -149,7 +348,39 @@ class MainWindow(QMainWindow):
         self.timer = QTimer()
         self.timer.setInterval(4000)
         self.timer.timeout.connect(self.float_button_animation)
-        self.timer.start()
+        # Arranca al mostrarse la ventana (showEvent) y se pausa al ocultarla
+
+    def pause_animations(self):
+        if self.timer is not None:
+            self.timer.stop()
+
+    def resume_animations(self):
+        if self.timer is not None and self.isVisible() and not self.isMinimized():
+            self.timer.start()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.resume_animations()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.pause_animations()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.WindowStateChange:
+            if self.isMinimized():
+                self.pause_animations()
+            else:
+                self.resume_animations()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.startup_report is not None:
+            # Primer pintado: cierra el informe de arranque
+            report, self.startup_report = self.startup_report, None
+            report.mark("primer_pintado")
+            QTimer.singleShot(0, report.finish)
 
     def float_button_animation(self):
         """
@@ -168,14 +399,48 @@ class MainWindow(QMainWindow):
 
     def open_script(self, script_name):
         """
-        Ejecuta un script externo de Python mediante subprocess.
+        Abre la ventana de un módulo. Con procesos precalentados se entrega a
+        uno que ya tiene todo cargado; si no hay ninguno listo (o no se usan),
+        se abre dentro de este proceso. La primera vez se importa el módulo y
+        se crea su ventana; al cerrarla solo se oculta, así que las siguientes
+        aperturas son inmediatas.
         """
-        python_exec = "python" if os.name == "nt" else "python3"
-        script_path = os.path.join(os.getcwd(), script_name)
-        if os.path.exists(script_path):
-            subprocess.Popen([python_exec, script_path])
-        else:
-            print(f"[ERROR] No se encontró el script: {script_path}")
+        if script_name not in self.module_windows and self.host_pool and self.host_pool.open(script_name):
+            return
+
+        window = self.module_windows.get(script_name)
+        if window is None:
+            window = self.create_module_window(script_name)
+            if window is None:
+                return
+            self.module_windows[script_name] = window
+        show_module_window(window, script_name)
+
+    def create_module_window(self, script_name):
+        """
+        Importa el módulo y crea su ventana principal. Los módulos terminan con
+        sys.exit(1) si no pueden leer la base (después de mostrar su propio
+        mensaje); aquí eso solo cancela la apertura, sin cerrar el lanzador.
+        """
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            return create_module_window(script_name)
+        except SystemExit:
+            return None
+        except Exception as e:
+            error = e
+        finally:
+            QApplication.restoreOverrideCursor()
+        QMessageBox.critical(self, "Error", f"No se pudo abrir {script_name}:\n{error}")
+        return None
+
+    def on_module_failed(self, script_name, message):
+        QMessageBox.critical(self, "Error", f"No se pudo abrir {script_name}:\n{message}")
+
+    def closeEvent(self, event):
+        if self.host_pool:
+            self.host_pool.shutdown()
+        super().closeEvent(event)
 
     def apply_style(self):
         """
@@ -208,10 +473,27 @@ class MainWindow(QMainWindow):
         self.setStyleSheet(style_sheet)
 
 def main():
+    # QtWebEngine (mapa de loc4.py) y el esquema mbtiles:// deben quedar
+    # registrados antes de crear la QApplication
+    from PyQt5 import QtWebEngineWidgets  # noqa: F401
+    from map_tiles import register_mbtiles_scheme
+    register_mbtiles_scheme()
+
+    prewarm = PREWARM_PROCESSES
+    if "--precalentar" in sys.argv[1:]:
+        # --precalentar N; sin número (o seguido de otra opción), un proceso
+        index = sys.argv.index("--precalentar")
+        value = sys.argv[index + 1] if index + 1 < len(sys.argv) else ""
+        prewarm = int(value) if value.isdigit() else 1
+    lean = LEAN_MODE or "--ligero" in sys.argv[1:]
+
+    report = StartupReport(lean)
+    report.mark("importacion")
     app = QApplication(sys.argv)
-    window = MainWindow()
+    window = MainWindow(prewarm, lean, report)
+    report.mark("construccion")
     window.show()
-    sys.exit(app.exec())
+    sys.exit(app.exec_())
 
 if __name__ == "__main__":
     main()
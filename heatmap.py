@@ -0,0 +1,57 @@
+"""
+Mapa de calor de densidad de ubicaciones.
+
+Las ubicaciones se agrupan con numpy.histogram2d sobre la proyección Web
+Mercator, con celdas de HEAT_CELL_PX píxeles al zoom pedido (así cada nivel
+de zoom tiene su propia resolución), y la cuadrícula se colorea como una
+imagen RGBA pequeña que el mapa muestra como capa superpuesta. Los
+resultados se guardan en un caché LRU (memory_budget.LruCache con
+HEAT_CACHE_SIZE entradas) por (selección, rango de fechas, zoom).
+
+Sin dependencias de Qt.
+"""
+import numpy as np
+
+from tracks import MAX_MERCATOR_LAT
+
+# Tamaño de cada celda del mapa de calor en píxeles de pantalla
+HEAT_CELL_PX = 4
+# Resolución máxima de la cuadrícula por eje
+HEAT_MAX_BINS = 512
+# Cuadrículas guardadas en el caché
+HEAT_CACHE_SIZE = 64
+
+
+def unproject(x, y):
+    """Inversa de tracks.mercator: (x, y) normalizados a (lat, lon)."""
+    lon = np.asarray(x) * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * np.asarray(y)))))
+    return np.clip(lat, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT), lon
+
+
+def density_grid(x, y, zoom):
+    """
+    Conteos por celda de los puntos (x, y) en Mercator normalizado (sin
+    NaN: las ubicaciones sin coordenadas se descartan antes). Devuelve
+    (conteos, (x0, y0, x1, y1)): la fila 0 es la del norte (y0).
+    """
+    cell = HEAT_CELL_PX / (256.0 * 2 ** zoom)
+    x0, x1 = x.min() - cell, x.max() + cell
+    y0, y1 = y.min() - cell, y.max() + cell
+    nx = int(np.clip(np.ceil((x1 - x0) / cell), 1, HEAT_MAX_BINS))
+    ny = int(np.clip(np.ceil((y1 - y0) / cell), 1, HEAT_MAX_BINS))
+    counts, _, _ = np.histogram2d(y, x, bins=(ny, nx), range=((y0, y1), (x0, x1)))
+    return counts, (x0, y0, x1, y1)
+
+
+def colorize(counts):
+    """Cuadrícula RGBA (uint8): de amarillo a rojo en escala logarítmica, vacío transparente."""
+    level = np.log1p(counts)
+    top = level.max()
+    t = level / top if top > 0 else level
+    rgba = np.zeros(counts.shape + (4,), dtype=np.uint8)
+    rgba[..., 0] = 255
+    rgba[..., 1] = (220 * (1.0 - t)).astype(np.uint8)
+    rgba[..., 3] = np.where(counts > 0, 90 + 165 * t, 0).astype(np.uint8)
+    return rgba
+
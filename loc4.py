@@ -1,27 +1,31 @@
+import os
 import sys
 import json
-import sqlite3
-import datetime
-from PyQt5.QtCore import Qt, pyqtSlot, QObject, QDateTime
+import base64
+import numpy as np
+from PyQt5.QtCore import (Qt, pyqtSignal, pyqtSlot, QObject, QDateTime, QThread, QUrl,
+                          QAbstractTableModel, QModelIndex, QEvent, QBuffer, QIODevice, QTimer)
+from PyQt5.QtGui import QImage
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QSplitter, 
                              QListWidget, QListWidgetItem, QLineEdit, QPushButton, 
                              QTableWidget, QTableWidgetItem, QLabel, QDialog, QFormLayout,
-                             QDateTimeEdit, QFrame, QSizePolicy, QSpacerItem)
+                             QDateTimeEdit, QFrame, QSizePolicy, QSpacerItem, QCheckBox,
+                             QTableView, QHeaderView, QStyledItemDelegate, QStyle,
+                             QStyleOptionButton, QComboBox, QStatusBar)
 from PyQt5.QtWebEngineWidgets import QWebEngineView
 from PyQt5.QtWebChannel import QWebChannel
 
-def format_timestamp(ts):
-    """Convierte timestamp (en milisegundos) a cadena con fecha y hora."""
-    if ts and isinstance(ts, int):
-        dt = datetime.datetime.fromtimestamp(ts / 1000.0)
-        return dt.strftime('%Y-%m-%d %H:%M:%S')
-    return str(ts)
+import memory_budget
+import perftrace
 
-def timestamp_to_datetime(ts):
-    """Convierte timestamp (milisegundos) a un objeto datetime."""
-    if ts and isinstance(ts, int):
-        return datetime.datetime.fromtimestamp(ts / 1000.0)
-    return None
+from map_tiles import register_mbtiles_scheme, install_mbtiles_handler
+from tracks import LiveTracks
+from heatmap import HEAT_CACHE_SIZE, density_grid, colorize, unproject
+from memory_budget import LruCache
+from places import find_places
+from locations import (LocationDataset, format_timestamp, load_location_dataset,
+                       merge_location_datasets)
+from cases import load_registry, open_case, case_choices, tables_memory
 
 map_html = """
 <!DOCTYPE html>
@@ -30,33 +34,36 @@ map_html = """
 <meta charset="utf-8"/>
 <meta name="viewport" content="width=device-width, initial-scale=1.0">
 <title>Mapa</title>
-<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+<link rel="stylesheet" href="leaflet.css"/>
 <style>
   html, body {height:100%; margin:0; padding:0;}
   #map {width:100%; height:100%;}
 </style>
-<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<script src="leaflet.js"></script>
 <script src="qrc:///qtwebchannel/qwebchannel.js"></script>
 </head>
 <body>
 <div id="map"></div>
 <script>
 // Iconos personalizados
+// (Leaflet y los íconos se sirven desde web/leaflet, sin conexión)
 var defaultIcon = L.icon({
-    iconUrl: 'https://unpkg.com/leaflet@1.9.4/dist/images/marker-icon.png',
+    iconUrl: 'images/marker-icon.png',
+    iconRetinaUrl: 'images/marker-icon-2x.png',
     iconSize: [25,41],
     iconAnchor: [12,41],
     popupAnchor: [1,-34],
-    shadowUrl: 'https://unpkg.com/leaflet@1.9.4/dist/images/marker-shadow.png',
+    shadowUrl: 'images/marker-shadow.png',
     shadowSize: [41,41]
 });
 
 var redIcon = L.icon({
-    iconUrl: 'https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-red.png',
+    iconUrl: 'images/marker-icon-red.png',
+    iconRetinaUrl: 'images/marker-icon-red-2x.png',
     iconSize: [25,41],
     iconAnchor: [12,41],
     popupAnchor: [1,-34],
-    shadowUrl: 'https://unpkg.com/leaflet@1.9.4/dist/images/marker-shadow.png',
+    shadowUrl: 'images/marker-shadow.png',
     shadowSize: [41,41]
 });
 
@@ -64,142 +71,454 @@ var markersDict = {};
 var channel = null;
 
 var map = L.map('map').setView([20,0], 2);
-L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
-  maxZoom:19,
+L.tileLayer('%TILE_URL%', {
+  minZoom: %TILE_MIN_ZOOM%,
+  maxZoom: %TILE_MAX_ZOOM%,
   attribution: '© OpenStreetMap contributors'
 }).addTo(map);
 
-function addMarker(id, lat, lon, number, timestamp, live, place) {
+// Un grupo de capas por contacto: marcar/desmarcar un contacto es mostrar/ocultar su grupo
+var contactLayers = {};
+
+function contactLayer(number) {
+  if (!contactLayers[number]) {
+    contactLayers[number] = L.layerGroup();
+  }
+  return contactLayers[number];
+}
+
+function escapeHtml(text) {
+  return String(text).replace(/[&<>"']/g, function(c) {
+    return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+  });
+}
+
+function notifyDoubleClick(id) {
+  var data = {id: id};
+  if (channel && channel.objects && channel.objects.bridge) {
+    channel.objects.bridge.onMarkerDoubleClicked(JSON.stringify(data));
+  }
+}
+
+function createMarker(m) {
   var chosenIcon = defaultIcon;
   var isFinal = false;
-  if (live == 'final') {
+  if (m.live == 'final') {
     chosenIcon = redIcon;
     isFinal = true;
   }
-  var marker = L.marker([lat, lon], {icon: chosenIcon}).addTo(map);
-  marker.bindTooltip(number + " - " + place + " (" + timestamp + ")");
+  var label = escapeHtml(m.number + " - " + m.place + " (" + m.ts + ")");
+  var marker = L.marker([m.lat, m.lon], {icon: chosenIcon});
+  marker.bindTooltip(label);
   marker.on('dblclick', function(e) {
-    var data = {id: id};
-    if (channel && channel.objects && channel.objects.bridge) {
-      channel.objects.bridge.onMarkerDoubleClicked(JSON.stringify(data));
-    }
+    notifyDoubleClick(m.id);
   });
-  markersDict[id] = {
+  markersDict[m.id] = {
     marker: marker,
     originalIcon: chosenIcon,
-    final: isFinal
+    final: isFinal,
+    number: m.number,
+    lat: m.lat,
+    lon: m.lon,
+    label: label
   };
+  return marker;
 }
 
-function highlightMarker(id, lat, lon) {
-  if (markersDict[id]) {
+// Recibe un lote de marcadores (lista JSON) y los agrega al grupo de su contacto
+function addMarkers(list) {
+  list.forEach(function(m) {
+    contactLayer(m.number).addLayer(createMarker(m));
+  });
+  scheduleClusterRender();
+}
+
+function removeMarkers(ids) {
+  ids.forEach(function(id) {
     var mObj = markersDict[id];
-    var marker = mObj.marker;
-    map.setView([lat, lon], 15); // centra el mapa en la ubicación
-    marker.setIcon(redIcon);
-    if (!mObj.final) {
-      // Si no es final, restaurar el icono tras 2 segundos
-      setTimeout(function() {
-        marker.setIcon(mObj.originalIcon);
-      }, 2000);
+    if (mObj) {
+      contactLayer(mObj.number).removeLayer(mObj.marker);
+      delete markersDict[id];
+    }
+  });
+  scheduleClusterRender();
+}
+
+// visibility: {numero: true/false}
+function setContactsVisible(visibility) {
+  Object.keys(visibility).forEach(function(number) {
+    var layer = contactLayer(number);
+    if (visibility[number]) {
+      visibleContacts[number] = true;
+      if (!clusterMode) {
+        map.addLayer(layer);
+      }
+    } else {
+      delete visibleContacts[number];
+      map.removeLayer(layer);
+    }
+  });
+  scheduleClusterRender();
+}
+
+function clearMarkers() {
+  Object.values(contactLayers).forEach(function(layer) {
+    map.removeLayer(layer);
+  });
+  setTracks(Object.keys(trackLayers).reduce(function(acc, number) {
+    acc[number] = null;
+    return acc;
+  }, {}));
+  contactLayers = {};
+  markersDict = {};
+  visibleContacts = {};
+  clusterTotals = null;
+  clusterLayer.clearLayers();
+  setHeatmap(null);
+  placesLayer.clearLayers();
+}
+
+// Recorridos en tiempo real: una polilínea (varios tramos) por contacto.
+// tracks: {numero: {color, lines: [[[lat, lon], ...], ...]}}; null la borra
+var trackLayers = {};
+
+function setTracks(tracks) {
+  Object.keys(tracks).forEach(function(number) {
+    if (trackLayers[number]) {
+      map.removeLayer(trackLayers[number]);
+      delete trackLayers[number];
+    }
+    var track = tracks[number];
+    if (!track || !track.lines.length) {
+      return;
+    }
+    var line = L.polyline(track.lines, {
+      renderer: canvasRenderer,
+      color: track.color,
+      weight: 3,
+      opacity: 0.8
+    });
+    line.bindTooltip(escapeHtml("Recorrido de " + number));
+    trackLayers[number] = line.addTo(map);
+  });
+}
+
+// Mapa de calor: imagen de densidad calculada en Python.
+// heat: {url, bounds: [[sur, oeste], [norte, este]]}; null lo quita
+var heatLayer = null;
+
+function setHeatmap(heat) {
+  if (heatLayer) {
+    map.removeLayer(heatLayer);
+    heatLayer = null;
+  }
+  if (heat) {
+    heatLayer = L.imageOverlay(heat.url, heat.bounds, {opacity: 0.85, interactive: false}).addTo(map);
+  }
+}
+
+// Lugares frecuentes: círculos con el radio del lugar.
+// places: [{lat, lon, radius, label}]
+var placesLayer = L.layerGroup().addTo(map);
+
+function setPlaces(places) {
+  placesLayer.clearLayers();
+  places.forEach(function(p) {
+    L.circle([p.lat, p.lon], {
+      radius: Math.max(p.radius, 30),
+      color: '#8E24AA',
+      fillColor: '#CE93D8',
+      fillOpacity: 0.35,
+      weight: 2
+    }).bindTooltip(escapeHtml(p.label)).addTo(placesLayer);
+  });
+}
+
+////////////////////////////////////////////////////////////
+// Modo agrupado: los puntos visibles se agregan por celdas de
+// CLUSTER_CELL_PX píxeles al nivel de zoom actual y se dibujan
+// como círculos en canvas (sin un elemento DOM por marcador).
+////////////////////////////////////////////////////////////
+var CLUSTER_CELL_PX = %CLUSTER_CELL_PX%;
+var CLUSTER_MAX_ZOOM = %CLUSTER_MAX_ZOOM%;  // a partir de aquí se dibujan todos los puntos
+var clusterMode = false;
+// Totales reales por celda calculados en Python sobre todas las filas
+// filtradas (los marcadores enviados son una muestra): {zoom, counts: {celda: n}}
+var clusterTotals = null;
+var visibleContacts = {};
+var canvasRenderer = L.canvas({padding: 0.5});
+var clusterLayer = L.layerGroup().addTo(map);
+var clusterRenderPending = false;
+
+function setClusterMode(enabled) {
+  clusterMode = enabled;
+  Object.keys(visibleContacts).forEach(function(number) {
+    var layer = contactLayer(number);
+    if (enabled) {
+      map.removeLayer(layer);
+    } else {
+      map.addLayer(layer);
+    }
+  });
+  clusterLayer.clearLayers();
+  scheduleClusterRender();
+}
+
+function setClusterTotals(totals) {
+  clusterTotals = totals;
+  scheduleClusterRender();
+}
+
+function scheduleClusterRender() {
+  if (!clusterMode || clusterRenderPending) {
+    return;
+  }
+  clusterRenderPending = true;
+  requestAnimationFrame(function() {
+    clusterRenderPending = false;
+    renderClusters();
+  });
+}
+
+function pointMarker(id, mObj) {
+  var point = L.circleMarker([mObj.lat, mObj.lon], {
+    renderer: canvasRenderer,
+    radius: 6,
+    color: mObj.final ? '#B00020' : '#075E54',
+    fillColor: mObj.final ? '#E53935' : '#25D366',
+    fillOpacity: 0.9,
+    weight: 2
+  });
+  point.bindTooltip(mObj.label);
+  point.on('dblclick', function(e) {
+    L.DomEvent.stop(e);
+    notifyDoubleClick(id);
+  });
+  return point;
+}
+
+function clusterMarker(cell, total) {
+  var lat = cell.latSum / cell.count;
+  var lon = cell.lonSum / cell.count;
+  var circle = L.circleMarker([lat, lon], {
+    renderer: canvasRenderer,
+    radius: Math.min(10 + 4 * Math.log(total), 30),
+    color: '#128C7E',
+    fillColor: '#25D366',
+    fillOpacity: 0.6,
+    weight: 2
+  });
+  circle.bindTooltip(total + " ubicaciones");
+  circle.on('click', function() {
+    map.fitBounds(L.latLngBounds(cell.bounds), {maxZoom: CLUSTER_MAX_ZOOM});
+  });
+  return circle;
+}
+
+function renderClusters() {
+  clusterLayer.clearLayers();
+  if (!clusterMode) {
+    return;
+  }
+  var zoom = map.getZoom();
+  var view = map.getBounds().pad(0.25);
+  var cells = {};
+  var totals = (clusterTotals && clusterTotals.zoom == zoom) ? clusterTotals.counts : {};
+  Object.keys(markersDict).forEach(function(id) {
+    var mObj = markersDict[id];
+    if (!visibleContacts[mObj.number] || !view.contains([mObj.lat, mObj.lon])) {
+      return;
+    }
+    var key = id;
+    if (zoom < CLUSTER_MAX_ZOOM) {
+      var p = map.project([mObj.lat, mObj.lon], zoom);
+      key = Math.floor(p.x / CLUSTER_CELL_PX) + ':' + Math.floor(p.y / CLUSTER_CELL_PX);
+    }
+    var cell = cells[key];
+    if (!cell) {
+      cell = cells[key] = {key: key, count: 0, latSum: 0, lonSum: 0, id: id, bounds: []};
+    }
+    cell.count += 1;
+    cell.latSum += mObj.lat;
+    cell.lonSum += mObj.lon;
+    cell.bounds.push([mObj.lat, mObj.lon]);
+  });
+  Object.values(cells).forEach(function(cell) {
+    var total = Math.max(totals[cell.key] || 0, cell.count);
+    if (total == 1) {
+      clusterLayer.addLayer(pointMarker(cell.id, markersDict[cell.id]));
+    } else {
+      clusterLayer.addLayer(clusterMarker(cell, total));
     }
+  });
+}
+
+map.on('zoomend moveend', scheduleClusterRender);
+
+// Informa a Python del área visible (y el zoom) al terminar cada movimiento;
+// Python responde con los marcadores de esa área (addMarkers/removeMarkers)
+function reportViewport() {
+  if (!(channel && channel.objects && channel.objects.bridge)) {
+    return;
+  }
+  var b = map.getBounds();
+  channel.objects.bridge.onViewportChanged(JSON.stringify({
+    south: b.getSouth(), west: b.getWest(),
+    north: b.getNorth(), east: b.getEast(),
+    zoom: map.getZoom()
+  }));
+}
+
+map.on('moveend', reportViewport);
+
+function highlightMarker(id, lat, lon) {
+  if (!markersDict[id]) {
+    // Fuera del área enviada: se centra el mapa (el moveend trae sus
+    // marcadores) y se muestra un marcador temporal
+    map.setView([lat, lon], 15);
+    var temp = L.marker([lat, lon], {icon: redIcon}).addTo(map);
+    setTimeout(function() {
+      map.removeLayer(temp);
+    }, 2000);
+    return;
+  }
+  var mObj = markersDict[id];
+  var marker = mObj.marker;
+  map.setView([lat, lon], 15); // centra el mapa en la ubicación
+  if (clusterMode) {
+    // En modo agrupado el punto puede estar dentro de un grupo: se muestra
+    // su marcador encima durante 2 segundos
+    marker.setIcon(redIcon);
+    map.addLayer(marker);
+    setTimeout(function() {
+      map.removeLayer(marker);
+      marker.setIcon(mObj.originalIcon);
+    }, 2000);
+    return;
+  }
+  marker.setIcon(redIcon);
+  if (!mObj.final) {
+    // Si no es final, restaurar el icono tras 2 segundos
+    setTimeout(function() {
+      marker.setIcon(mObj.originalIcon);
+    }, 2000);
   }
 }
 
 // Inicializar QWebChannel
 new QWebChannel(qt.webChannelTransport, function(ch) {
     channel = ch;
+    reportViewport();
 });
 </script>
 </body>
 </html>
 """
 
-############################################################
-# Cargar datos desde msgstore.db
-############################################################
+# Leaflet, su CSS y los íconos (copiados localmente para equipos sin conexión)
+MAP_ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web', 'leaflet')
 
-conn = sqlite3.connect('msgstore.db')
-c = conn.cursor()
-
-c.execute("""
-SELECT ml.message_row_id,
-       j.raw_string AS number,
-       ml.latitude,
-       ml.longitude,
-       ml.place_name,
-       ml.place_address,
-       ml.url,
-       ml.live_location_share_duration,
-       ml.live_location_final_latitude,
-       ml.live_location_final_longitude,
-       ml.live_location_final_timestamp,
-       m.timestamp
-FROM message_location ml
-JOIN message m ON ml.message_row_id = m._id
-JOIN chat cc ON m.chat_row_id = cc._id
-JOIN jid j ON cc.jid_row_id = j._id;
-""")
-
-rows = c.fetchall()
-conn.close()
-
-data = []
-data_by_id = {}
-timestamps = []
-
-for row in rows:
-    message_id = row[0]
-    ts_val = row[11]
-    record = {
-        "id": message_id,
-        "number": row[1],
-        "latitude": row[2],
-        "longitude": row[3],
-        "place_name": row[4] if row[4] else "",
-        "place_address": row[5] if row[5] else "",
-        "url": row[6] if row[6] else "",
-        "live_duration": row[7] if row[7] else 0,
-        "final_lat": row[8],
-        "final_lon": row[9],
-        "final_ts": row[10],
-        "timestamp": ts_val
-    }
-    data.append(record)
-    data_by_id[message_id] = record
-    if ts_val is not None:
-        timestamps.append(ts_val)
-
-all_numbers = sorted(set([d["number"] for d in data]))
+ONLINE_TILE_URL = 'https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png'
+MBTILES_TILE_URL = 'mbtiles://tiles/{z}/{x}/{y}.png'
 
-# Conteo por número
-number_counts = {}
-for d in data:
-    number_counts[d["number"]] = number_counts.get(d["number"], 0) + 1
+# Modo agrupado: tamaño de las celdas (píxeles) y zoom desde el que no se agrupa
+CLUSTER_CELL_PX = 60
+CLUSTER_MAX_ZOOM = 17
 
-# Ordenar por número de puntos compartidos (desc)
-sorted_number_counts = sorted(number_counts.items(), key=lambda x: x[1], reverse=True)
+def build_map_html(tile_url=ONLINE_TILE_URL, min_zoom=0, max_zoom=19):
+    """Página del mapa con la fuente de teselas indicada."""
+    return (map_html
+            .replace('%CLUSTER_CELL_PX%', str(CLUSTER_CELL_PX))
+            .replace('%CLUSTER_MAX_ZOOM%', str(CLUSTER_MAX_ZOOM))
+            .replace('%TILE_URL%', tile_url)
+            .replace('%TILE_MIN_ZOOM%', str(min_zoom))
+            .replace('%TILE_MAX_ZOOM%', str(max_zoom)))
 
-# Determinar el rango de fechas global
-if timestamps:
-    min_ts = min(timestamps)
-    max_ts = max(timestamps)
-else:
-    # Si no hay datos, usar ahora
-    now_ts = int(datetime.datetime.now().timestamp() * 1000)
-    min_ts, max_ts = now_ts, now_ts
+############################################################
+# Cargar datos desde msgstore.db
+############################################################
 
-min_dt = timestamp_to_datetime(min_ts)
-max_dt = timestamp_to_datetime(max_ts)
+# Marcadores por llamada a runJavaScript
+MARKER_BATCH_SIZE = 5000
+
+# Con más ubicaciones que esto el mapa arranca en modo agrupado
+CLUSTER_AUTO_THRESHOLD = 2000
+
+# Solo se envían los puntos del área visible (ampliada en este factor para
+# que los desplazamientos cortos no pidan nada nuevo), con un tope por zoom:
+# VIEWPORT_BASE_MARKERS hasta VIEWPORT_BASE_ZOOM, el doble por cada nivel
+# siguiente y nunca más de VIEWPORT_MAX_MARKERS
+VIEWPORT_PAD = 0.25
+VIEWPORT_BASE_ZOOM = 6
+VIEWPORT_BASE_MARKERS = 500
+VIEWPORT_MAX_MARKERS = 5000
+# Con el mapa de calor activo, hasta este zoom se dibuja la densidad en
+# lugar de los marcadores
+HEATMAP_MAX_ZOOM = 8
+
+# Lugares frecuentes que se muestran por contacto
+PLACES_PER_CONTACT = 10
+
+# Al reducir, los puntos se estratifican por celdas de este tamaño en píxeles
+THIN_CELL_PX = 4
+
+# Refresco de la barra de estado con el uso de memoria (ms)
+MEMORY_STATUS_INTERVAL_MS = 2000
+
+def viewport_marker_cap(zoom):
+    """Máximo de marcadores a enviar al mapa para un nivel de zoom."""
+    return min(VIEWPORT_MAX_MARKERS, VIEWPORT_BASE_MARKERS * 2 ** max(0, int(zoom) - VIEWPORT_BASE_ZOOM))
+
+
+def thin_rows(dataset, rows, zoom, cap):
+    """
+    Reduce las filas a cap como máximo con un muestreo estratificado: se
+    ordenan por celda de THIN_CELL_PX píxeles al zoom dado y se toman a paso
+    uniforme, así cada zona conserva puntos en proporción a su densidad.
+    Devuelve las filas ordenadas.
+    """
+    if len(rows) <= cap:
+        return rows
+    cell_deg = 360.0 / (256 * 2 ** int(zoom)) * THIN_CELL_PX
+    lat_cell = np.floor((dataset.latitudes[rows] + 90.0) / cell_deg).astype(np.int64)
+    lon_cell = np.floor((dataset.longitudes[rows] + 180.0) / cell_deg).astype(np.int64)
+    keys = lat_cell * (int(360.0 / cell_deg) + 1) + lon_cell
+    order = np.argsort(keys, kind='stable')
+    picked = order[np.linspace(0, len(rows) - 1, cap).astype(np.int64)]
+    return np.sort(rows[picked])
+
+
+class LocationLoader(QObject):
+    """Carga el LocationDataset en un hilo de trabajo (ver MainWindow.start_loading)."""
+
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, case, parent=None):
+        super().__init__(parent)
+        self.case = case
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            # Compartido con las demás ventanas del proceso (case_data)
+            dataset = self.case.table('locations', load_location_dataset, merge_location_datasets)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit(dataset)
 
 ############################################################
 # Clase Bridge para comunicación entre JS y Python
 ############################################################
 
 class Bridge(QObject):
-    def __init__(self, data_dict, parent=None):
+    # Área visible del mapa: {south, west, north, east, zoom}
+    viewportChanged = pyqtSignal(dict)
+
+    def __init__(self, dataset, parent=None):
         super().__init__(parent)
-        self.data_dict = data_dict
+        self.dataset = dataset
         self.detail_callback = None
 
     def set_detail_callback(self, callback):
@@ -209,11 +528,15 @@ class Bridge(QObject):
     def onMarkerDoubleClicked(self, json_str):
         info = json.loads(json_str)
         marker_id = info.get("id")
-        if marker_id in self.data_dict:
-            record = self.data_dict[marker_id]
+        record = self.dataset.record_by_id(marker_id)
+        if record is not None:
             if self.detail_callback:
                 self.detail_callback(record)
 
+    @pyqtSlot(str)
+    def onViewportChanged(self, json_str):
+        self.viewportChanged.emit(json.loads(json_str))
+
 ############################################################
 # Ventana de Detalle
 ############################################################
@@ -265,13 +588,186 @@ class DetailDialog(QDialog):
         if self.main_window:
             self.main_window.place_final_marker(lat, lon)
 
+############################################################
+# Lugares frecuentes
+############################################################
+
+def format_seconds(seconds):
+    """Duración en segundos como texto (1d 02:03:04)."""
+    days, rest = divmod(int(seconds), 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+    text = f"{hours:02d}:{minutes:02d}:{secs:02d}"
+    return f"{days}d {text}" if days else text
+
+class PlacesDialog(QDialog):
+    """Resumen de lugares frecuentes; doble clic en una fila centra el mapa."""
+
+    HEADERS = ["Contacto", "#", "Visitas", "Permanencia", "Puntos",
+               "Coordenadas", "Radio (m)", "Primera visita", "Última visita"]
+
+    def __init__(self, places, parent=None, main_window=None):
+        super().__init__(parent)
+        self.setWindowTitle("Lugares frecuentes")
+        self.resize(1000, 500)
+        self.main_window = main_window
+        self.places = places.reset_index(drop=True)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(f"{len(self.places)} lugares (hasta {PLACES_PER_CONTACT} por contacto, "
+                                f"ordenados por visitas y permanencia)"))
+        self.table = QTableWidget(len(self.places), len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        for i, place in enumerate(self.places.itertuples(index=False)):
+            values = [place.contacto, str(place.ranking), str(place.visitas),
+                      format_seconds(place.permanencia_s), str(place.puntos),
+                      f"{place.latitud:.6f}, {place.longitud:.6f}", str(place.radio_m),
+                      format_timestamp(int(place.primera_visita)), format_timestamp(int(place.ultima_visita))]
+            for col, value in enumerate(values):
+                self.table.setItem(i, col, QTableWidgetItem(value))
+        self.table.resizeColumnsToContents()
+        self.table.cellDoubleClicked.connect(self.go_to_place)
+        layout.addWidget(self.table)
+
+    def go_to_place(self, row, column):
+        if self.main_window:
+            place = self.places.iloc[row]
+            self.main_window.center_map(place['latitud'], place['longitud'], 17)
+
+############################################################
+# Tabla de posiciones filtradas (modelo/vista)
+############################################################
+
+class PositionsTableModel(QAbstractTableModel):
+    """
+    Modelo sobre un arreglo de filas del LocationDataset. Los textos se generan
+    solo para las celdas visibles y ordenar solo permuta el arreglo de filas.
+    """
+
+    COL_TIME, COL_NUMBER, COL_COORDS, COL_PLACE, COL_GO = range(5)
+    HEADERS = ["Fecha/Hora", "Contacto", "Coordenadas", "Lugar", "Ir"]
+
+    def __init__(self, dataset, parent=None):
+        super().__init__(parent)
+        self.dataset = dataset
+        self.rows = np.empty(0, dtype=np.int64)
+        self.sort_column = self.COL_TIME
+        self.sort_order = Qt.AscendingOrder
+
+    def set_dataset(self, dataset):
+        self.beginResetModel()
+        self.dataset = dataset
+        self.rows = np.empty(0, dtype=np.int64)
+        self.endResetModel()
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = self._sorted(rows, self.sort_column, self.sort_order)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return str(section + 1)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == Qt.UserRole:
+            return int(row)
+        if role != Qt.DisplayRole:
+            return None
+        ds = self.dataset
+        col = index.column()
+        if col == self.COL_TIME:
+            ts = int(ds.timestamps[row])
+            return format_timestamp(ts) if ts != ds.NO_TIMESTAMP else ""
+        if col == self.COL_NUMBER:
+            return ds.all_numbers[ds.codes[row]]
+        if col == self.COL_COORDS:
+            return f"{ds.latitudes[row]}, {ds.longitudes[row]}"
+        if col == self.COL_PLACE:
+            return ds.place_names[row] or "Sin nombre"
+        if col == self.COL_GO:
+            return "Ir"
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.layoutAboutToBeChanged.emit()
+        self.rows = self._sorted(self.rows, column, order)
+        self.layoutChanged.emit()
+
+    def _sorted(self, rows, column, order):
+        if len(rows) == 0:
+            return rows
+        ds = self.dataset
+        descending = order == Qt.DescendingOrder
+        if descending:
+            # Orden descendente estable: se ordenan las filas invertidas y se
+            # invierte el resultado, así las claves iguales conservan su orden
+            rows = rows[::-1]
+        if column == self.COL_NUMBER:
+            keys = np.lexsort((ds.timestamps[rows], ds.codes[rows]))
+        elif column == self.COL_COORDS:
+            keys = np.lexsort((ds.longitudes[rows], ds.latitudes[rows]))
+        elif column == self.COL_PLACE:
+            keys = np.argsort(ds.place_names[rows], kind='stable')
+        else:
+            keys = np.argsort(ds.timestamps[rows], kind='stable')
+        if descending:
+            keys = keys[::-1]
+        return rows[keys]
+
+
+class GoButtonDelegate(QStyledItemDelegate):
+    """Dibuja el botón "Ir" de cada fila y emite clicked(fila del dataset)."""
+
+    clicked = pyqtSignal(int)
+
+    @perftrace.traced('pintado')
+    def paint(self, painter, option, index):
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(2, 2, -2, -2)
+        button.text = "Ir"
+        button.state = QStyle.State_Enabled
+        if option.state & QStyle.State_MouseOver:
+            button.state |= QStyle.State_MouseOver
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.CE_PushButton, button, painter, option.widget)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and option.rect.contains(event.pos()):
+            self.clicked.emit(index.data(Qt.UserRole))
+            return True
+        return super().editorEvent(event, model, option, index)
+
 ############################################################
 # Ventana Principal
 ############################################################
 
 class MainWindow(QWidget):
-    def __init__(self):
+    def __init__(self, case_key=None):
         super().__init__()
+        # Teléfonos del caso (casos.json) y vista mostrada
+        self.sources, active = load_registry()
+        self.case_key = case_key or active
+        # Los datos llegan desde LocationLoader; mientras tanto, conjunto vacío
+        self.dataset = LocationDataset()
+        self.data_loaded = False
+        self.page_ready = False
         self.setWindowTitle("Visualización de Ubicaciones - Estilo WhatsApp")
         self.setStyleSheet("""
             QWidget {
@@ -294,7 +790,7 @@ class MainWindow(QWidget):
             QListWidget {
                 background-color: #DCF8C6;
             }
-            QTableWidget {
+            QTableWidget, QTableView {
                 background-color: #DCF8C6;
             }
             QFrame {
@@ -304,10 +800,12 @@ class MainWindow(QWidget):
             }
         """)
 
-        main_layout = QHBoxLayout(self)
+        main_layout = QVBoxLayout(self)
         splitter = QSplitter(self)
         splitter.setOrientation(Qt.Horizontal)
         main_layout.addWidget(splitter)
+        self.status_bar = QStatusBar()
+        main_layout.addWidget(self.status_bar)
 
         # Panel izquierdo (contactos)
         left_widget = QWidget()
@@ -331,17 +829,29 @@ class MainWindow(QWidget):
         self.count_table = QTableWidget()
         self.count_table.setColumnCount(2)
         self.count_table.setHorizontalHeaderLabels(["Número", "Total Ubicaciones"])
-        self.count_table.setRowCount(len(sorted_number_counts))
-        for i, (num, cnt) in enumerate(sorted_number_counts):
-            self.count_table.setItem(i, 0, QTableWidgetItem(num))
-            self.count_table.setItem(i, 1, QTableWidgetItem(str(cnt)))
-        self.count_table.resizeColumnsToContents()
+
+        self.status_label = QLabel("Cargando ubicaciones...")
+
+        # Selector de teléfono (solo si el caso tiene más de uno)
+        self.case_combo = QComboBox()
+        for key, label in case_choices(self.sources):
+            self.case_combo.addItem(label, key)
+        self.case_combo.setCurrentIndex(max(self.case_combo.findData(self.case_key), 0))
+        self.case_combo.currentIndexChanged.connect(self.switch_case)
+        self.case_combo.setVisible(len(self.sources) > 1)
+        left_layout.addWidget(self.case_combo)
 
         left_layout.addWidget(QLabel("<b>Contactos (que compartieron ubicación)</b>"))
+        left_layout.addWidget(self.status_label)
         left_layout.addWidget(self.filter_line)
         left_layout.addWidget(self.number_list)
         left_layout.addWidget(self.select_all_btn)
         left_layout.addWidget(self.clear_sel_btn)
+
+        self.places_btn = QPushButton("Lugares frecuentes")
+        self.places_btn.setToolTip("Lugares donde los contactos marcados estuvieron repetidamente (rango de fechas actual)")
+        self.places_btn.clicked.connect(self.show_frequent_places)
+        left_layout.addWidget(self.places_btn)
         left_layout.addWidget(QLabel("<b>Resumen por contacto</b>"))
         left_layout.addWidget(self.count_table)
         left_layout.addStretch()
@@ -355,19 +865,32 @@ class MainWindow(QWidget):
         date_filter_layout.addWidget(QLabel("Inicio:"))
         self.start_date = QDateTimeEdit()
         self.start_date.setCalendarPopup(True)
-        self.start_date.setDateTime(min_dt if min_dt else QDateTime.currentDateTime())
+        self.start_date.setDateTime(QDateTime.currentDateTime())
         date_filter_layout.addWidget(self.start_date)
 
         date_filter_layout.addWidget(QLabel("Fin:"))
         self.end_date = QDateTimeEdit()
         self.end_date.setCalendarPopup(True)
-        self.end_date.setDateTime(max_dt if max_dt else QDateTime.currentDateTime())
+        self.end_date.setDateTime(QDateTime.currentDateTime())
         date_filter_layout.addWidget(self.end_date)
 
         self.apply_date_filter_btn = QPushButton("Aplicar Filtro de Fecha")
         self.apply_date_filter_btn.clicked.connect(self.update_map_markers)
         date_filter_layout.addWidget(self.apply_date_filter_btn)
 
+        self.cluster_check = QCheckBox("Agrupar marcadores")
+        self.cluster_check.toggled.connect(self.apply_cluster_mode)
+        date_filter_layout.addWidget(self.cluster_check)
+
+        self.tracks_check = QCheckBox("Mostrar recorridos")
+        self.tracks_check.toggled.connect(self.update_map_markers)
+        date_filter_layout.addWidget(self.tracks_check)
+
+        self.heatmap_check = QCheckBox("Mapa de calor")
+        self.heatmap_check.setToolTip(f"Densidad en lugar de marcadores hasta el zoom {HEATMAP_MAX_ZOOM}")
+        self.heatmap_check.toggled.connect(self.update_map_markers)
+        date_filter_layout.addWidget(self.heatmap_check)
+
         right_layout.addLayout(date_filter_layout)
 
         # Mapa
@@ -376,17 +899,29 @@ class MainWindow(QWidget):
         self.webview.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
         self.channel = QWebChannel(self.webview.page())
-        self.bridge = Bridge(data_by_id)
+        self.bridge = Bridge(self.dataset)
         self.bridge.set_detail_callback(self.show_marker_detail)
+        self.bridge.viewportChanged.connect(self.on_viewport_changed)
         self.channel.registerObject('bridge', self.bridge)
         self.webview.page().setWebChannel(self.channel)
 
         def on_load_finished(ok):
             if ok:
-                self.update_map_markers()
+                self.page_ready = True
+                self.apply_cluster_mode()
+                if self.data_loaded:
+                    self.update_map_markers()
         
         self.webview.loadFinished.connect(on_load_finished)
-        self.webview.setHtml(map_html)
+
+        # Teselas desde el caché MBTiles local si existe; si no, OpenStreetMap en línea
+        self.tile_handler = install_mbtiles_handler(self.webview.page().profile())
+        if self.tile_handler:
+            reader = self.tile_handler.reader
+            page_html = build_map_html(MBTILES_TILE_URL, reader.min_zoom, reader.max_zoom)
+        else:
+            page_html = build_map_html()
+        self.webview.setHtml(page_html, QUrl.fromLocalFile(MAP_ASSETS_DIR + os.sep))
 
         # Layout para el mapa
         map_layout = QVBoxLayout()
@@ -411,9 +946,23 @@ class MainWindow(QWidget):
 
         positions_layout.addLayout(self.positions_title_layout)
 
-        self.positions_table = QTableWidget()
-        self.positions_table.setColumnCount(4)
-        self.positions_table.setHorizontalHeaderLabels(["Fecha/Hora", "Coordenadas", "Lugar", "Ir"])
+        # Vista virtual: solo se pintan las filas visibles, sin un widget por celda
+        self.positions_model = PositionsTableModel(self.dataset)
+        self.positions_table = QTableView()
+        self.positions_table.setModel(self.positions_model)
+        self.positions_table.setSortingEnabled(True)
+        self.positions_table.sortByColumn(PositionsTableModel.COL_TIME, Qt.AscendingOrder)
+        self.positions_table.verticalHeader().setDefaultSectionSize(24)
+        header = self.positions_table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        header.setSectionResizeMode(PositionsTableModel.COL_PLACE, QHeaderView.Stretch)
+        self.positions_table.setColumnWidth(PositionsTableModel.COL_TIME, 150)
+        self.positions_table.setColumnWidth(PositionsTableModel.COL_NUMBER, 190)
+        self.positions_table.setColumnWidth(PositionsTableModel.COL_COORDS, 230)
+        self.positions_table.setColumnWidth(PositionsTableModel.COL_GO, 50)
+        self.go_delegate = GoButtonDelegate(self.positions_table)
+        self.go_delegate.clicked.connect(self.go_to_row)
+        self.positions_table.setItemDelegateForColumn(PositionsTableModel.COL_GO, self.go_delegate)
         positions_layout.addWidget(self.positions_table)
 
         # Contenedor del mapa y la tabla de posiciones
@@ -434,10 +983,132 @@ class MainWindow(QWidget):
 
         self.last_marker_info = None
         self.is_minimized = False
+        # Filas ya enviadas al mapa, por contacto, y contactos visibles
+        self.sent_rows = {}
+        self.visible_numbers = set()
+        # Área visible informada por el mapa (None hasta el primer moveend)
+        self.viewport = None
+        self.viewport_moved = False
+        # Contactos y fechas de lo que muestra la tabla de posiciones
+        self.table_key = None
+        # Filas filtradas del área visible (antes de reducirlas) y los
+        # totales por celda del modo agrupado enviados al mapa
+        self.visible_rows = np.empty(0, dtype=np.int64)
+        self.sent_cluster_totals = None
+        # Recorridos en tiempo real (se construyen al activarlos) y lo
+        # enviado por contacto: (zoom, inicio, fin)
+        self.tracks = None
+        self.sent_tracks = {}
+        # Imágenes del mapa de calor en caché y la que está en el mapa
+        self.heatmap_cache = LruCache(max_items=HEAT_CACHE_SIZE, sizeof=lambda heat: len(heat["url"]))
+        self.sent_heatmap = None
+        self.places_dialog = None
+
+        # Hilos de carga activos (el actual y los de teléfonos anteriores) y
+        # su cargador
+        self.loader = None
+        self.loader_threads = {}
+
+        # Uso de memoria por componente (y el límite, si hay)
+        self.memory_label = QLabel()
+        self.status_bar.addPermanentWidget(self.memory_label)
+        self.memory_timer = QTimer(self)
+        self.memory_timer.setInterval(MEMORY_STATUS_INTERVAL_MS)
+        self.memory_timer.timeout.connect(self.update_memory_status)
+        self.memory_timer.start()
+        self.update_memory_status()
+
+        self.start_loading()
+
+    def update_memory_status(self):
+        # Las ubicaciones están en las tablas del caso (tables_memory)
+        components = tables_memory()
+        if self.tracks is not None:
+            components['recorridos'] = memory_budget.estimate_nbytes(self.tracks)
+        components['mapa de calor'] = self.heatmap_cache.nbytes
+        if self.tile_handler:
+            components['teselas'] = self.tile_handler.reader.cache_nbytes
+        self.memory_label.setText(memory_budget.format_usage(components))
+        self.memory_label.setStyleSheet("color: #B00020;" if memory_budget.over_budget() else "")
+
+    def start_loading(self):
+        """
+        Lanza la carga de ubicaciones en un hilo; la ventana se muestra ya.
+        Al cambiar de teléfono la carga anterior no se interrumpe: termina en
+        segundo plano, su resultado se descarta y el hilo y el cargador se
+        liberan al terminar (closeEvent espera a los que sigan activos).
+        """
+        thread = QThread(self)
+        loader = LocationLoader(open_case(self.case_key, self.sources))
+        loader.moveToThread(thread)
+        thread.started.connect(loader.run)
+        loader.loaded.connect(self.on_data_loaded)
+        loader.failed.connect(self.on_data_failed)
+        loader.loaded.connect(thread.quit)
+        loader.failed.connect(thread.quit)
+        thread.finished.connect(loader.deleteLater)
+        thread.finished.connect(self.on_loader_finished)
+        self.loader = loader
+        # La referencia mantiene vivo el cargador (sin padre) mientras corre
+        self.loader_threads[thread] = loader
+        thread.start()
+
+    def on_loader_finished(self):
+        thread = self.sender()
+        self.loader_threads.pop(thread, None)
+        thread.deleteLater()
+
+    def on_data_loaded(self, dataset):
+        if self.sender() is not self.loader:
+            return  # carga de un teléfono que ya no se muestra
+        self.dataset = dataset
+        self.data_loaded = True
+        self.bridge.dataset = dataset
+        self.positions_model.set_dataset(dataset)
+        self.reset_map_markers()
+        self.status_label.setText(f"{len(dataset)} ubicaciones de {len(dataset.all_numbers)} contactos")
+
+        self.load_number_list()
+
+        self.count_table.setRowCount(len(dataset.sorted_number_counts))
+        for i, (num, cnt) in enumerate(dataset.sorted_number_counts):
+            self.count_table.setItem(i, 0, QTableWidgetItem(num))
+            self.count_table.setItem(i, 1, QTableWidgetItem(str(cnt)))
+        self.count_table.resizeColumnsToContents()
+
+        if len(dataset) > CLUSTER_AUTO_THRESHOLD:
+            self.cluster_check.setChecked(True)
+            self.heatmap_check.setChecked(True)
+
+        self.start_date.setDateTime(dataset.min_dt if dataset.min_dt else QDateTime.currentDateTime())
+        self.end_date.setDateTime(dataset.max_dt if dataset.max_dt else QDateTime.currentDateTime())
+
+        if self.page_ready:
+            self.update_map_markers()
+
+    def switch_case(self, combo_index):
+        """Muestra otro teléfono (o todos): carga en segundo plano, o al instante si ya está."""
+        case_key = self.case_combo.itemData(combo_index)
+        if case_key == self.case_key:
+            return
+        self.case_key = case_key
+        self.status_label.setText("Cargando ubicaciones...")
+        self.start_loading()
+
+    def on_data_failed(self, message):
+        if self.sender() is not self.loader:
+            return
+        self.status_label.setText(f"Error al cargar ubicaciones: {message}")
+
+    def closeEvent(self, event):
+        for thread in list(self.loader_threads):
+            thread.quit()
+            thread.wait()
+        super().closeEvent(event)
 
     def load_number_list(self):
         self.number_list.clear()
-        for num in all_numbers:
+        for num in self.dataset.all_numbers:
             item = QListWidgetItem(num)
             item.setFlags(item.flags() | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
             # Desmarcado por defecto
@@ -446,7 +1117,7 @@ class MainWindow(QWidget):
 
     def filter_numbers(self, text):
         self.number_list.clear()
-        filtered = [n for n in all_numbers if text.lower() in n.lower()]
+        filtered = [n for n in self.dataset.all_numbers if text.lower() in n.lower()]
         for num in filtered:
             item = QListWidgetItem(num)
             item.setFlags(item.flags() | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
@@ -455,15 +1126,20 @@ class MainWindow(QWidget):
         self.update_map_markers()
 
     def select_all_numbers(self):
+        # Sin señales por ítem: una sola actualización al final
+        self.number_list.blockSignals(True)
         for i in range(self.number_list.count()):
             item = self.number_list.item(i)
             item.setCheckState(Qt.Checked)
+        self.number_list.blockSignals(False)
         self.update_map_markers()
 
     def clear_selection(self):
+        self.number_list.blockSignals(True)
         for i in range(self.number_list.count()):
             item = self.number_list.item(i)
             item.setCheckState(Qt.Unchecked)
+        self.number_list.blockSignals(False)
         self.update_map_markers()
 
     def minimize_positions(self):
@@ -480,77 +1156,273 @@ class MainWindow(QWidget):
         dlg = DetailDialog(info=record, main_window=self)
         dlg.exec_()
 
+    @perftrace.traced('filtro')
     def update_map_markers(self):
-        if self.webview is None:
+        """
+        Sincroniza el mapa con el filtro actual enviando solo diferencias.
+        De cada contacto marcado se envían únicamente sus puntos dentro del
+        área visible (consultada en el índice espacial y reducida al tope del
+        zoom actual); al marcar/desmarcar se muestra u oculta su grupo de
+        capas. La tabla de posiciones sigue mostrando todo lo filtrado y
+        solo se rehace cuando cambian los contactos o las fechas (no al
+        mover el mapa, para no perder su desplazamiento ni su selección).
+        """
+        if self.webview is None or not self.page_ready:
             return
 
         # Contactos chequeados
-        checked_numbers = []
+        checked_numbers = set()
         for i in range(self.number_list.count()):
             item = self.number_list.item(i)
             if item.checkState() == Qt.Checked:
-                checked_numbers.append(item.text())
+                checked_numbers.add(item.text())
 
         # Filtrar por fechas
-        start_dt = self.start_date.dateTime().toPyDateTime()
-        end_dt = self.end_date.dateTime().toPyDateTime()
-
-        # Filtrar datos
-        filtered_data = []
-        for d_item in data:
-            if d_item["number"] in checked_numbers:
-                dt = timestamp_to_datetime(d_item["timestamp"])
-                if dt and start_dt <= dt <= end_dt:
-                    filtered_data.append(d_item)
-
-        # Limpiar marcadores en el mapa
-        js_clear = """
-            Object.values(markersDict).forEach(function(mObj) {
-                map.removeLayer(mObj.marker);
-            });
-            markersDict = {};
-        """
-        self.webview.page().runJavaScript(js_clear)
-
-        # Agregar marcadores filtrados
-        for d_item in filtered_data:
-            number = d_item["number"]
-            lat = d_item["latitude"]
-            lon = d_item["longitude"]
-            place = d_item["place_name"]
-            ts = format_timestamp(d_item["timestamp"])
-            if d_item["live_duration"] > 0 and d_item["final_lat"] is not None and d_item["final_lon"] is not None:
-                live = 'final'
-            elif d_item["live_duration"] > 0:
-                live = 'true'
-            else:
-                live = 'false'
-            id_val = d_item["id"]
-            js_add_marker = f"addMarker({id_val}, {lat}, {lon}, '{number}', '{ts}', '{live}', '{place}');"
-            self.webview.page().runJavaScript(js_add_marker)
+        start_ms = int(self.start_date.dateTime().toPyDateTime().timestamp() * 1000)
+        end_ms = int(self.end_date.dateTime().toPyDateTime().timestamp() * 1000)
+
+        # Filtrar datos: una búsqueda binaria por contacto sobre las filas ordenadas
+        ds = self.dataset
+        numbers = sorted(checked_numbers)
+        filtered_parts = [ds.contact_rows(number, start_ms, end_ms) for number in numbers]
+        filtered_rows = np.concatenate(filtered_parts) if filtered_parts else np.empty(0, dtype=np.int64)
+        # En vista lejana con mapa de calor no se envían marcadores
+        zoom = self.current_zoom()
+        heat_mode = self.heatmap_check.isChecked() and zoom <= HEATMAP_MAX_ZOOM
+        if heat_mode:
+            in_view = visible = np.empty(0, dtype=np.int64)
+        else:
+            visible = self.rows_in_view(filtered_rows)
+            in_view = thin_rows(ds, visible, zoom, viewport_marker_cap(zoom))
+
+        to_add = []
+        to_remove = []
+        for number in numbers:
+            # Las filas de un contacto son un bloque contiguo: su tramo en in_view
+            code = ds.code_of[number]
+            lo, hi = np.searchsorted(in_view, [ds.starts[code], ds.ends[code]])
+            rows = in_view[lo:hi]
+            current = self.sent_rows.get(number, np.empty(0, dtype=np.int64))
+            to_remove.append(np.setdiff1d(current, rows, assume_unique=True))
+            to_add.append(np.setdiff1d(rows, current, assume_unique=True))
+            self.sent_rows[number] = rows
+        if self.viewport_moved:
+            # Los contactos ocultos no se actualizan al mover el mapa: se
+            # descartan sus marcadores y se vuelven a pedir al marcarlos
+            for number in [n for n in self.sent_rows if n not in checked_numbers]:
+                to_remove.append(self.sent_rows.pop(number))
+            self.viewport_moved = False
+        to_remove = np.concatenate(to_remove) if to_remove else np.empty(0, dtype=np.int64)
+        to_add = np.concatenate(to_add) if to_add else np.empty(0, dtype=np.int64)
+
+        visibility = {number: False for number in self.visible_numbers - checked_numbers}
+        visibility.update({number: True for number in checked_numbers - self.visible_numbers})
+        self.visible_numbers = checked_numbers
+
+        if len(to_remove):
+            self.run_script(f"removeMarkers({json.dumps(ds.ids[to_remove].tolist())});", 'removeMarkers')
+        self.send_markers(self.marker_payloads(to_add))
+        if visibility:
+            self.run_script(f"setContactsVisible({json.dumps(visibility)});", 'setContactsVisible')
+
+        self.visible_rows = visible
+        self.update_cluster_totals()
+        self.update_heatmap(filtered_rows if heat_mode else None,
+                            (frozenset(checked_numbers), start_ms, end_ms, zoom))
+        self.update_tracks(checked_numbers, start_ms, end_ms)
 
         # Actualizar la tabla de posiciones filtradas
-        self.update_positions_table(filtered_data)
+        table_key = (frozenset(checked_numbers), start_ms, end_ms)
+        if table_key != self.table_key:
+            self.table_key = table_key
+            self.update_positions_table(filtered_rows)
 
-    def update_positions_table(self, filtered_data):
-        self.positions_table.clearContents()
-        self.positions_table.setRowCount(len(filtered_data))
-        for i, d_item in enumerate(filtered_data):
-            ts_str = format_timestamp(d_item["timestamp"])
-            lat = d_item["latitude"]
-            lon = d_item["longitude"]
-            coords_str = f"{lat}, {lon}"
-            place = d_item["place_name"] if d_item["place_name"] else "Sin nombre"
+    def update_tracks(self, checked_numbers, start_ms, end_ms):
+        """
+        Dibuja los recorridos en tiempo real de los contactos marcados,
+        simplificados para el zoom actual. Solo se reenvían los contactos
+        cuyo zoom o rango de fechas cambió.
+        """
+        if self.tracks_check.isChecked():
+            if self.tracks is None:
+                self.tracks = LiveTracks(self.dataset)
+            zoom = self.current_zoom()
+            wanted = {number for number in checked_numbers if self.tracks.has_track(number)}
+        else:
+            wanted = set()
+
+        changes = {number: None for number in self.sent_tracks if number not in wanted}
+        for number in wanted:
+            key = (zoom, start_ms, end_ms)
+            if self.sent_tracks.get(number) != key:
+                changes[number] = {
+                    "color": self.tracks.color(number),
+                    "lines": self.tracks.polylines(number, zoom, start_ms, end_ms),
+                }
+                self.sent_tracks[number] = key
+        for number in [n for n, track in changes.items() if track is None]:
+            del self.sent_tracks[number]
+        if changes:
+            self.run_script(f"setTracks({json.dumps(changes)});", 'setTracks')
+
+    def update_heatmap(self, rows, key):
+        """
+        Muestra la densidad de las filas dadas (None o vacías: quita la capa).
+        key identifica selección, rango de fechas y zoom; la imagen de cada
+        key se calcula una vez y queda en caché. Las filas sin coordenadas
+        (NULL en la base, NaN en el dataset) no cuentan.
+        """
+        if rows is not None:
+            x, y = self.dataset.mercator_xy
+            rows = rows[np.isfinite(x[rows]) & np.isfinite(y[rows])]
+        if rows is None or len(rows) == 0:
+            key = None
+        if key == self.sent_heatmap:
+            return
+        self.sent_heatmap = key
+        heat = self.heatmap_cache.get_or_compute(key, lambda: self.heatmap_overlay(rows, key[-1])) if key else None
+        self.run_script(f"setHeatmap({json.dumps(heat)});", 'setHeatmap')
+
+    @perftrace.traced('pandas')
+    def heatmap_overlay(self, rows, zoom):
+        """Imagen PNG (data URL) y límites de la densidad de las filas al zoom dado."""
+        x, y = self.dataset.mercator_xy
+        counts, (x0, y0, x1, y1) = density_grid(x[rows], y[rows], zoom)
+        rgba = np.ascontiguousarray(colorize(counts))
+        height, width = counts.shape
+        image = QImage(rgba.data, width, height, 4 * width, QImage.Format_RGBA8888)
+        buffer = QBuffer()
+        buffer.open(QIODevice.WriteOnly)
+        image.save(buffer, "PNG")
+        url = "data:image/png;base64," + base64.b64encode(bytes(buffer.data())).decode("ascii")
+        (south, north), (west, east) = unproject([x0, x1], [y1, y0])
+        return {"url": url, "bounds": [[float(south), float(west)], [float(north), float(east)]]}
+
+    def current_zoom(self):
+        """Zoom del mapa (el inicial, 2, hasta el primer aviso del mapa)."""
+        return self.viewport["zoom"] if self.viewport else 2
+
+    def on_viewport_changed(self, viewport):
+        """El mapa terminó de moverse: se envían los puntos de la nueva área."""
+        self.viewport = viewport
+        self.viewport_moved = True
+        if self.data_loaded:
+            self.update_map_markers()
+
+    @perftrace.traced('filtro')
+    def rows_in_view(self, rows):
+        """De las filas dadas (ordenadas), las que caen en el área visible ampliada en VIEWPORT_PAD."""
+        if len(rows) == 0:
+            return rows
+        if self.viewport is None:
+            # Antes del primer aviso del mapa: vista inicial (mundo)
+            south, west, north, east = -90.0, -180.0, 90.0, 180.0
+        else:
+            v = self.viewport
+            pad_lat = (v["north"] - v["south"]) * VIEWPORT_PAD
+            pad_lon = (v["east"] - v["west"]) * VIEWPORT_PAD
+            south, north = v["south"] - pad_lat, v["north"] + pad_lat
+            west, east = v["west"] - pad_lon, v["east"] + pad_lon
+
+        in_view = self.dataset.grid.query(south, west, north, east)
+        # Intersección de dos arreglos ordenados: búsqueda binaria de cada
+        # fila del área en las filas filtradas
+        pos = np.searchsorted(rows, in_view)
+        found = pos < len(rows)
+        found[found] = rows[pos[found]] == in_view[found]
+        return in_view[found]
+
+    @perftrace.traced('pandas')
+    def cluster_totals(self, rows, zoom):
+        """
+        Ubicaciones por celda del modo agrupado ('x:y', como renderClusters
+        en el mapa) contando todas las filas dadas, no solo las enviadas.
+        """
+        x, y = self.dataset.mercator_xy
+        x, y = x[rows], y[rows]
+        finite = np.isfinite(x) & np.isfinite(y)
+        scale = 256.0 * 2 ** zoom / CLUSTER_CELL_PX
+        cx = np.floor(x[finite] * scale).astype(np.int64)
+        cy = np.floor(y[finite] * scale).astype(np.int64)
+        width = int(scale) + 2
+        keys, counts = np.unique(cx * width + cy, return_counts=True)
+        return {f"{key // width}:{key % width}": int(count)
+                for key, count in zip(keys.tolist(), counts.tolist())}
+
+    def update_cluster_totals(self):
+        """
+        En modo agrupado envía al mapa el total real de cada celda: los
+        marcadores del área visible son una muestra (viewport_marker_cap) y
+        contarlos en el mapa daría menos ubicaciones de las que hay.
+        """
+        zoom = self.current_zoom()
+        totals = None
+        if self.cluster_check.isChecked() and zoom < CLUSTER_MAX_ZOOM and len(self.visible_rows):
+            totals = {"zoom": zoom, "counts": self.cluster_totals(self.visible_rows, zoom)}
+        if totals != self.sent_cluster_totals:
+            self.sent_cluster_totals = totals
+            self.run_script(f"setClusterTotals({json.dumps(totals)});", 'setClusterTotals')
+
+    def apply_cluster_mode(self):
+        """Activa o desactiva el modo agrupado (círculos en canvas) en el mapa."""
+        if self.page_ready:
+            enabled = 'true' if self.cluster_check.isChecked() else 'false'
+            self.webview.page().runJavaScript(f"setClusterMode({enabled});")
+            self.update_cluster_totals()
+
+    def reset_map_markers(self):
+        """Vacía el mapa y el registro de marcadores enviados."""
+        self.sent_rows = {}
+        self.visible_numbers = set()
+        self.tracks = None
+        self.sent_tracks = {}
+        self.heatmap_cache.clear()
+        self.sent_heatmap = None
+        self.table_key = None
+        self.visible_rows = np.empty(0, dtype=np.int64)
+        self.sent_cluster_totals = None
+        if self.page_ready:
+            self.webview.page().runJavaScript("clearMarkers();")
+
+    def show_frequent_places(self):
+        """
+        Calcula los lugares frecuentes de las posiciones filtradas (todas si
+        no hay contactos marcados), los dibuja en el mapa y abre el resumen.
+        """
+        rows = self.positions_model.rows
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            places = find_places(self.dataset, rows if len(rows) else None)
+        finally:
+            QApplication.restoreOverrideCursor()
+        places = places[places['ranking'] <= PLACES_PER_CONTACT]
+        if self.places_dialog is not None:
+            self.places_dialog.close()
+
+        payload = [
+            {
+                "lat": place.latitud,
+                "lon": place.longitud,
+                "radius": place.radio_m,
+                "label": f"{place.contacto} - lugar {place.ranking}: {place.visitas} visitas, "
+                         f"{format_seconds(place.permanencia_s)}",
+            }
+            for place in places.itertuples(index=False)
+        ]
+        self.run_script(f"setPlaces({json.dumps(payload)});", 'setPlaces')
 
-            self.positions_table.setItem(i, 0, QTableWidgetItem(ts_str))
-            self.positions_table.setItem(i, 1, QTableWidgetItem(coords_str))
-            self.positions_table.setItem(i, 2, QTableWidgetItem(place))
+        self.places_dialog = PlacesDialog(places, self, main_window=self)
+        self.places_dialog.finished.connect(lambda _: self.webview.page().runJavaScript("setPlaces([]);"))
+        self.places_dialog.show()
 
-            btn = QPushButton("Ir")
-            btn.clicked.connect(lambda _, idx=i: self.go_to_marker(filtered_data[idx]))
-            self.positions_table.setCellWidget(i, 3, btn)
+    def center_map(self, lat, lon, zoom):
+        self.webview.page().runJavaScript(f"map.setView([{lat}, {lon}], {zoom});")
 
-        self.positions_table.resizeColumnsToContents()
+    def update_positions_table(self, filtered_rows):
+        self.positions_model.set_rows(filtered_rows)
+
+    def go_to_row(self, row):
+        self.go_to_marker(self.dataset.record(row))
 
     def go_to_marker(self, record):
         # Llama a la función JS highlightMarker para centrar y resaltar el marcador
@@ -562,16 +1434,60 @@ class MainWindow(QWidget):
 
     def place_final_marker(self, lat, lon):
         # Añade un marcador adicional en la ubicación final en el mapa (marcador final en rojo)
-        number = "Final"
-        ts_str = "Ubicación Final"
-        live = "final"
-        final_label = "Posición Final"
-        id_val = 999999  # ID ficticio
-        js_add_marker = f"addMarker({id_val}, {lat}, {lon}, '{number}', '{ts_str}', '{live}', '{final_label}');"
-        self.webview.page().runJavaScript(js_add_marker)
-
+        self.send_markers([{
+            "id": 999999,  # ID ficticio
+            "lat": lat,
+            "lon": lon,
+            "number": "Final",
+            "ts": "Ubicación Final",
+            "live": "final",
+            "place": "Posición Final",
+        }])
+        self.webview.page().runJavaScript('setContactsVisible({"Final": true});')
+
+    @perftrace.traced('pandas')
+    def marker_payloads(self, rows):
+        """Datos de los marcadores para las filas dadas (columnas vectorizadas)."""
+        ds = self.dataset
+        live_duration = ds.live_durations[rows]
+        has_final = ~np.isnan(ds.final_latitudes[rows]) & ~np.isnan(ds.final_longitudes[rows])
+        live = np.where(live_duration > 0, np.where(has_final, 'final', 'true'), 'false')
+        numbers = ds.all_numbers
+        return [
+            {
+                "id": id_val,
+                "lat": lat,
+                "lon": lon,
+                "number": numbers[code],
+                "ts": format_timestamp(ts),
+                "live": live_val,
+                "place": place,
+            }
+            for id_val, lat, lon, code, ts, live_val, place in zip(
+                ds.ids[rows].tolist(), ds.latitudes[rows].tolist(), ds.longitudes[rows].tolist(),
+                ds.codes[rows].tolist(), ds.timestamps[rows].tolist(), live.tolist(),
+                ds.place_names[rows].tolist())
+        ]
+
+    def send_markers(self, payloads):
+        """Envía los marcadores al mapa en lotes: una llamada JS por lote."""
+        for start in range(0, len(payloads), MARKER_BATCH_SIZE):
+            batch = payloads[start:start + MARKER_BATCH_SIZE]
+            self.run_script(f"addMarkers({json.dumps(batch)});", 'addMarkers', marcadores=len(batch))
+
+    def run_script(self, code, label, **args):
+        """
+        runJavaScript de un lote de datos. Con perftrace activo se mide de ida
+        y vuelta: desde el envío hasta que el mapa terminó de ejecutarlo.
+        """
+        token = perftrace.begin_async(label, 'js', bytes=len(code), **args)
+        if token is None:
+            self.webview.page().runJavaScript(code)
+        else:
+            self.webview.page().runJavaScript(code, lambda _: perftrace.end_async(token))
 
 if __name__ == "__main__":
+    register_mbtiles_scheme()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.showMaximized()
@@ -0,0 +1,248 @@
+"""
+Ubicaciones de msgstore.db en columnas NumPy (LocationDataset), su índice
+espacial y la carga desde la base. Las usan loc4.py (mapa), places.py,
+tracks.py y el análisis por lotes de wpa_cli.py.
+
+Sin dependencias de Qt.
+"""
+import datetime
+
+import numpy as np
+
+import perftrace
+from case_data import DATABASE_PATH
+from msgstore import get_repository
+from tracks import mercator
+
+# Índice espacial: tamaño de celda de la rejilla (grados)
+GRID_CELL_DEG = 0.25
+
+# Vista combinada de varios teléfonos: los _id de cada uno se desplazan en
+# este múltiplo para que no se repitan
+MERGED_ID_STRIDE = 10 ** 9
+
+
+def format_timestamp(ts):
+    """Convierte timestamp (en milisegundos) a cadena con fecha y hora."""
+    if ts and isinstance(ts, int):
+        dt = datetime.datetime.fromtimestamp(ts / 1000.0)
+        return dt.strftime('%Y-%m-%d %H:%M:%S')
+    return str(ts)
+
+
+def timestamp_to_datetime(ts):
+    """Convierte timestamp (milisegundos) a un objeto datetime."""
+    if ts and isinstance(ts, int):
+        return datetime.datetime.fromtimestamp(ts / 1000.0)
+    return None
+
+
+class LocationDataset:
+    """
+    Ubicaciones compartidas en columnas NumPy, ordenadas por (contacto, timestamp).
+
+    Las filas de cada contacto forman un bloque contiguo [starts[c], ends[c])
+    ordenado por tiempo, así que filtrar por (contactos, inicio, fin) es una
+    búsqueda binaria por contacto y el resultado es un arreglo de índices de
+    fila, no una lista de diccionarios.
+    """
+
+    # Timestamps nulos: quedan antes de cualquier inicio de filtro
+    NO_TIMESTAMP = np.iinfo(np.int64).min
+
+    @perftrace.traced('pandas', 'LocationDataset')
+    def __init__(self, rows=()):
+        rows = list(rows)
+        columns = list(zip(*rows)) if rows else [()] * 13
+
+        numbers = np.array([n if n is not None else "" for n in columns[1]], dtype=object)
+        self.all_numbers = sorted(set(numbers.tolist()))
+        code_of = {num: i for i, num in enumerate(self.all_numbers)}
+        codes = np.array([code_of[n] for n in numbers.tolist()], dtype=np.int64)
+
+        ts = np.array([t if t is not None else self.NO_TIMESTAMP for t in columns[11]], dtype=np.int64)
+
+        # Orden por contacto y, dentro de cada contacto, por tiempo
+        order = np.lexsort((ts, codes))
+        self.codes = codes[order]
+        self.timestamps = ts[order]
+        self.ids = np.array(columns[0], dtype=np.int64)[order]
+        self.latitudes = self._float_column(columns[2])[order]
+        self.longitudes = self._float_column(columns[3])[order]
+        self.place_names = np.array([v if v else "" for v in columns[4]], dtype=object)[order]
+        self.place_addresses = np.array([v if v else "" for v in columns[5]], dtype=object)[order]
+        self.urls = np.array([v if v else "" for v in columns[6]], dtype=object)[order]
+        self.live_durations = np.array([v if v else 0 for v in columns[7]], dtype=np.int64)[order]
+        self.final_latitudes = self._float_column(columns[8])[order]
+        self.final_longitudes = self._float_column(columns[9])[order]
+        self.final_timestamps = np.array(columns[10], dtype=object)[order]
+        # Secuencia de la ubicación en tiempo real (-1 si no hay)
+        sequence = columns[12] if len(columns) > 12 else [None] * len(order)
+        self.sequence_numbers = np.array([v if v is not None else -1 for v in sequence], dtype=np.int64)[order]
+
+        n_numbers = len(self.all_numbers)
+        self.starts = np.searchsorted(self.codes, np.arange(n_numbers), side='left')
+        self.ends = np.searchsorted(self.codes, np.arange(n_numbers), side='right')
+        self.code_of = code_of
+        self._grid = None
+        self._mercator = None
+        self.row_of_id = {message_id: row for row, message_id in enumerate(self.ids.tolist())}
+
+        # Conteo por número, ordenado por número de puntos compartidos (desc)
+        counts = (self.ends - self.starts).tolist()
+        self.number_counts = dict(zip(self.all_numbers, counts))
+        self.sorted_number_counts = sorted(self.number_counts.items(), key=lambda x: x[1], reverse=True)
+
+        # Determinar el rango de fechas global
+        valid_ts = self.timestamps[self.timestamps != self.NO_TIMESTAMP]
+        if len(valid_ts):
+            min_ts = int(valid_ts.min())
+            max_ts = int(valid_ts.max())
+        else:
+            # Si no hay datos, usar ahora
+            now_ts = int(datetime.datetime.now().timestamp() * 1000)
+            min_ts, max_ts = now_ts, now_ts
+
+        self.min_dt = timestamp_to_datetime(min_ts)
+        self.max_dt = timestamp_to_datetime(max_ts)
+
+    @staticmethod
+    def _float_column(values):
+        return np.array([v if v is not None else np.nan for v in values], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def contact_rows(self, number, start_ms, end_ms):
+        """Filas (ordenadas por tiempo) de un contacto con start_ms <= ts <= end_ms."""
+        code = self.code_of.get(number)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        first, last = self.starts[code], self.ends[code]
+        block = self.timestamps[first:last]
+        lo = first + np.searchsorted(block, start_ms, side='left')
+        hi = first + np.searchsorted(block, end_ms, side='right')
+        return np.arange(lo, hi, dtype=np.int64)
+
+    def query(self, numbers, start_ms, end_ms):
+        """Filas de los contactos dados en el rango [start_ms, end_ms] (ms)."""
+        parts = [self.contact_rows(number, start_ms, end_ms) for number in numbers]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(parts)
+
+    def record(self, row):
+        """Diccionario con los datos de una fila (para el detalle y la tabla)."""
+        ts = int(self.timestamps[row])
+        return {
+            "id": int(self.ids[row]),
+            "number": self.all_numbers[self.codes[row]],
+            "latitude": self._optional_float(self.latitudes[row]),
+            "longitude": self._optional_float(self.longitudes[row]),
+            "place_name": self.place_names[row],
+            "place_address": self.place_addresses[row],
+            "url": self.urls[row],
+            "live_duration": int(self.live_durations[row]),
+            "final_lat": self._optional_float(self.final_latitudes[row]),
+            "final_lon": self._optional_float(self.final_longitudes[row]),
+            "final_ts": self.final_timestamps[row],
+            "timestamp": ts if ts != self.NO_TIMESTAMP else None
+        }
+
+    def record_by_id(self, message_id):
+        row = self.row_of_id.get(message_id)
+        return self.record(row) if row is not None else None
+
+    @staticmethod
+    def _optional_float(value):
+        return None if np.isnan(value) else float(value)
+
+    @property
+    def mercator_xy(self):
+        """Coordenadas Web Mercator normalizadas (x, y) de todas las filas."""
+        if self._mercator is None:
+            self._mercator = mercator(self.latitudes, self.longitudes)
+        return self._mercator
+
+    @property
+    def grid(self):
+        """Índice espacial (se construye la primera vez que se consulta)."""
+        if self._grid is None:
+            self._grid = LocationGridIndex(self.latitudes, self.longitudes)
+        return self._grid
+
+
+class LocationGridIndex:
+    """
+    Índice espacial en rejilla sobre las columnas lat/lon del LocationDataset.
+
+    Cada fila cae en una celda de GRID_CELL_DEG grados; las filas se guardan
+    ordenadas por clave de celda (fila_lat * columnas + col_lon), así que las
+    celdas de una misma franja de latitud dentro de un rectángulo son un tramo
+    contiguo y la consulta es una búsqueda binaria por franja.
+    """
+
+    def __init__(self, latitudes, longitudes, cell_deg=None):
+        self.cell_deg = cell_deg or GRID_CELL_DEG
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.n_lat = int(np.ceil(180.0 / self.cell_deg))
+        self.n_lon = int(np.ceil(360.0 / self.cell_deg))
+
+        rows = np.flatnonzero(~np.isnan(latitudes) & ~np.isnan(longitudes))
+        keys = self._keys(latitudes[rows], longitudes[rows])
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.rows = rows[order]
+
+    def _cells(self, lat, lon):
+        lat_cell = np.clip(np.floor((np.asarray(lat) + 90.0) / self.cell_deg), 0, self.n_lat - 1)
+        lon_cell = np.clip(np.floor((np.asarray(lon) + 180.0) / self.cell_deg), 0, self.n_lon - 1)
+        return lat_cell.astype(np.int64), lon_cell.astype(np.int64)
+
+    def _keys(self, lat, lon):
+        lat_cell, lon_cell = self._cells(lat, lon)
+        return lat_cell * self.n_lon + lon_cell
+
+    def query(self, south, west, north, east):
+        """Filas (ordenadas) cuyas coordenadas caen dentro del rectángulo dado."""
+        south, north = max(south, -90.0), min(north, 90.0)
+        if east - west >= 360.0:
+            west, east = -180.0, 180.0
+        west, east = max(west, -180.0), min(east, 180.0)
+        if len(self.rows) == 0 or south > north or west > east:
+            return np.empty(0, dtype=np.int64)
+
+        (lat0, lat1), (lon0, lon1) = self._cells([south, north], [west, east])
+        bands = np.arange(lat0, lat1 + 1, dtype=np.int64) * self.n_lon
+        lo = np.searchsorted(self.keys, bands + lon0, side='left')
+        hi = np.searchsorted(self.keys, bands + lon1, side='right')
+        parts = [self.rows[a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.concatenate(parts)
+
+        # Las celdas del borde pueden salirse del rectángulo: filtro exacto
+        lat = self.latitudes[candidates]
+        lon = self.longitudes[candidates]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return np.sort(candidates[inside])
+
+
+def load_location_dataset(db_path=DATABASE_PATH):
+    """Lee las ubicaciones de msgstore.db (msgstore.py) y construye un LocationDataset."""
+    return LocationDataset(get_repository(db_path).rows('locations'))
+
+
+def merge_location_datasets(parts, names):
+    """LocationDataset con las ubicaciones de varios teléfonos (cases.MergedCase)."""
+    rows = []
+    for i, ds in enumerate(parts):
+        numbers = np.array(ds.all_numbers, dtype=object)[ds.codes]
+        timestamps = [t if t != ds.NO_TIMESTAMP else None for t in ds.timestamps.tolist()]
+        rows.extend(zip((ds.ids + i * MERGED_ID_STRIDE).tolist(), numbers.tolist(),
+                        ds.latitudes.tolist(), ds.longitudes.tolist(), ds.place_names.tolist(),
+                        ds.place_addresses.tolist(), ds.urls.tolist(), ds.live_durations.tolist(),
+                        ds.final_latitudes.tolist(), ds.final_longitudes.tolist(),
+                        ds.final_timestamps.tolist(), timestamps, ds.sequence_numbers.tolist()))
+    return LocationDataset(rows)
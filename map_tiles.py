@@ -0,0 +1,126 @@
+import os
+import sqlite3
+from urllib.request import pathname2url
+
+from PyQt5.QtCore import QBuffer, QIODevice
+from PyQt5.QtWebEngineCore import (QWebEngineUrlScheme, QWebEngineUrlSchemeHandler,
+                                   QWebEngineUrlRequestJob)
+
+from memory_budget import LruCache
+
+MBTILES_SCHEME = b'mbtiles'
+
+# Ruta del caché de teselas (se puede cambiar con la variable de entorno WPA_MBTILES)
+MBTILES_PATH = os.environ.get(
+    'WPA_MBTILES',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tiles', 'mapa.mbtiles'),
+)
+
+# Teselas guardadas en memoria (LRU)
+TILE_CACHE_SIZE = 1024
+
+TILE_MIME_TYPES = {
+    'png': b'image/png',
+    'jpg': b'image/jpeg',
+    'jpeg': b'image/jpeg',
+    'webp': b'image/webp',
+}
+
+
+class MBTilesReader:
+    """
+    Lee teselas raster de un archivo MBTiles (SQLite) en modo solo lectura,
+    con un LRU en memoria de las teselas ya leídas.
+    """
+
+    def __init__(self, path, cache_size=TILE_CACHE_SIZE):
+        self.path = path
+        self._cache = LruCache(max_items=cache_size, sizeof=len)
+        uri = 'file:' + pathname2url(os.path.abspath(path)) + '?mode=ro'
+        self.conn = sqlite3.connect(uri, uri=True)
+        self.metadata = dict(self.conn.execute("SELECT name, value FROM metadata").fetchall())
+
+    @property
+    def mime_type(self):
+        return TILE_MIME_TYPES.get(self.metadata.get('format', 'png'), b'image/png')
+
+    @property
+    def cache_nbytes(self):
+        return self._cache.nbytes
+
+    @property
+    def min_zoom(self):
+        return int(self.metadata.get('minzoom', 0))
+
+    @property
+    def max_zoom(self):
+        return int(self.metadata.get('maxzoom', 19))
+
+    def get_tile(self, z, x, y):
+        """Tesela en esquema XYZ (como Leaflet); MBTiles guarda las filas en TMS."""
+        key = (z, x, y)
+        if key in self._cache:
+            return self._cache.get(key)
+        row = self.conn.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+            (z, x, (1 << z) - 1 - y),
+        ).fetchone()
+        data = bytes(row[0]) if row else None
+        self._cache.put(key, data)
+        return data
+
+    def close(self):
+        self.conn.close()
+
+
+class MBTilesSchemeHandler(QWebEngineUrlSchemeHandler):
+    """Responde las URL mbtiles://tiles/{z}/{x}/{y}.png desde un MBTilesReader."""
+
+    def __init__(self, reader, parent=None):
+        super().__init__(parent)
+        self.reader = reader
+
+    def requestStarted(self, job):
+        parts = job.requestUrl().path().strip('/').split('/')
+        try:
+            z, x = int(parts[-3]), int(parts[-2])
+            y = int(parts[-1].split('.')[0])
+        except (IndexError, ValueError):
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        data = self.reader.get_tile(z, x, y)
+        if data is None:
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        # El buffer vive mientras viva el job
+        buffer = QBuffer(job)
+        buffer.setData(data)
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(self.reader.mime_type, buffer)
+
+
+def register_mbtiles_scheme():
+    """Registra el esquema mbtiles://; debe llamarse antes de crear QApplication."""
+    if QWebEngineUrlScheme.schemeByName(MBTILES_SCHEME).name():
+        return
+    scheme = QWebEngineUrlScheme(MBTILES_SCHEME)
+    scheme.setSyntax(QWebEngineUrlScheme.Path)
+    scheme.setFlags(QWebEngineUrlScheme.LocalScheme | QWebEngineUrlScheme.LocalAccessAllowed)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+def install_mbtiles_handler(profile, path=MBTILES_PATH):
+    """
+    Instala el manejador de teselas locales en el perfil si existe el archivo
+    MBTiles. Devuelve el manejador, o None para seguir usando teselas en línea.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        reader = MBTilesReader(path)
+    except sqlite3.Error as e:
+        print(f"[ADVERTENCIA] No se pudo abrir el caché de teselas {path}: {e}")
+        return None
+    handler = MBTilesSchemeHandler(reader, profile)
+    profile.installUrlSchemeHandler(MBTILES_SCHEME, handler)
+    return handler
@@ -0,0 +1,204 @@
+"""
+Modo de memoria acotada para bases muy grandes.
+
+El límite (en MB) se fija al iniciar el proceso con la variable de entorno
+WPA_MEMORIA o con la opción --memoria MB (python gui.py --memoria 3000); al
+fijarse se copia a WPA_MEMORIA, así que los procesos que abre gui.py usan el
+mismo límite. Sin límite todo funciona como siempre.
+
+Con límite:
+  - los mensajes se leen sin las columnas de texto largo
+    (LARGE_TEXT_COLUMNS), que quedan en la base y se piden solo para los
+    mensajes que se muestran o se buscan, y sin la fecha y el nombre del chat
+    como texto por mensaje (los visores los arman al mostrar cada fila);
+  - las cachés de imágenes y de tamaños de los delegados son LRU con un
+    tope en bytes (una parte del límite) y descartan lo menos usado.
+
+format_usage() arma el texto de la barra de estado con el uso de cada
+componente (tablas compartidas, cachés y el proceso completo).
+
+Sin dependencias de Qt.
+"""
+import os
+import sys
+from collections import OrderedDict
+
+# numpy y pandas se importan al estimar tamaños: gui.py importa este módulo
+# antes del primer pintado y no debe cargar pandas
+
+BUDGET_ENV = 'WPA_MEMORIA'
+BUDGET_FLAG = '--memoria'
+
+# Columnas de mensajes que no se cargan con límite de memoria
+LARGE_TEXT_COLUMNS = ('text_data', 'media_caption', 'place_address', 'url')
+
+# Parte del límite para cada caché de los delegados
+IMAGE_CACHE_SHARE = 0.10
+SIZE_CACHE_SHARE = 0.01
+# Bytes estimados de una entrada de la caché de tamaños (clave + QSize)
+SIZE_ENTRY_BYTES = 200
+
+# Valores de texto medidos para estimar el tamaño de una columna object
+SAMPLE_SIZE = 1000
+
+MB = 1024 * 1024
+
+# Nombre de cada tabla compartida en la barra de estado
+TABLE_LABELS = {
+    'messages': 'mensajes', 'conversations': 'chats', 'calls': 'llamadas',
+    'call_stats': 'estadísticas', 'call_index': 'índice de llamadas', 'locations': 'ubicaciones',
+}
+
+
+def _read_budget():
+    value = os.environ.get(BUDGET_ENV, '')
+    if BUDGET_FLAG in sys.argv[1:]:
+        index = sys.argv.index(BUDGET_FLAG)
+        value = sys.argv[index + 1] if index + 1 < len(sys.argv) else value
+    try:
+        megabytes = int(float(value))
+    except ValueError:
+        return None
+    if megabytes <= 0:
+        return None
+    os.environ[BUDGET_ENV] = str(megabytes)
+    return megabytes * MB
+
+
+# Límite del proceso en bytes (None: sin límite); se decide al importar
+budget_bytes = _read_budget()
+
+
+def limited():
+    return budget_bytes is not None
+
+
+def share(fraction):
+    """Bytes de una caché que usa `fraction` del límite (None sin límite)."""
+    return int(budget_bytes * fraction) if budget_bytes is not None else None
+
+
+class LruCache:
+    """
+    Caché LRU con tope en bytes (sizeof(valor) da el tamaño de cada
+    entrada) y/o en cantidad de entradas (max_items). None: sin ese tope;
+    sin max_bytes ni sizeof no se miden las entradas (nbytes queda en 0).
+    La usan los delegados de app11, las teselas (map_tiles), el mapa de
+    calor (loc4) y CallStatsEngine.
+    """
+
+    def __init__(self, max_bytes=None, sizeof=None, max_items=None):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        if sizeof is None and max_bytes is not None:
+            sizeof = sys.getsizeof
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key][0]
+
+    def get_or_compute(self, key, compute):
+        """El valor guardado para key, o compute() (que se guarda)."""
+        if key in self._items:
+            return self.get(key)
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        if key in self._items:
+            self.nbytes -= self._items.pop(key)[1]
+        size = self.sizeof(value) if self.sizeof is not None and value is not None else 0
+        self._items[key] = (value, size)
+        self.nbytes += size
+        if self.max_bytes is not None:
+            while self.nbytes > self.max_bytes and len(self._items) > 1:
+                self._evict()
+        if self.max_items is not None:
+            while len(self._items) > self.max_items:
+                self._evict()
+
+    def _evict(self):
+        _, (_, size) = self._items.popitem(last=False)
+        self.nbytes -= size
+
+    def clear(self):
+        self._items.clear()
+        self.nbytes = 0
+
+
+def _object_nbytes(values):
+    """Tamaño de un arreglo object estimado con una muestra de sus valores."""
+    n = len(values)
+    if n == 0:
+        return 0
+    step = max(1, n // SAMPLE_SIZE)
+    sample = values[::step][:SAMPLE_SIZE]
+    return int(sum(sys.getsizeof(v) for v in sample) / len(sample) * n) + n * 8
+
+
+def estimate_nbytes(value):
+    """
+    Bytes aproximados de una tabla compartida: DataFrame, Series, arreglo o
+    un objeto con arreglos como atributos (LocationDataset, índices, ...).
+    Las columnas de texto se estiman con una muestra, así que es rápido
+    también con millones de filas.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(value, pd.DataFrame):
+        return sum(estimate_nbytes(value[column]) for column in value.columns) + int(value.index.nbytes)
+    if isinstance(value, pd.Series):
+        if value.dtype == object:
+            return _object_nbytes(value.to_numpy())
+        return int(value.memory_usage(index=False, deep=False))
+    if isinstance(value, np.ndarray):
+        return _object_nbytes(value) if value.dtype == object else int(value.nbytes)
+    if hasattr(value, '__dict__'):
+        return sum(estimate_nbytes(v) for v in vars(value).values()
+                   if isinstance(v, (pd.DataFrame, pd.Series, np.ndarray)))
+    return 0
+
+
+def process_rss():
+    """
+    Memoria residente del proceso en bytes (None si no se puede medir).
+    En Windows requiere psutil (requerimientos.bat); /proc solo existe en Linux.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def format_usage(components):
+    """'mensajes 312 MB · imágenes 40 MB · proceso 800 / 2048 MB' para la barra de estado."""
+    parts = [f"{name} {nbytes / MB:.0f} MB" for name, nbytes in components.items() if nbytes]
+    rss = process_rss()
+    if rss is not None:
+        limit = f" / {budget_bytes / MB:.0f}" if budget_bytes is not None else ""
+        parts.append(f"proceso {rss / MB:.0f}{limit} MB")
+    return "Memoria: " + " · ".join(parts)
+
+
+def over_budget():
+    rss = process_rss()
+    return budget_bytes is not None and rss is not None and rss > budget_bytes
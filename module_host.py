@@ -0,0 +1,281 @@
+"""
+Procesos precalentados para los módulos de gui.py.
+
+Cada proceso auxiliar (python module_host.py) importa Qt, QtWebEngine,
+pandas y los módulos de análisis, carga las tablas del caso (case_data) y
+escribe READY en stdout. Después espera órdenes por stdin, una por línea:
+
+    OPEN app11.py   abre (o vuelve a mostrar) la ventana del módulo
+    VIEW <clave>    cambia la vista de casos.json en las ventanas abiertas
+    QUIT            termina el proceso
+
+y responde OPENED <script> o ERROR <script> [mensaje] (sin mensaje si el
+módulo ya mostró el suyo). Si stdin se cierra (el lanzador terminó) el
+proceso también termina.
+
+ModuleHostPool es el lado del lanzador: mantiene hasta `size` procesos
+listos y entrega uno a cada módulo que se abre.
+"""
+import os
+import sys
+import importlib
+import threading
+
+from PyQt5.QtCore import QObject, QProcess, pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import QApplication
+
+# script -> (módulo, clase de la ventana, abrir maximizada)
+MODULES = {
+    "app11.py": ("app11", "WhatsAppViewer", False),
+    "call7.py": ("call7", "CallsAnalyzer", False),
+    "loc4.py": ("loc4", "MainWindow", True),
+}
+
+HOST_SCRIPT = os.path.abspath(__file__)
+
+# Milisegundos de espera al cerrar un proceso antes de forzarlo
+HOST_QUIT_TIMEOUT_MS = 2000
+# Procesos que terminan antes de READY seguidos antes de dejar de lanzarlos
+HOST_MAX_START_FAILURES = 3
+
+
+def create_module_window(script_name):
+    """Importa el módulo y crea su ventana principal (puede lanzar SystemExit)."""
+    module_name, class_name, _ = MODULES[script_name]
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)()
+
+
+def show_module_window(window, script_name):
+    """Muestra (o trae al frente) la ventana de un módulo."""
+    if window.isMinimized() or not window.isVisible():
+        if MODULES[script_name][2]:
+            window.showMaximized()
+        else:
+            window.showNormal()
+    window.raise_()
+    window.activateWindow()
+
+
+def switch_module_view(window, case_key):
+    """Cambia la vista (un teléfono o todos) de la ventana de un módulo."""
+    index = window.case_combo.findData(case_key)
+    if index >= 0:
+        window.case_combo.setCurrentIndex(index)
+
+
+def preload():
+    """
+    Importa los módulos y carga las tablas de la vista activa de casos.json
+    (los errores se verán al abrir).
+    """
+    for module_name, _, _ in MODULES.values():
+        importlib.import_module(module_name)
+    from cases import open_case
+    from locations import load_location_dataset, merge_location_datasets
+    try:
+        case = open_case()
+    except KeyError:
+        return
+    loaders = [case.messages, case.conversations, case.calls,
+               lambda: case.table('locations', load_location_dataset, merge_location_datasets)]
+    for load in loaders:
+        try:
+            load()
+        except Exception:
+            pass
+
+############################################################
+# Lado del proceso auxiliar
+############################################################
+
+class CommandReader(QObject):
+    """Lee órdenes de stdin en un hilo y las entrega al hilo de Qt."""
+
+    command = pyqtSignal(str)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def run(self):
+        for line in sys.stdin:
+            line = line.strip()
+            if line:
+                self.command.emit(line)
+        self.command.emit("EOF")
+
+
+class ModuleHost(QObject):
+    def __init__(self, app, parent=None):
+        super().__init__(parent)
+        self.app = app
+        self.windows = {}
+
+    def reply(self, text):
+        print(text, flush=True)
+
+    @pyqtSlot(str)
+    def on_command(self, line):
+        command, _, argument = line.partition(" ")
+        if command == "OPEN":
+            self.open_module(argument)
+        elif command == "VIEW":
+            for window in self.windows.values():
+                switch_module_view(window, argument)
+        elif command in ("QUIT", "EOF"):
+            self.app.quit()
+
+    def open_module(self, script_name):
+        if script_name not in MODULES:
+            self.reply(f"ERROR {script_name} módulo desconocido")
+            return
+        window = self.windows.get(script_name)
+        if window is None:
+            try:
+                window = create_module_window(script_name)
+            except SystemExit:
+                # El módulo ya mostró su propio mensaje
+                self.reply(f"ERROR {script_name}")
+                return
+            except Exception as e:
+                self.reply(f"ERROR {script_name} {e}")
+                return
+            self.windows[script_name] = window
+        show_module_window(window, script_name)
+        self.reply(f"OPENED {script_name}")
+
+
+def main():
+    # Mismo orden que gui.main: QtWebEngine y mbtiles:// antes de la QApplication
+    from PyQt5 import QtWebEngineWidgets  # noqa: F401
+    from map_tiles import register_mbtiles_scheme
+    register_mbtiles_scheme()
+
+    app = QApplication(sys.argv)
+    app.setQuitOnLastWindowClosed(False)
+    preload()
+
+    host = ModuleHost(app)
+    reader = CommandReader()
+    reader.command.connect(host.on_command)
+    reader.start()
+    host.reply("READY")
+    sys.exit(app.exec_())
+
+############################################################
+# Lado del lanzador
+############################################################
+
+class ModuleHostPool(QObject):
+    """
+    Procesos module_host.py precalentados. open() entrega un proceso listo
+    al módulo (o reutiliza el que ya lo tiene) y lanza otro en su lugar;
+    devuelve False si no hay ninguno listo todavía.
+    """
+
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, size, parent=None):
+        super().__init__(parent)
+        self.size = size
+        self.starting = []
+        self.ready = []
+        self.assigned = {}
+        self.closing = False
+        self.start_failures = 0
+
+    def start(self):
+        while len(self.starting) + len(self.ready) < self.size:
+            self.spawn()
+
+    def spawn(self):
+        process = QProcess(self)
+        process.setProcessChannelMode(QProcess.ForwardedErrorChannel)
+        process.setWorkingDirectory(os.getcwd())
+        process.readyReadStandardOutput.connect(lambda: self.on_output(process))
+        process.finished.connect(lambda *_: self.on_finished(process))
+        process.start(sys.executable, [HOST_SCRIPT])
+        self.starting.append(process)
+
+    def on_output(self, process):
+        while process.canReadLine():
+            line = bytes(process.readLine()).decode("utf-8", "replace").strip()
+            if line == "READY" and process in self.starting:
+                self.starting.remove(process)
+                self.ready.append(process)
+                self.start_failures = 0
+            elif line.startswith("ERROR "):
+                script_name, _, message = line[len("ERROR "):].partition(" ")
+                if self.assigned.get(script_name) is process:
+                    # Sin ventana: el proceso queda libre para otro módulo
+                    del self.assigned[script_name]
+                    if process not in self.ready:
+                        self.ready.append(process)
+                if message:
+                    self.failed.emit(script_name, message)
+
+    def on_finished(self, process):
+        if process in self.starting:
+            self.starting.remove(process)
+            self.start_failures += 1
+        if process in self.ready:
+            self.ready.remove(process)
+        for script_name in [s for s, p in self.assigned.items() if p is process]:
+            del self.assigned[script_name]
+        # Si los procesos fallan al arrancar, los módulos se abren en el lanzador
+        if not self.closing and self.start_failures < HOST_MAX_START_FAILURES:
+            self.start()
+
+    def restart_idle(self):
+        """
+        Reinicia los procesos que todavía no alojan ningún módulo (por ejemplo
+        al cambiar de caso, para que precarguen el nuevo); on_finished lanza
+        los reemplazos.
+        """
+        starting, ready = self.starting, self.ready
+        self.starting, self.ready = [], []
+        for process in starting:
+            process.kill()
+        for process in ready:
+            process.write(b"QUIT\n")
+
+    def close_assigned(self):
+        """
+        Termina los procesos que alojan módulos, con sus ventanas (por
+        ejemplo si cambian los teléfonos del caso); open() lanzará ventanas
+        nuevas en los procesos que reemplazan a los libres.
+        """
+        assigned, self.assigned = self.assigned, {}
+        for process in set(assigned.values()):
+            process.write(b"QUIT\n")
+
+    def switch_view(self, case_key):
+        """Cambia la vista en las ventanas de los procesos que alojan módulos."""
+        for process in set(self.assigned.values()):
+            process.write(f"VIEW {case_key}\n".encode("utf-8"))
+
+    def open(self, script_name):
+        process = self.assigned.get(script_name)
+        if process is None:
+            if not self.ready:
+                return False
+            process = self.ready.pop(0)
+            self.assigned[script_name] = process
+            self.start()
+        process.write(f"OPEN {script_name}\n".encode("utf-8"))
+        return True
+
+    def shutdown(self):
+        """Termina todos los procesos (también las ventanas de módulos que alojan)."""
+        self.closing = True
+        processes = self.starting + self.ready + list(self.assigned.values())
+        for process in processes:
+            process.write(b"QUIT\n")
+        for process in processes:
+            if not process.waitForFinished(HOST_QUIT_TIMEOUT_MS):
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
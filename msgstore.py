@@ -0,0 +1,438 @@
+"""
+Acceso a msgstore.db compartido por todos los visores.
+
+Cada entidad (mensajes, llamadas, ubicaciones) tiene un esquema canónico:
+la lista de columnas que entregan las consultas, con su tipo. Las consultas
+se arman a partir de la versión del esquema de la base, que se detecta una
+sola vez por archivo:
+
+    moderno   tablas message, jid, chat, message_media, message_location
+    legado    tabla messages (WhatsApp anterior a 2021), con el jid en texto
+
+Las columnas que no existen en la base (varían entre versiones de WhatsApp)
+se piden como NULL, así que el resultado siempre tiene las mismas columnas.
+
+Las conexiones son de solo lectura (file:...?mode=ro): una evidencia no se
+modifica nunca y una ruta equivocada da error en lugar de crear una base
+vacía. Por eso no se crean índices; los filtros usan las claves primarias y
+las consultas por bloques (chunks, page) evitan cargar todo de una vez.
+
+Sin dependencias de Qt.
+"""
+import os
+import sqlite3
+import threading
+from urllib.request import pathname2url
+
+import pandas as pd
+
+import perftrace
+
+SCHEMA_MODERN = 'moderno'
+SCHEMA_LEGACY = 'legado'
+
+# Tipos del esquema canónico:
+#   int    entero, nulos como 0
+#   float  real, nulos como NaN
+#   number numérico tal como lo entrega pandas (nulos como NaN)
+#   text   texto, nulos como '' (o el valor por omisión indicado)
+#   raw    sin convertir (texto que puede ser None)
+MESSAGE_SCHEMA = [
+    ('_id', 'int'), ('key_id', 'raw'), ('chat_row_id', 'number'), ('from_me', 'int'),
+    ('sender_jid_row_id', 'number'), ('status', 'number'), ('timestamp', 'number'),
+    ('message_type', 'int'), ('text_data', 'text'), ('sender_jid', 'text', 'Desconocido'),
+    ('chat_name', 'text'), ('chat_jid', 'text'), ('file_path', 'text'), ('media_name', 'text'),
+    ('media_size', 'int'), ('media_caption', 'text'), ('media_duration', 'int'),
+    ('media_mime_type', 'text'), ('width', 'number'), ('height', 'number'),
+    ('latitude', 'float'), ('longitude', 'float'), ('place_name', 'text'),
+    ('place_address', 'text'), ('url', 'text'), ('live_location_share_duration', 'int'),
+    ('live_location_sequence_number', 'float'), ('live_location_final_latitude', 'float'),
+    ('live_location_final_longitude', 'float'), ('live_location_final_timestamp', 'float'),
+    ('map_download_status', 'float'),
+]
+
+CALL_SCHEMA = [
+    ('_id', 'int'), ('jid_row_id', 'number'), ('from_me', 'int'), ('call_id', 'raw'),
+    ('timestamp', 'number'), ('duration', 'int'), ('video_call', 'int'), ('call_result', 'number'),
+    ('call_type', 'number'), ('caller_jid', 'raw'),
+]
+
+# Ubicaciones en el orden de columnas que espera locations.LocationDataset
+LOCATION_SCHEMA = [
+    ('message_row_id', 'int'), ('number', 'raw'), ('latitude', 'float'), ('longitude', 'float'),
+    ('place_name', 'text'), ('place_address', 'text'), ('url', 'text'),
+    ('live_location_share_duration', 'int'), ('live_location_final_latitude', 'float'),
+    ('live_location_final_longitude', 'float'), ('live_location_final_timestamp', 'number'),
+    ('timestamp', 'number'), ('live_location_sequence_number', 'number'),
+]
+
+SCHEMAS = {'messages': MESSAGE_SCHEMA, 'calls': CALL_SCHEMA, 'locations': LOCATION_SCHEMA}
+
+
+class EntitySource:
+    """
+    De dónde sale una entidad en una versión del esquema: tabla base, uniones
+    y, por cada columna canónica, (alias de tabla, columna).
+    """
+
+    def __init__(self, table, alias, joins, fields, key, where=None):
+        self.table = table
+        self.alias = alias
+        # (tipo de unión, tabla, alias, condición)
+        self.joins = joins
+        # columna canónica -> (alias, columna); las que faltan son NULL
+        self.fields = fields
+        # Columna para los filtros por clave y el orden estable de los bloques
+        self.key = key
+        self.where = where
+
+
+SOURCES = {
+    SCHEMA_MODERN: {
+        'messages': EntitySource(
+            'message', 'message',
+            [('LEFT', 'jid', 'jid', 'message.sender_jid_row_id = jid._id'),
+             ('LEFT', 'chat', 'chat', 'message.chat_row_id = chat._id'),
+             ('LEFT', 'jid', 'chat_jid', 'chat.jid_row_id = chat_jid._id'),
+             ('LEFT', 'message_media', 'message_media', 'message._id = message_media.message_row_id'),
+             ('LEFT', 'message_location', 'message_location', 'message._id = message_location.message_row_id')],
+            {
+                '_id': ('message', '_id'), 'key_id': ('message', 'key_id'),
+                'chat_row_id': ('message', 'chat_row_id'), 'from_me': ('message', 'from_me'),
+                'sender_jid_row_id': ('message', 'sender_jid_row_id'), 'status': ('message', 'status'),
+                'timestamp': ('message', 'timestamp'), 'message_type': ('message', 'message_type'),
+                'text_data': ('message', 'text_data'), 'sender_jid': ('jid', 'raw_string'),
+                'chat_name': ('chat', 'subject'), 'chat_jid': ('chat_jid', 'raw_string'),
+                'file_path': ('message_media', 'file_path'), 'media_name': ('message_media', 'media_name'),
+                'media_size': ('message_media', 'file_size'),
+                'media_caption': ('message_media', 'media_caption'),
+                'media_duration': ('message_media', 'media_duration'),
+                'media_mime_type': ('message_media', 'mime_type'),
+                'width': ('message_media', 'width'), 'height': ('message_media', 'height'),
+                'latitude': ('message_location', 'latitude'), 'longitude': ('message_location', 'longitude'),
+                'place_name': ('message_location', 'place_name'),
+                'place_address': ('message_location', 'place_address'),
+                'url': ('message_location', 'url'),
+                'live_location_share_duration': ('message_location', 'live_location_share_duration'),
+                'live_location_sequence_number': ('message_location', 'live_location_sequence_number'),
+                'live_location_final_latitude': ('message_location', 'live_location_final_latitude'),
+                'live_location_final_longitude': ('message_location', 'live_location_final_longitude'),
+                'live_location_final_timestamp': ('message_location', 'live_location_final_timestamp'),
+                'map_download_status': ('message_location', 'map_download_status'),
+            },
+            key=('message', '_id')),
+        'calls': EntitySource(
+            'call_log', 'call_log',
+            [('LEFT', 'jid', 'jid', 'call_log.jid_row_id = jid._id')],
+            {
+                '_id': ('call_log', '_id'), 'jid_row_id': ('call_log', 'jid_row_id'),
+                'from_me': ('call_log', 'from_me'), 'call_id': ('call_log', 'call_id'),
+                'timestamp': ('call_log', 'timestamp'), 'duration': ('call_log', 'duration'),
+                'video_call': ('call_log', 'video_call'), 'call_result': ('call_log', 'call_result'),
+                'call_type': ('call_log', 'call_type'), 'caller_jid': ('jid', 'raw_string'),
+            },
+            key=('call_log', '_id')),
+        'locations': EntitySource(
+            'message_location', 'ml',
+            [('INNER', 'message', 'm', 'ml.message_row_id = m._id'),
+             ('INNER', 'chat', 'cc', 'm.chat_row_id = cc._id'),
+             ('INNER', 'jid', 'j', 'cc.jid_row_id = j._id')],
+            {
+                'message_row_id': ('ml', 'message_row_id'), 'number': ('j', 'raw_string'),
+                'latitude': ('ml', 'latitude'), 'longitude': ('ml', 'longitude'),
+                'place_name': ('ml', 'place_name'), 'place_address': ('ml', 'place_address'),
+                'url': ('ml', 'url'),
+                'live_location_share_duration': ('ml', 'live_location_share_duration'),
+                'live_location_final_latitude': ('ml', 'live_location_final_latitude'),
+                'live_location_final_longitude': ('ml', 'live_location_final_longitude'),
+                'live_location_final_timestamp': ('ml', 'live_location_final_timestamp'),
+                'timestamp': ('m', 'timestamp'),
+                'live_location_sequence_number': ('ml', 'live_location_sequence_number'),
+            },
+            key=('ml', 'message_row_id')),
+    },
+    SCHEMA_LEGACY: {
+        # Todo en la tabla messages: el chat es key_remote_jid y, en los
+        # grupos, el remitente es remote_resource
+        'messages': EntitySource(
+            'messages', 'messages',
+            [('LEFT', 'chat_list', 'chat_list', 'messages.key_remote_jid = chat_list.key_remote_jid')],
+            {
+                '_id': ('messages', '_id'), 'key_id': ('messages', 'key_id'),
+                'from_me': ('messages', 'key_from_me'), 'status': ('messages', 'status'),
+                'timestamp': ('messages', 'timestamp'), 'message_type': ('messages', 'media_wa_type'),
+                'text_data': ('messages', 'data'), 'sender_jid': ('messages', 'remote_resource'),
+                'chat_name': ('chat_list', 'subject'), 'chat_jid': ('messages', 'key_remote_jid'),
+                'media_name': ('messages', 'media_name'), 'media_size': ('messages', 'media_size'),
+                'media_caption': ('messages', 'media_caption'),
+                'media_duration': ('messages', 'media_duration'),
+                'media_mime_type': ('messages', 'media_mime_type'),
+                'latitude': ('messages', 'latitude'), 'longitude': ('messages', 'longitude'),
+            },
+            key=('messages', '_id'),
+            where="messages.key_remote_jid <> '-1'"),
+        'locations': EntitySource(
+            'messages', 'messages', [],
+            {
+                'message_row_id': ('messages', '_id'), 'number': ('messages', 'key_remote_jid'),
+                'latitude': ('messages', 'latitude'), 'longitude': ('messages', 'longitude'),
+                'place_name': ('messages', 'media_name'),
+                'timestamp': ('messages', 'timestamp'),
+            },
+            key=('messages', '_id'),
+            where="messages.media_wa_type = 5"),
+        # Las bases antiguas no tienen call_log con jid_row_id: sin llamadas
+    },
+}
+
+FILTER_OPERATORS = ('=', '<>', '<', '<=', '>', '>=', 'IN', 'LIKE', 'CONTAINS')
+
+# Función SQL de CONTAINS para textos no ASCII (ver connect)
+CONTAINS_FUNCTION = 'contiene_sin_mayusculas'
+
+
+class MsgstoreSchema:
+    """Tablas y columnas de una base (se lee una vez con get_schema)."""
+
+    def __init__(self, conn):
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")]
+        self.columns = {}
+        for table in tables:
+            self.columns[table] = {info[1] for info in conn.execute(f'PRAGMA table_info("{table}")')}
+        self.user_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if 'message' in self.columns and 'jid' in self.columns:
+            self.version = SCHEMA_MODERN
+        elif 'messages' in self.columns:
+            self.version = SCHEMA_LEGACY
+        else:
+            raise ValueError("La base no tiene el esquema de msgstore.db de WhatsApp")
+
+    def has_column(self, table, column):
+        return column in self.columns.get(table, ())
+
+    def source(self, entity):
+        """EntitySource de la entidad en esta versión (None si la base no la tiene)."""
+        source = SOURCES[self.version].get(entity)
+        if source is None or source.table not in self.columns:
+            return None
+        return source
+
+
+def like_pattern(text):
+    """Patrón LIKE que busca `text` en cualquier parte (%, _ y \\ literales)."""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _contains_nocase(value, text):
+    return value is not None and text in str(value).lower()
+
+
+def connect(db_path):
+    """Conexión de solo lectura (falla si el archivo no existe)."""
+    uri = 'file:' + pathname2url(os.path.abspath(db_path)) + '?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.create_function(CONTAINS_FUNCTION, 2, _contains_nocase, deterministic=True)
+    return conn
+
+
+@perftrace.traced('pandas', 'msgstore.normalize')
+def normalize(entity, df):
+    """Aplica el esquema canónico de la entidad a un DataFrame leído con select()."""
+    for spec in SCHEMAS[entity]:
+        name, kind = spec[0], spec[1]
+        if name not in df.columns:
+            continue
+        if kind == 'int':
+            df[name] = pd.to_numeric(df[name], errors='coerce').fillna(0).astype('int64')
+        elif kind == 'float':
+            df[name] = pd.to_numeric(df[name], errors='coerce').astype('float64')
+        elif kind == 'number':
+            df[name] = pd.to_numeric(df[name], errors='coerce')
+        elif kind == 'text':
+            df[name] = df[name].fillna(spec[2] if len(spec) > 2 else '')
+    return df
+
+
+class MsgstoreRepository:
+    """
+    Consultas sobre un msgstore.db. Los filtros son tuplas
+    (columna canónica, operador, valor), p. ej. ('chat_jid', '=', jid) o
+    ('timestamp', '>=', desde); el orden, una lista de columnas canónicas
+    (con ' DESC' opcional).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        conn = connect(db_path)
+        try:
+            self.schema = MsgstoreSchema(conn)
+        finally:
+            conn.close()
+
+    @property
+    def version(self):
+        return self.schema.version
+
+    def _expression(self, source, name):
+        field = source.fields.get(name)
+        if field is None:
+            return 'NULL'
+        alias, column = field
+        table = source.table if alias == source.alias else next(
+            (table for _, table, join_alias, _ in source.joins if join_alias == alias), None)
+        if table is None or not self.schema.has_column(table, column):
+            return 'NULL'
+        return f'{alias}.{column}'
+
+    def select(self, entity, columns=None, filters=(), order_by=None, limit=None, offset=None):
+        """(sql, parámetros) de la consulta; None si la base no tiene la entidad."""
+        source = self.schema.source(entity)
+        if source is None:
+            return None
+        names = columns or [spec[0] for spec in SCHEMAS[entity]]
+        select_list = ',\n    '.join(f'{self._expression(source, name)} AS {name}' for name in names)
+        sql = f'SELECT\n    {select_list}\nFROM {source.table}'
+        if source.alias != source.table:
+            sql += f' {source.alias}'
+        for kind, table, alias, condition in source.joins:
+            if table not in self.schema.columns:
+                continue
+            sql += f'\n{"LEFT JOIN" if kind == "LEFT" else "JOIN"} {table}'
+            sql += f' AS {alias}' if alias != table else ''
+            sql += f' ON {condition}'
+
+        conditions = [source.where] if source.where else []
+        params = []
+        for name, operator, value in filters:
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"Operador no soportado: {operator}")
+            expression = self._expression(source, name)
+            if operator == 'IN':
+                values = list(value)
+                conditions.append(f'{expression} IN ({", ".join("?" * len(values))})' if values else '0')
+                params.extend(values)
+            elif operator == 'LIKE':
+                conditions.append(f"{expression} LIKE ? ESCAPE '\\'")
+                params.append(value)
+            elif operator == 'CONTAINS':
+                # Contiene `value` sin distinguir mayúsculas, como
+                # str.contains(case=False). LIKE solo lo hace en ASCII: con
+                # otros caracteres (ñ, Á...) se compara en Python, más lento
+                if value.isascii():
+                    conditions.append(f"{expression} LIKE ? ESCAPE '\\'")
+                    params.append(like_pattern(value))
+                else:
+                    conditions.append(f'{CONTAINS_FUNCTION}({expression}, ?)')
+                    params.append(value.lower())
+            else:
+                conditions.append(f'{expression} {operator} ?')
+                params.append(value)
+        if conditions:
+            sql += '\nWHERE ' + ' AND '.join(f'({c})' for c in conditions)
+
+        if order_by:
+            terms = []
+            for term in order_by:
+                name, _, direction = term.partition(' ')
+                terms.append(f'{self._expression(source, name)} {direction}'.strip())
+            sql += '\nORDER BY ' + ', '.join(terms)
+        if limit is not None:
+            sql += '\nLIMIT ?'
+            params.append(int(limit))
+            if offset:
+                sql += ' OFFSET ?'
+                params.append(int(offset))
+        return sql, params
+
+    def _empty(self, entity, columns=None):
+        names = columns or [spec[0] for spec in SCHEMAS[entity]]
+        return normalize(entity, pd.DataFrame({name: pd.Series(dtype=object) for name in names}))
+
+    def query(self, entity, columns=None, filters=(), order_by=None, limit=None, offset=None):
+        """DataFrame con el esquema canónico de la entidad."""
+        query = self.select(entity, columns, filters, order_by, limit, offset)
+        if query is None:
+            return self._empty(entity, columns)
+        conn = connect(self.db_path)
+        try:
+            with perftrace.span('msgstore.query', 'sql', entidad=entity) as trace:
+                df = pd.read_sql_query(query[0], conn, params=query[1])
+                trace.set(filas=len(df))
+        finally:
+            conn.close()
+        return normalize(entity, df)
+
+    def page(self, entity, page, page_size, order_by=None, **kwargs):
+        """Página `page` (desde 0) de page_size filas, en orden estable."""
+        order_by = order_by or [self._key_name(entity)]
+        return self.query(entity, order_by=order_by, limit=page_size, offset=page * page_size, **kwargs)
+
+    def chunks(self, entity, chunksize, columns=None, filters=(), order_by=None):
+        """DataFrames de a lo sumo chunksize filas (una sola consulta, leída por partes)."""
+        query = self.select(entity, columns, filters, order_by)
+        if query is None:
+            return
+        conn = connect(self.db_path)
+        try:
+            reader = pd.read_sql_query(query[0], conn, params=query[1], chunksize=chunksize)
+            while True:
+                with perftrace.span('msgstore.chunks', 'sql', entidad=entity):
+                    chunk = next(reader, None)
+                if chunk is None:
+                    break
+                yield normalize(entity, chunk)
+        finally:
+            conn.close()
+
+    def rows(self, entity, columns=None, filters=(), order_by=None):
+        """Tuplas sin convertir, en el orden de columnas del esquema (para armar arreglos)."""
+        query = self.select(entity, columns, filters, order_by)
+        if query is None:
+            return []
+        conn = connect(self.db_path)
+        try:
+            with perftrace.span('msgstore.rows', 'sql', entidad=entity) as trace:
+                rows = conn.execute(query[0], query[1]).fetchall()
+                trace.set(filas=len(rows))
+            return rows
+        finally:
+            conn.close()
+
+    def count(self, entity, filters=()):
+        query = self.select(entity, [self._key_name(entity)], filters)
+        if query is None:
+            return 0
+        conn = connect(self.db_path)
+        try:
+            with perftrace.span('msgstore.count', 'sql', entidad=entity):
+                return conn.execute(f'SELECT COUNT(*) FROM ({query[0]})', query[1]).fetchone()[0]
+        finally:
+            conn.close()
+
+    def _key_name(self, entity):
+        source = self.schema.source(entity)
+        key = source.key if source else None
+        for name, field in (source.fields.items() if source else ()):
+            if field == key:
+                return name
+        return SCHEMAS[entity][0][0]
+
+
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+
+def get_repository(db_path):
+    """
+    Repositorio de una base; el esquema se detecta una vez por archivo (de
+    nuevo solo si el archivo cambia).
+    """
+    key = os.path.abspath(db_path)
+    mtime = os.path.getmtime(key) if os.path.exists(key) else None
+    with _repositories_lock:
+        cached = _repositories.get(key)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, MsgstoreRepository(key))
+            _repositories[key] = cached
+        return cached[1]
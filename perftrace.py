@@ -0,0 +1,271 @@
+"""
+Trazas de rendimiento opcionales (para cuando "se congeló").
+
+Se activan al iniciar el proceso con la variable de entorno WPA_TRAZA o con
+la opción --traza en la línea de comandos (python gui.py --traza). Con
+WPA_TRAZA=1 las trazas van a .cache/trazas; con cualquier otro valor, a esa
+carpeta. Al activarse se fija WPA_TRAZA, así que los procesos precalentados
+que abre gui.py también registran.
+
+Cada proceso escribe al salir un JSON en formato Chrome trace (se abre en
+https://ui.perfetto.dev o chrome://tracing) y un resumen en texto con las
+operaciones más lentas. Para ver todos los procesos juntos:
+
+    python perftrace.py [carpeta] [--salida combinada.json]
+
+Categorías usadas por los visores: sql (lectura de msgstore.db), pandas
+(preparación de tablas), filtro, pintado (paint/sizeHint de los
+delegados), imagen (carga de medios) y js (lotes de runJavaScript, medidos
+de ida y vuelta).
+
+Desactivadas no cuestan nada: traced() devuelve la función sin envolver y
+span() un contexto vacío compartido. Por eso la activación se decide al
+importar este módulo y no se puede cambiar después.
+
+Sin dependencias de Qt.
+"""
+import argparse
+import atexit
+import functools
+import glob
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+TRACE_ENV = 'WPA_TRAZA'
+TRACE_FLAG = '--traza'
+TRACE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'trazas')
+
+# Tope de eventos por proceso (paint/sizeHint generan muchos); el resto se cuenta
+MAX_EVENTS = 2_000_000
+# Filas de cada tabla del resumen
+SUMMARY_SIZE = 15
+
+# perf_counter_ns -> tiempo de reloj (µs), para alinear las trazas de varios procesos
+_CLOCK_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+enabled = False
+trace_dir = None
+
+# (nombre, categoría, inicio_ns, duración_ns, hilo, argumentos, asíncrono)
+_events = []
+_dropped = 0
+_async_ids = itertools.count(1)
+
+
+def _record(name, category, start_ns, duration_ns, args, is_async=False):
+    global _dropped
+    if len(_events) >= MAX_EVENTS:
+        _dropped += 1
+        return
+    _events.append((name, category, start_ns, duration_ns, threading.get_native_id(), args, is_async))
+
+
+class _Span:
+    __slots__ = ('name', 'category', 'args', 'start')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.category, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+
+    def set(self, **args):
+        """Agrega argumentos conocidos al final (p. ej. filas leídas)."""
+        self.args.update(args)
+
+
+class _NullSpan:
+    """Contexto vacío compartido (trazas desactivadas)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, category='app', **args):
+    """
+    Mide el bloque with. El objeto devuelto acepta .set(clave=valor) para
+    agregar datos que se conocen al terminar (siempre, aunque esté
+    desactivado).
+    """
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def traced(category, name=None):
+    """Decorador: mide cada llamada a la función (sin efecto si está desactivado)."""
+    def decorate(function):
+        if not enabled:
+            return function
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(label, category, start, time.perf_counter_ns() - start, None)
+        return wrapper
+    return decorate
+
+
+def begin_async(name, category='app', **args):
+    """Inicio de una operación que termina en un callback (end_async)."""
+    if not enabled:
+        return None
+    return name, category, time.perf_counter_ns(), args
+
+
+def end_async(token):
+    if token is not None:
+        name, category, start, args = token
+        _record(name, category, start, time.perf_counter_ns() - start, args, is_async=True)
+
+
+def _process_label():
+    return os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+
+
+def trace_events(events=None, pid=None, label=None):
+    """Eventos en formato Chrome trace (tiempos en µs)."""
+    events = _events if events is None else events
+    pid = os.getpid() if pid is None else pid
+    threads = {t.native_id: t.name for t in threading.enumerate() if t.native_id is not None}
+    result = [{'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': 0,
+               'args': {'name': f"{label or _process_label()} ({pid})"}}]
+    result.extend({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in threads.items())
+    for name, category, start, duration, tid, args, is_async in events:
+        ts = (start + _CLOCK_OFFSET_NS) / 1000
+        if is_async:
+            ident = next(_async_ids)
+            common = {'name': name, 'cat': category, 'pid': pid, 'tid': tid, 'id': ident}
+            result.append(dict(common, ph='b', ts=ts, args=args or {}))
+            result.append(dict(common, ph='e', ts=ts + duration / 1000))
+        else:
+            event = {'ph': 'X', 'name': name, 'cat': category, 'pid': pid, 'tid': tid,
+                     'ts': ts, 'dur': duration / 1000}
+            if args:
+                event['args'] = args
+            result.append(event)
+    return result
+
+
+def _durations(trace):
+    """(nombre, categoría, ms, argumentos) de cada operación de una traza Chrome."""
+    begins = {}
+    for event in trace:
+        phase = event.get('ph')
+        if phase == 'X':
+            yield event['name'], event.get('cat', ''), event['dur'] / 1000, event.get('args', {})
+        elif phase == 'b':
+            begins[(event['pid'], event['id'])] = event
+        elif phase == 'e':
+            begin = begins.pop((event['pid'], event['id']), None)
+            if begin is not None:
+                yield begin['name'], begin.get('cat', ''), (event['ts'] - begin['ts']) / 1000, begin.get('args', {})
+
+
+def summarize(trace, size=SUMMARY_SIZE):
+    """Líneas de texto: tiempo total por operación y las llamadas más lentas."""
+    totals = {}
+    slowest = []
+    for name, category, ms, args in _durations(trace):
+        total = totals.setdefault((category, name), [0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += ms
+        total[2] = max(total[2], ms)
+        slowest.append((ms, category, name, args))
+
+    lines = [f"{'Operación':50s} {'Llamadas':>9s} {'Total ms':>10s} {'Media ms':>9s} {'Máx. ms':>9s}"]
+    for (category, name), (count, total, peak) in sorted(totals.items(), key=lambda item: -item[1][1])[:size]:
+        lines.append(f"{f'[{category}] {name}'[:50]:50s} {count:9d} {total:10.1f} {total / count:9.2f} {peak:9.1f}")
+    lines.append("")
+    lines.append("Llamadas más lentas:")
+    slowest.sort(key=lambda item: -item[0])
+    for ms, category, name, args in slowest[:size]:
+        detail = ', '.join(f"{k}={v}" for k, v in args.items()) if args else ''
+        lines.append(f"{ms:10.1f} ms  [{category}] {name}" + (f"  ({detail})" if detail else ''))
+    return lines
+
+
+def save():
+    """Escribe la traza y el resumen de este proceso (se llama al salir)."""
+    if not enabled or not _events:
+        return None
+    os.makedirs(trace_dir, exist_ok=True)
+    base = os.path.join(trace_dir, f"traza_{_process_label()}_{os.getpid()}")
+    trace = trace_events()
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+    lines = summarize(trace)
+    if _dropped:
+        lines.append(f"\n{_dropped} eventos descartados (más de {MAX_EVENTS})")
+    with open(base + '_resumen.txt', 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f"[TRAZA] {base}.json", file=sys.stderr)
+    return base + '.json'
+
+
+def enable(directory=None):
+    """Activa las trazas en este proceso y en los que abra (WPA_TRAZA)."""
+    global enabled, trace_dir
+    if enabled:
+        return
+    enabled = True
+    trace_dir = os.path.abspath(directory or TRACE_DIR)
+    os.environ[TRACE_ENV] = trace_dir
+    atexit.register(save)
+
+
+_env_value = os.environ.get(TRACE_ENV, '')
+if _env_value not in ('', '0') or TRACE_FLAG in sys.argv[1:]:
+    enable(None if _env_value in ('', '0', '1') else _env_value)
+
+
+def merge_main(argv=None):
+    parser = argparse.ArgumentParser(description="Combina las trazas de varios procesos y muestra el resumen.")
+    parser.add_argument('carpeta', nargs='?', default=TRACE_DIR)
+    parser.add_argument('--salida', help="JSON combinado (por defecto <carpeta>/combinada.json)")
+    args = parser.parse_args(argv)
+
+    output = args.salida or os.path.join(args.carpeta, 'combinada.json')
+    trace = []
+    for path in sorted(glob.glob(os.path.join(args.carpeta, 'traza_*.json'))):
+        if os.path.abspath(path) == os.path.abspath(output):
+            continue
+        with open(path, encoding='utf-8') as f:
+            trace.extend(json.load(f).get('traceEvents', []))
+    if not trace:
+        print(f"No hay trazas en {args.carpeta}")
+        return 1
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+    print('\n'.join(summarize(trace)))
+    print(f"\nTraza combinada en {output} (abrir en https://ui.perfetto.dev)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(merge_main())
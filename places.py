@@ -0,0 +1,174 @@
+"""
+Lugares frecuentes por contacto.
+
+Agrupa las ubicaciones de cada contacto en lugares con un agrupamiento tipo
+DBSCAN sobre una rejilla: las celdas miden PLACE_RADIUS_M / sqrt(2) metros,
+las celdas con al menos PLACE_MIN_POINTS puntos son núcleo, dos celdas
+núcleo vecinas se unen si sus centroides están a menos de PLACE_RADIUS_M y
+las celdas vecinas de un núcleo se le suman como borde. Todo son operaciones
+vectorizadas sobre arreglos (sin comparar cada par de puntos).
+
+Una visita es una racha de puntos consecutivos en el tiempo dentro del mismo
+lugar, sin huecos de más de VISIT_MAX_GAP_MS; su permanencia va del primer
+punto al último (o al fin de la ubicación en tiempo real, si dura más).
+
+Sin dependencias de Qt.
+"""
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_M = 6371008.8
+M_PER_DEG = np.pi * EARTH_RADIUS_M / 180.0
+
+PLACE_RADIUS_M = 100.0
+PLACE_MIN_POINTS = 2
+VISIT_MAX_GAP_MS = 2 * 3600 * 1000
+
+# Clave de celda: código de contacto (21 bits) | fila (21 bits) | columna (21 bits)
+_CELL_BITS = 21
+_CELL_OFFSET = 1 << (_CELL_BITS - 1)
+_CELL_MASK = (1 << _CELL_BITS) - 1
+_NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+PLACE_COLUMNS = ['contacto', 'ranking', 'latitud', 'longitud', 'visitas', 'permanencia_s',
+                 'puntos', 'radio_m', 'primera_visita', 'ultima_visita']
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distancia en metros entre pares de puntos (vectorizada)."""
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2.0) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2)
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _connected_labels(n, a, b):
+    """Componentes conexas de n nodos con aristas (a, b): etiqueta = menor nodo."""
+    labels = np.arange(n)
+    if len(a) == 0:
+        return labels
+    while True:
+        smallest = np.minimum(labels[a], labels[b])
+        updated = labels.copy()
+        np.minimum.at(updated, a, smallest)
+        np.minimum.at(updated, b, smallest)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def cluster_points(codes, latitudes, longitudes, radius_m=PLACE_RADIUS_M, min_points=PLACE_MIN_POINTS):
+    """
+    Lugar de cada punto (-1 = ruido). Los puntos de contactos distintos nunca
+    comparten lugar. Devuelve (lugar por punto, número de lugares).
+    """
+    n = len(codes)
+    if n == 0:
+        return np.empty(0, dtype=np.int64), 0
+
+    cell_m = radius_m / np.sqrt(2.0)
+    y_m = latitudes * M_PER_DEG
+    x_m = longitudes * M_PER_DEG * np.cos(np.radians(latitudes))
+    cy = np.floor(y_m / cell_m).astype(np.int64) + _CELL_OFFSET
+    cx = np.floor(x_m / cell_m).astype(np.int64) + _CELL_OFFSET
+    keys = (codes.astype(np.int64) << (2 * _CELL_BITS)) | (cy << _CELL_BITS) | cx
+    cells, cell_of_point, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    n_cells = len(cells)
+    cell_lat = np.bincount(cell_of_point, latitudes, n_cells) / counts
+    cell_lon = np.bincount(cell_of_point, longitudes, n_cells) / counts
+    core = counts >= min_points
+
+    # Celdas vecinas (búsqueda binaria de las 8 claves vecinas)
+    src, dst = [], []
+    for dy, dx in _NEIGHBOURS:
+        neighbour = cells + (dy << _CELL_BITS) + dx
+        pos = np.searchsorted(cells, neighbour)
+        found = pos < n_cells
+        found[found] = cells[pos[found]] == neighbour[found]
+        src.append(np.flatnonzero(found))
+        dst.append(pos[found])
+    src = np.concatenate(src)
+    dst = np.concatenate(dst)
+
+    # Núcleos vecinos y suficientemente cercanos forman un mismo lugar
+    linked = core[src] & core[dst]
+    linked &= haversine_m(cell_lat[src], cell_lon[src], cell_lat[dst], cell_lon[dst]) <= radius_m
+    labels = _connected_labels(n_cells, src[linked], dst[linked])
+    cell_label = np.where(core, labels, n_cells)
+
+    # Bordes: celdas no núcleo junto a un núcleo
+    border = ~core[src] & core[dst]
+    np.minimum.at(cell_label, src[border], labels[dst[border]])
+
+    clustered = cell_label < n_cells
+    place_ids, compact = np.unique(cell_label[clustered], return_inverse=True)
+    place_of_cell = np.full(n_cells, -1, dtype=np.int64)
+    place_of_cell[clustered] = compact
+    return place_of_cell[cell_of_point], len(place_ids)
+
+
+def find_places(dataset, rows=None, radius_m=PLACE_RADIUS_M, min_points=PLACE_MIN_POINTS,
+                max_gap_ms=VISIT_MAX_GAP_MS):
+    """
+    Lugares frecuentes de las filas dadas de un LocationDataset (todas si
+    rows es None), ordenados por contacto y, dentro de cada contacto, por
+    visitas y permanencia (columna ranking, desde 1).
+    """
+    ds = dataset
+    rows = np.arange(len(ds)) if rows is None else np.sort(np.asarray(rows, dtype=np.int64))
+    rows = rows[~np.isnan(ds.latitudes[rows]) & ~np.isnan(ds.longitudes[rows])
+                & (ds.timestamps[rows] != ds.NO_TIMESTAMP)]
+    # Las filas del dataset ya están ordenadas por (contacto, tiempo)
+    codes = ds.codes[rows]
+    lat = ds.latitudes[rows]
+    lon = ds.longitudes[rows]
+    ts = ds.timestamps[rows]
+    until = ts + ds.live_durations[rows] * 1000
+
+    place, n_places = cluster_points(codes, lat, lon, radius_m, min_points)
+    if n_places == 0:
+        return pd.DataFrame(columns=PLACE_COLUMNS)
+
+    # Visitas: rachas de puntos consecutivos en el mismo lugar
+    new_visit = np.ones(len(rows), dtype=bool)
+    new_visit[1:] = ((place[1:] != place[:-1]) | (codes[1:] != codes[:-1])
+                     | (ts[1:] - ts[:-1] > max_gap_ms))
+    visit_start = np.flatnonzero(new_visit)
+    visit_place = place[visit_start]
+    visit_begin = ts[visit_start]
+    visit_end = np.maximum.reduceat(until, visit_start)
+    in_place = visit_place >= 0
+    visits = np.bincount(visit_place[in_place], minlength=n_places)
+    dwell_ms = np.bincount(visit_place[in_place], (visit_end - visit_begin)[in_place], minlength=n_places)
+
+    clustered = place >= 0
+    members = place[clustered]
+    points = np.bincount(members, minlength=n_places)
+    center_lat = np.bincount(members, lat[clustered], n_places) / points
+    center_lon = np.bincount(members, lon[clustered], n_places) / points
+    radius = np.zeros(n_places)
+    np.maximum.at(radius, members, haversine_m(lat[clustered], lon[clustered],
+                                               center_lat[members], center_lon[members]))
+    first_seen = np.full(n_places, np.iinfo(np.int64).max)
+    last_seen = np.full(n_places, np.iinfo(np.int64).min)
+    np.minimum.at(first_seen, members, ts[clustered])
+    np.maximum.at(last_seen, members, ts[clustered])
+    place_code = np.zeros(n_places, dtype=np.int64)
+    place_code[members] = codes[clustered]
+
+    table = pd.DataFrame({
+        'contacto': np.array(ds.all_numbers, dtype=object)[place_code],
+        'latitud': center_lat,
+        'longitud': center_lon,
+        'visitas': visits,
+        'permanencia_s': (dwell_ms // 1000).astype(np.int64),
+        'puntos': points,
+        'radio_m': np.round(radius, 1),
+        'primera_visita': first_seen,
+        'ultima_visita': last_seen,
+    })
+    table = table.sort_values(['contacto', 'visitas', 'permanencia_s'],
+                              ascending=[True, False, False], kind='stable').reset_index(drop=True)
+    table.insert(1, 'ranking', table.groupby('contacto').cumcount() + 1)
+    return table[PLACE_COLUMNS]
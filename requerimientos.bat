@@ -1 +1 @@
-pip install PyQt5 matplotlib pandas PyQtWebEngine PySide6
+pip install PyQt5 matplotlib pandas PyQtWebEngine psutil
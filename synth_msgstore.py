@@ -0,0 +1,248 @@
+"""
+Generador de msgstore.db sintéticos (esquema moderno de WhatsApp) para
+medir rendimiento sin usar datos reales de un caso:
+
+    python synth_msgstore.py prueba.db --escala mediana
+    python synth_msgstore.py prueba.db --mensajes 200000 --llamadas 20000 --ubicaciones 5000
+
+Los datos imitan un teléfono real: unos pocos chats concentran la mayoría de
+los mensajes (distribución de Zipf), la actividad sigue un ciclo diario, hay
+grupos con remitentes distintos, medios con su fila en message_media,
+ubicaciones fijas y en tiempo real alrededor de los lugares habituales de
+cada contacto y llamadas con resultados y duraciones variadas. Con la misma
+semilla se genera siempre la misma base.
+
+Sin dependencias de Qt.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+# Escalas predefinidas: (mensajes, llamadas, ubicaciones)
+SCALES = {
+    'pequeña': (10_000, 1_000, 500),
+    'mediana': (1_000_000, 100_000, 50_000),
+    'grande': (5_000_000, 100_000, 50_000),
+}
+
+DEFAULT_SEED = 2024
+INSERT_BATCH_SIZE = 100_000
+# Periodo cubierto por los mensajes (ms) a partir de START_MS
+START_MS = 1_577_836_800_000  # 01/01/2020
+SPAN_MS = 3 * 365 * 24 * 3600 * 1000
+GROUP_FRACTION = 0.1
+FROM_ME_FRACTION = 0.45
+
+# message_type: 0 texto, 1 imagen, 2 audio, 3 video, 9 documento (5 = ubicación, aparte)
+MEDIA_TYPES = np.array([0, 1, 2, 3, 9])
+MEDIA_WEIGHTS = np.array([0.80, 0.10, 0.06, 0.03, 0.01])
+MEDIA_INFO = {
+    1: ('WhatsApp Images', 'IMG', 'jpg', 'image/jpeg'),
+    2: ('WhatsApp Voice Notes', 'PTT', 'opus', 'audio/ogg; codecs=opus'),
+    3: ('WhatsApp Video', 'VID', 'mp4', 'video/mp4'),
+    9: ('WhatsApp Documents', 'DOC', 'pdf', 'application/pdf'),
+}
+
+# Actividad relativa por hora del día (poca de madrugada, picos al mediodía y noche)
+HOURLY_ACTIVITY = np.array([2, 1, 1, 1, 1, 2, 4, 6, 8, 9, 9, 10,
+                            11, 10, 9, 9, 9, 10, 11, 12, 12, 10, 7, 4], dtype=np.float64)
+
+WORDS = ("hola que tal bien gracias dale nos vemos mañana ahora llego voy en camino "
+         "ok listo perfecto donde estas te llamo luego reunión almuerzo casa trabajo "
+         "mandame la foto ya salgo jaja si no tal vez hoy noche temprano").split()
+
+SCHEMA = """
+CREATE TABLE jid(_id INTEGER PRIMARY KEY, user TEXT, server TEXT, raw_string TEXT);
+CREATE TABLE chat(_id INTEGER PRIMARY KEY, jid_row_id INTEGER, subject TEXT, created_timestamp INTEGER);
+CREATE TABLE message(_id INTEGER PRIMARY KEY, chat_row_id INTEGER, from_me INTEGER, key_id TEXT,
+                     sender_jid_row_id INTEGER, status INTEGER, timestamp INTEGER,
+                     message_type INTEGER, text_data TEXT);
+CREATE TABLE message_media(message_row_id INTEGER PRIMARY KEY, file_path TEXT, media_name TEXT,
+                           file_size INTEGER, media_caption TEXT, media_duration INTEGER,
+                           mime_type TEXT, width INTEGER, height INTEGER);
+CREATE TABLE message_location(message_row_id INTEGER PRIMARY KEY, latitude REAL, longitude REAL,
+                              place_name TEXT, place_address TEXT, url TEXT,
+                              live_location_share_duration INTEGER, live_location_sequence_number INTEGER,
+                              live_location_final_latitude REAL, live_location_final_longitude REAL,
+                              live_location_final_timestamp INTEGER, map_download_status INTEGER);
+CREATE TABLE call_log(_id INTEGER PRIMARY KEY, jid_row_id INTEGER, from_me INTEGER, call_id TEXT,
+                      transaction_id INTEGER, timestamp INTEGER, video_call INTEGER, duration INTEGER,
+                      call_result INTEGER, call_type INTEGER);
+CREATE INDEX message_chat_index ON message(chat_row_id, timestamp);
+"""
+
+
+def _insert(conn, table, columns):
+    """Inserta columnas (listas o arreglos de igual largo) en bloques."""
+    n = len(columns[0])
+    placeholders = ', '.join('?' * len(columns))
+    for start in range(0, n, INSERT_BATCH_SIZE):
+        block = [c[start:start + INSERT_BATCH_SIZE] for c in columns]
+        block = [b.tolist() if isinstance(b, np.ndarray) else b for b in block]
+        conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", zip(*block))
+
+
+def _timestamps(rng, n):
+    """Instantes (ms) repartidos en SPAN_MS con el ciclo diario de HOURLY_ACTIVITY."""
+    days = rng.integers(0, SPAN_MS // 86_400_000, n)
+    hours = rng.choice(24, n, p=HOURLY_ACTIVITY / HOURLY_ACTIVITY.sum())
+    within = rng.integers(0, 3_600_000, n)
+    return START_MS + days * 86_400_000 + hours * 3_600_000 + within
+
+
+def _texts(rng, n):
+    """Textos de 1 a ~40 palabras (largo con cola larga)."""
+    lengths = np.minimum(rng.geometric(0.15, n), 40)
+    words = rng.choice(WORDS, int(lengths.sum()))
+    cuts = np.cumsum(lengths)[:-1]
+    return [' '.join(part) for part in np.split(words, cuts)]
+
+
+def generate(path, messages, calls, locations, seed=DEFAULT_SEED, progress=print):
+    """Crea (o reemplaza) path con los tamaños pedidos. Devuelve los conteos."""
+    rng = np.random.default_rng(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(SCHEMA)
+
+    # Contactos (1 jid por contacto) y grupos
+    n_contacts = int(np.clip(np.sqrt(messages) * 2, 20, 5000))
+    n_groups = max(1, int(n_contacts * GROUP_FRACTION))
+    users = [f"5917{i:07d}" for i in range(1, n_contacts + 1)]
+    group_users = [f"5917{i:07d}-{1600000000 + i}" for i in range(1, n_groups + 1)]
+    jid_ids = np.arange(1, n_contacts + n_groups + 1)
+    _insert(conn, 'jid', [jid_ids, users + group_users,
+                          ['s.whatsapp.net'] * n_contacts + ['g.us'] * n_groups,
+                          [f"{u}@s.whatsapp.net" for u in users] + [f"{g}@g.us" for g in group_users]])
+    n_chats = n_contacts + n_groups
+    chat_ids = np.arange(1, n_chats + 1)
+    subjects = [None] * n_contacts + [f"Grupo {i}" for i in range(1, n_groups + 1)]
+    _insert(conn, 'chat', [chat_ids, jid_ids, subjects, np.full(n_chats, START_MS)])
+    progress(f"{n_contacts} contactos y {n_groups} grupos")
+
+    # Mensajes: actividad por chat con cola larga (Zipf)
+    weights = 1.0 / np.arange(1, n_chats + 1) ** 1.1
+    rng.shuffle(weights)
+    text_messages = messages - locations
+    chat = rng.choice(chat_ids, text_messages, p=weights / weights.sum())
+    kinds = rng.choice(MEDIA_TYPES, text_messages, p=MEDIA_WEIGHTS)
+    # Las ubicaciones van en chats individuales
+    location_chat = rng.integers(1, n_contacts + 1, locations)
+    chat = np.concatenate([chat, location_chat])
+    kinds = np.concatenate([kinds, np.full(locations, 5)])
+    ts = _timestamps(rng, messages)
+    order = np.argsort(ts, kind='stable')
+    chat, kinds, ts = chat[order], kinds[order], ts[order]
+    message_ids = np.arange(1, messages + 1)
+    from_me = (rng.random(messages) < FROM_ME_FRACTION).astype(np.int64)
+    # Remitente: en grupos, un contacto al azar; en chats individuales, nulo
+    in_group = chat > n_contacts
+    sender = np.where(in_group & (from_me == 0), rng.integers(1, n_contacts + 1, messages), 0)
+    status = np.where(from_me == 1, 13, 0)
+
+    start = time.perf_counter()
+    for lo in range(0, messages, INSERT_BATCH_SIZE):
+        hi = min(lo + INSERT_BATCH_SIZE, messages)
+        texts = _texts(rng, hi - lo)
+        texts = [t if k in (0, 1, 3) else None for t, k in zip(texts, kinds[lo:hi].tolist())]
+        senders = [s if s else None for s in sender[lo:hi].tolist()]
+        _insert(conn, 'message', [message_ids[lo:hi], chat[lo:hi], from_me[lo:hi],
+                                  [f"3A{i:016X}" for i in message_ids[lo:hi].tolist()],
+                                  senders, status[lo:hi], ts[lo:hi], kinds[lo:hi], texts])
+        progress(f"mensajes {hi}/{messages} ({time.perf_counter() - start:.1f} s)")
+
+    # Medios
+    media = np.flatnonzero(np.isin(kinds, list(MEDIA_INFO)))
+    media_kind = kinds[media]
+    info = [MEDIA_INFO[k] for k in media_kind.tolist()]
+    folder, prefix, ext, mime = ([item[i] for item in info] for i in range(4))
+    dates = (np.datetime64('1970-01-01') + (ts[media] // 86_400_000).astype('timedelta64[D]')).astype(str)
+    names = [f"{p}-{d.replace('-', '')}-WA{i % 10000:04d}.{e}"
+             for p, d, i, e in zip(prefix, dates, media.tolist(), ext)]
+    paths = [f"Media/{f}/{n}" for f, n in zip(folder, names)]
+    sizes = rng.lognormal(11.5, 1.0, len(media)).astype(np.int64)
+    durations = np.where(np.isin(media_kind, [2, 3]), rng.integers(1, 300, len(media)), 0)
+    is_picture = np.isin(media_kind, [1, 3])
+    widths = np.where(is_picture, 1280, 0)
+    heights = np.where(is_picture, rng.choice([720, 960, 1600], len(media)), 0)
+    _insert(conn, 'message_media', [message_ids[media], paths, names, sizes, [None] * len(media),
+                                    durations, mime, widths, heights])
+    progress(f"{len(media)} medios")
+
+    # Ubicaciones: cada contacto tiene unos pocos lugares habituales
+    loc = np.flatnonzero(kinds == 5)
+    contact = chat[loc] - 1
+    n_places = 4
+    home_lat = rng.uniform(-22.0, -10.0, n_contacts)
+    home_lon = rng.uniform(-69.5, -58.0, n_contacts)
+    # Lugar 0 = casa; los demás a unos kilómetros
+    offsets = rng.normal(0, 0.05, (n_contacts, n_places, 2))
+    offsets[:, 0] = 0
+    place = rng.integers(0, n_places, len(loc))
+    place_lat = home_lat[contact] + offsets[contact, place, 0]
+    place_lon = home_lon[contact] + offsets[contact, place, 1]
+    lat = place_lat + rng.normal(0, 0.0005, len(loc))
+    lon = place_lon + rng.normal(0, 0.0005, len(loc))
+    live = rng.random(len(loc)) < 0.3
+    share = np.where(live, rng.choice([900, 3600, 28800], len(loc)), 0)
+    sequence = [int(s) if l else None for s, l in zip(rng.integers(1, 50, len(loc)), live)]
+    final_lat = [float(v) if l else None for v, l in zip(lat + rng.normal(0, 0.01, len(loc)), live)]
+    final_lon = [float(v) if l else None for v, l in zip(lon + rng.normal(0, 0.01, len(loc)), live)]
+    final_ts = [int(t + s * 1000) if l else None for t, s, l in zip(ts[loc].tolist(), share.tolist(), live)]
+    place_names = [f"Lugar {p + 1}" if p else None for p in place.tolist()]
+    urls = [f"https://maps.google.com/?q={a:.6f},{b:.6f}" for a, b in zip(lat.tolist(), lon.tolist())]
+    _insert(conn, 'message_location', [message_ids[loc], lat, lon, place_names, [None] * len(loc), urls,
+                                       share, sequence, final_lat, final_lon, final_ts, np.zeros(len(loc))])
+    progress(f"{len(loc)} ubicaciones")
+
+    # Llamadas: los contactos más frecuentes también llaman más
+    call_contact = rng.choice(np.arange(1, n_contacts + 1), calls,
+                              p=weights[:n_contacts] / weights[:n_contacts].sum())
+    call_from_me = (rng.random(calls) < 0.5).astype(np.int64)
+    video = (rng.random(calls) < 0.2).astype(np.int64)
+    # call_result: 5 contestada; 2 rechazada, 3 no contestada, 4 cancelada
+    result = rng.choice([5, 2, 3, 4], calls, p=[0.65, 0.1, 0.15, 0.1])
+    duration = np.where(result == 5, rng.lognormal(4.5, 1.2, calls).astype(np.int64), 0)
+    call_ids = np.arange(1, calls + 1)
+    _insert(conn, 'call_log', [call_ids, call_contact, call_from_me,
+                               [f"call:{i:012X}" for i in call_ids.tolist()], call_ids,
+                               np.sort(_timestamps(rng, calls)), video, duration, result, np.ones(calls)])
+    progress(f"{calls} llamadas")
+
+    conn.commit()
+    conn.close()
+    return {'mensajes': messages, 'llamadas': calls, 'ubicaciones': int(len(loc)),
+            'medios': int(len(media)), 'contactos': n_contacts, 'grupos': n_groups}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un msgstore.db sintético para pruebas de rendimiento.")
+    parser.add_argument('salida', help="Ruta del msgstore.db a crear (se reemplaza si existe)")
+    parser.add_argument('--escala', choices=list(SCALES), default='pequeña')
+    parser.add_argument('--mensajes', type=int, help="Mensajes (incluye las ubicaciones)")
+    parser.add_argument('--llamadas', type=int)
+    parser.add_argument('--ubicaciones', type=int)
+    parser.add_argument('--semilla', type=int, default=DEFAULT_SEED)
+    args = parser.parse_args(argv)
+
+    messages, calls, locations = SCALES[args.escala]
+    messages = args.mensajes if args.mensajes is not None else messages
+    calls = args.llamadas if args.llamadas is not None else calls
+    locations = min(args.ubicaciones if args.ubicaciones is not None else locations, messages)
+
+    start = time.perf_counter()
+    counts = generate(args.salida, messages, calls, locations, args.semilla)
+    print(f"{args.salida}: {counts} en {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
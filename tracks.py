@@ -0,0 +1,205 @@
+"""
+Recorridos de ubicación en tiempo real.
+
+Agrupa las ubicaciones en tiempo real (live_location_share_duration > 0) de
+cada contacto en recorridos ordenados por tiempo y, a igualdad de tiempo, por
+live_location_sequence_number. Cada mensaje aporta su punto inicial y, si lo
+tiene, su punto final (live_location_final_*). Un recorrido se corta cuando
+un punto llega después de que terminó la última ubicación compartida.
+
+Para dibujarlos se simplifican con Douglas-Peucker: la importancia de cada
+vértice (la tolerancia a partir de la cual se descarta) se calcula una sola
+vez por contacto, y simplificar a un zoom es quedarse con los vértices cuya
+importancia supera la tolerancia de ese zoom (resultado en caché).
+
+Sin dependencias de Qt.
+"""
+import numpy as np
+
+# Tolerancia de la simplificación, en píxeles de pantalla
+TRACK_TOLERANCE_PX = 2.0
+# Máximo de vértices por contacto y zoom
+TRACK_MAX_VERTICES = 500
+# Por debajo de la tolerancia de este zoom ya no se distinguen los vértices
+TRACK_MAX_ZOOM = 19
+# Colores de las polilíneas (se asignan por contacto)
+TRACK_COLORS = ['#128C7E', '#E53935', '#1E88E5', '#8E24AA',
+                '#F4511E', '#6D4C41', '#00897B', '#3949AB']
+
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def zoom_tolerance(zoom):
+    """Tolerancia en unidades del mundo (0..1) para un nivel de zoom."""
+    return TRACK_TOLERANCE_PX / (256.0 * 2 ** zoom)
+
+
+def mercator(latitudes, longitudes):
+    """Proyección Web Mercator normalizada (x, y en 0..1), como los mosaicos."""
+    lat = np.radians(np.clip(latitudes, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    x = (np.asarray(longitudes) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return x, y
+
+
+def douglas_peucker_importance(x, y, min_tolerance=0.0):
+    """
+    Importancia Douglas-Peucker de cada vértice de una polilínea: el vértice
+    se conserva al simplificar con tolerancia t si su importancia es >= t.
+
+    Se recorre por niveles: en cada nivel se parten a la vez todos los tramos
+    abiertos, con las distancias de todos sus puntos a sus cuerdas en una
+    sola operación vectorizada. La importancia de un vértice nunca supera la
+    de los extremos de su tramo, así que los vértices con importancia >= t
+    son exactamente los que deja Douglas-Peucker con tolerancia t. Los tramos
+    cuya distancia máxima no supera min_tolerance no se siguen partiendo
+    (importancia 0).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    importance = np.zeros(n)
+    if n == 0:
+        return importance
+    importance[0] = importance[-1] = np.inf
+
+    breaks = np.array([0, n - 1])
+    active = np.arange(1, n - 1)
+    while len(active):
+        # Tramo de cada punto pendiente y distancia a su cuerda
+        seg = np.searchsorted(breaks, active, side='right') - 1
+        i = breaks[seg]
+        j = breaks[seg + 1]
+        dx = x[j] - x[i]
+        dy = y[j] - y[i]
+        norm = np.hypot(dx, dy)
+        px = x[active] - x[i]
+        py = y[active] - y[i]
+        # Tramo cerrado (extremos iguales): distancia al punto inicial
+        dist = np.where(norm > 0, np.abs(dy * px - dx * py) / np.where(norm > 0, norm, 1.0), np.hypot(px, py))
+
+        # Máximo de cada tramo (los puntos están agrupados por tramo)
+        group_start = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        group = np.cumsum(np.r_[True, seg[1:] != seg[:-1]]) - 1
+        group_max = np.maximum.reduceat(dist, group_start)
+        at_max = np.flatnonzero(dist == group_max[group])
+        _, first = np.unique(group[at_max], return_index=True)
+        chosen = at_max[first]
+
+        split = group_max > min_tolerance
+        vertex = active[chosen[split]]
+        importance[vertex] = np.minimum(group_max[split],
+                                        np.minimum(importance[i[chosen[split]]], importance[j[chosen[split]]]))
+
+        pending = split[group]
+        pending[chosen] = False
+        active = active[pending]
+        breaks = np.sort(np.concatenate([breaks, vertex]))
+    return importance
+
+
+class LiveTracks:
+    """
+    Recorridos en tiempo real de un LocationDataset (ver locations.py), en
+    columnas NumPy ordenadas por (contacto, tiempo, secuencia).
+    """
+
+    def __init__(self, dataset):
+        ds = dataset
+        live = np.flatnonzero(ds.live_durations > 0)
+        with_final = live[~np.isnan(ds.final_latitudes[live]) & ~np.isnan(ds.final_longitudes[live])]
+
+        start_ts = ds.timestamps[live]
+        share_end = np.where(start_ts != ds.NO_TIMESTAMP, start_ts + ds.live_durations[live] * 1000, start_ts)
+        # Sin live_location_final_timestamp, el punto final se ubica al terminar la duración
+        final_ts = np.array([t if t is not None else ds.NO_TIMESTAMP for t in ds.final_timestamps[with_final]],
+                            dtype=np.int64)
+        fallback = ds.timestamps[with_final] + ds.live_durations[with_final] * 1000
+        final_ts = np.where(final_ts != ds.NO_TIMESTAMP, final_ts, fallback)
+
+        codes = np.concatenate([ds.codes[live], ds.codes[with_final]])
+        ts = np.concatenate([start_ts, final_ts])
+        ends = np.concatenate([share_end, final_ts])
+        seq = np.concatenate([ds.sequence_numbers[live], ds.sequence_numbers[with_final]])
+        lat = np.concatenate([ds.latitudes[live], ds.final_latitudes[with_final]])
+        lon = np.concatenate([ds.longitudes[live], ds.final_longitudes[with_final]])
+
+        valid = ~np.isnan(lat) & ~np.isnan(lon) & (ts != ds.NO_TIMESTAMP)
+        order = np.lexsort((seq[valid], ts[valid], codes[valid]))
+        self.codes = codes[valid][order]
+        self.timestamps = ts[valid][order]
+        self.latitudes = lat[valid][order]
+        self.longitudes = lon[valid][order]
+        self.x, self.y = mercator(self.latitudes, self.longitudes)
+        ends = ends[valid][order]
+
+        # Tramos: empieza uno nuevo al cambiar de contacto o cuando el punto
+        # llega después del fin de todo lo compartido antes. Desplazar los
+        # tiempos por contacto permite un único máximo acumulado.
+        if len(self.timestamps):
+            base = self.timestamps.min()
+            span = int(max(ends.max(), self.timestamps.max()) - base) + 1
+            ts_key = self.codes * span + (self.timestamps - base)
+            end_key = self.codes * span + (ends - base)
+            new_segment = np.ones(len(ts_key), dtype=bool)
+            new_segment[1:] = ts_key[1:] > np.maximum.accumulate(end_key)[:-1]
+            self.segments = np.cumsum(new_segment) - 1
+        else:
+            self.segments = np.empty(0, dtype=np.int64)
+
+        n_numbers = len(ds.all_numbers)
+        self.starts = np.searchsorted(self.codes, np.arange(n_numbers), side='left')
+        self.ends = np.searchsorted(self.codes, np.arange(n_numbers), side='right')
+        self.code_of = ds.code_of
+        self._importance = {}
+        self._simplified = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def has_track(self, number):
+        code = self.code_of.get(number)
+        return code is not None and self.ends[code] - self.starts[code] >= 2
+
+    def importance(self, code):
+        """Importancia Douglas-Peucker de los vértices de un contacto (en caché)."""
+        if code not in self._importance:
+            lo, hi = self.starts[code], self.ends[code]
+            segments = self.segments[lo:hi]
+            cuts = np.flatnonzero(np.diff(segments)) + 1
+            bounds = np.concatenate([[0], cuts, [hi - lo]])
+            min_tolerance = zoom_tolerance(TRACK_MAX_ZOOM)
+            parts = [douglas_peucker_importance(self.x[lo + a:lo + b], self.y[lo + a:lo + b], min_tolerance)
+                     for a, b in zip(bounds[:-1], bounds[1:])]
+            self._importance[code] = np.concatenate(parts) if parts else np.empty(0)
+        return self._importance[code]
+
+    def simplified(self, number, zoom):
+        """Índices de los vértices que se dibujan para un contacto a un zoom."""
+        code = self.code_of.get(number)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        key = (code, int(zoom))
+        if key not in self._simplified:
+            importance = self.importance(code)
+            keep = np.flatnonzero(importance >= zoom_tolerance(zoom))
+            cap = max(TRACK_MAX_VERTICES, int(np.isinf(importance).sum()))
+            if len(keep) > cap:
+                # Los más importantes: sigue siendo un resultado Douglas-Peucker
+                keep = np.sort(np.argpartition(-importance, cap - 1)[:cap])
+            self._simplified[key] = self.starts[code] + keep
+        return self._simplified[key]
+
+    def polylines(self, number, zoom, start_ms, end_ms):
+        """Tramos [[lat, lon], ...] simplificados de un contacto en [start_ms, end_ms]."""
+        idx = self.simplified(number, zoom)
+        ts = self.timestamps[idx]
+        idx = idx[(ts >= start_ms) & (ts <= end_ms)]
+        if len(idx) < 2:
+            return []
+        coords = np.column_stack([np.round(self.latitudes[idx], 6), np.round(self.longitudes[idx], 6)])
+        cuts = np.flatnonzero(np.diff(self.segments[idx])) + 1
+        return [part.tolist() for part in np.split(coords, cuts) if len(part) >= 2]
+
+    def color(self, number):
+        return TRACK_COLORS[self.code_of.get(number, 0) % len(TRACK_COLORS)]
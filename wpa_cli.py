@@ -0,0 +1,311 @@
+"""
+Análisis por lotes sin interfaz gráfica sobre uno o más msgstore.db:
+
+    python wpa_cli.py tel1/msgstore.db tel2/msgstore.db --salida informes
+    python wpa_cli.py --casos --salida informes --formato parquet
+    python wpa_cli.py bases/*.db --informes chats llamadas --procesos 4
+
+Por cada base escribe en <salida>/<nombre>/:
+
+    chats.<fmt>             mensajes por chat (enviados, recibidos, multimedia, fechas)
+    llamadas.<fmt>          llamadas por contacto con la clasificación de tipo_llamada
+    llamadas_detalle.<fmt>  cada llamada clasificada (call_stats.export_call_details)
+    ubicaciones.<fmt>       todas las ubicaciones compartidas
+    lugares.<fmt>           lugares frecuentes por contacto (places.py)
+    recorridos.<fmt>        puntos de las ubicaciones en tiempo real (tracks.py)
+
+y en <salida>/resumen.json los totales y archivos de todas las bases.
+
+Las bases se procesan en paralelo, una por proceso (como
+cases.load_sources), y dentro de cada una las tablas se leen por bloques de
+--bloque filas (msgstore chunks): la memoria depende del bloque y no del
+tamaño de la base. Lugares y recorridos necesitan todas las ubicaciones de
+la base a la vez (LocationDataset), que son pocas frente a los mensajes.
+
+Sin dependencias de Qt.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from call_stats import (CALL_DETAIL_COLUMNS, CALL_RESULT_CONTESTADA, EXPORT_FORMATS, TIPOS_LLAMADA,
+                        classify_calls, export_call_details, open_sink)
+from case_data import display_timestamps
+from cases import CaseSource, load_registry
+from locations import load_location_dataset
+from msgstore import get_repository
+from places import find_places
+from tracks import LiveTracks
+
+REPORTS = ('chats', 'llamadas', 'ubicaciones')
+DEFAULT_CHUNK_SIZE = 100_000
+SUMMARY_FILE = 'resumen.json'
+
+CHAT_COLUMNS = ['chat_jid', 'chat_name', 'from_me', 'timestamp', 'message_type']
+# message_type de las ubicaciones (ver app11.MessageDelegate)
+LOCATION_MESSAGE_TYPE = 5
+
+
+def unique_names(db_paths, taken=()):
+    """Nombre de cada base: su carpeta (como el administrador de casos), sin repetir."""
+    names = list(taken)
+    for path in db_paths:
+        name = os.path.basename(os.path.dirname(os.path.abspath(path))) or 'base'
+        candidate, n = name, 2
+        while candidate in names:
+            candidate = f"{name} ({n})"
+            n += 1
+        names.append(candidate)
+    return names[len(taken):]
+
+
+def format_timestamps(timestamps):
+    """Texto dd/mm/aaaa hh:mm:ss ('' si no hay fecha)."""
+    return display_timestamps(pd.Series(timestamps).astype('float64')).fillna('')
+
+
+def chat_summary(repository, chunksize):
+    """Mensajes por chat, acumulados bloque por bloque."""
+    parts = []
+    for chunk in repository.chunks('messages', chunksize, columns=CHAT_COLUMNS):
+        chunk = chunk.assign(
+            enviado=(chunk['from_me'] == 1).astype('int64'),
+            multimedia=(chunk['message_type'] != 0).astype('int64'),
+            ubicacion=(chunk['message_type'] == LOCATION_MESSAGE_TYPE).astype('int64'),
+            ts=chunk['timestamp'].where(chunk['timestamp'] > 0),
+        )
+        parts.append(chunk.groupby('chat_jid', sort=False).agg(
+            nombre=('chat_name', 'first'), mensajes=('from_me', 'size'), enviados=('enviado', 'sum'),
+            multimedia=('multimedia', 'sum'), ubicaciones=('ubicacion', 'sum'),
+            primero=('ts', 'min'), ultimo=('ts', 'max')))
+    if not parts:
+        return pd.DataFrame(columns=['chat_jid', 'nombre', 'mensajes', 'enviados', 'recibidos', 'multimedia',
+                                     'ubicaciones', 'primer_mensaje', 'ultimo_mensaje'])
+
+    table = pd.concat(parts).groupby(level=0).agg({
+        'nombre': 'first', 'mensajes': 'sum', 'enviados': 'sum', 'multimedia': 'sum',
+        'ubicaciones': 'sum', 'primero': 'min', 'ultimo': 'max'})
+    table = table.sort_values('ultimo', ascending=False, na_position='last').reset_index()
+    table['nombre'] = table['nombre'].where(table['nombre'] != '', table['chat_jid'])
+    return pd.DataFrame({
+        'chat_jid': table['chat_jid'],
+        'nombre': table['nombre'],
+        'mensajes': table['mensajes'],
+        'enviados': table['enviados'],
+        'recibidos': table['mensajes'] - table['enviados'],
+        'multimedia': table['multimedia'],
+        'ubicaciones': table['ubicaciones'],
+        'primer_mensaje': format_timestamps(table['primero']),
+        'ultimo_mensaje': format_timestamps(table['ultimo']),
+    })
+
+
+def call_summary(repository, chunksize):
+    """
+    Llamadas por contacto con la misma clasificación que tipo_llamada
+    (call_stats.classify_calls), acumuladas bloque por bloque.
+    """
+    parts = []
+    for chunk in repository.chunks('calls', chunksize, columns=CALL_DETAIL_COLUMNS):
+        tipos = classify_calls(chunk)
+        answered = (chunk['call_result'] == CALL_RESULT_CONTESTADA).to_numpy()
+        duration = pd.to_numeric(chunk['duration'], errors='coerce').fillna(0)
+        data = pd.DataFrame({
+            'caller_jid': chunk['caller_jid'].fillna('Desconocido').astype(str),
+            'total_llamadas': 1,
+            **{tipo: (tipos == tipo).astype('int64') for tipo in TIPOS_LLAMADA},
+            'videollamadas': (pd.to_numeric(chunk['video_call'], errors='coerce').fillna(0) == 1).astype('int64'),
+            'contestadas': answered.astype('int64'),
+            'duracion_total': duration,
+            'primero': chunk['timestamp'].where(chunk['timestamp'] > 0),
+            'ultimo': chunk['timestamp'].where(chunk['timestamp'] > 0),
+        })
+        parts.append(data.groupby('caller_jid', sort=False).agg(
+            {**{c: 'sum' for c in data.columns if c not in ('caller_jid', 'primero', 'ultimo')},
+             'primero': 'min', 'ultimo': 'max'}))
+    columns = ['caller_jid', 'total_llamadas', *TIPOS_LLAMADA, 'videollamadas', 'contestadas',
+               'tasa_respuesta', 'duracion_total', 'duracion_promedio', 'primer_contacto', 'ultimo_contacto']
+    if not parts:
+        return pd.DataFrame(columns=columns)
+
+    table = pd.concat(parts).groupby(level=0).agg(
+        {**{c: 'sum' for c in parts[0].columns if c not in ('primero', 'ultimo')}, 'primero': 'min', 'ultimo': 'max'})
+    table = table.sort_values('total_llamadas', ascending=False, kind='stable').reset_index()
+    table['tasa_respuesta'] = table['contestadas'] / table['total_llamadas']
+    # Promedio sobre las contestadas, como CallStatsEngine
+    table['duracion_promedio'] = (table['duracion_total'] / table['contestadas'].where(table['contestadas'] > 0)).fillna(0.0)
+    table['primer_contacto'] = format_timestamps(table['primero'])
+    table['ultimo_contacto'] = format_timestamps(table['ultimo'])
+    return table[columns]
+
+
+def write_table(df, path, fmt):
+    sink = open_sink(path, fmt)
+    try:
+        sink.write(df)
+    finally:
+        sink.close()
+
+
+def export_locations(repository, path, fmt, chunksize):
+    """Todas las ubicaciones, escritas bloque por bloque. Devuelve las filas."""
+    rows = 0
+    sink = open_sink(path, fmt)
+    try:
+        for chunk in repository.chunks('locations', chunksize):
+            chunk.insert(2, 'fecha', format_timestamps(chunk['timestamp']).to_numpy())
+            sink.write(chunk)
+            rows += len(chunk)
+    finally:
+        sink.close()
+    return rows
+
+
+def track_points(dataset):
+    """Puntos de los recorridos en tiempo real (uno por fila, con su tramo)."""
+    tracks = LiveTracks(dataset)
+    return pd.DataFrame({
+        'contacto': np.array(dataset.all_numbers, dtype=object)[tracks.codes] if len(tracks) else [],
+        'tramo': tracks.segments,
+        'timestamp': tracks.timestamps,
+        'fecha': format_timestamps(tracks.timestamps).to_numpy(),
+        'latitud': tracks.latitudes,
+        'longitud': tracks.longitudes,
+    })
+
+
+def analyze_database(db_path, name, output_dir, reports=REPORTS, fmt='csv', chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Trabajo de cada proceso: escribe los informes de una base en
+    output_dir y devuelve su resumen (totales y archivos escritos).
+    """
+    start = time.perf_counter()
+    repository = get_repository(db_path)
+    os.makedirs(output_dir, exist_ok=True)
+    summary = {'nombre': name, 'base': os.path.abspath(db_path), 'esquema': repository.version, 'archivos': []}
+
+    def output(report):
+        path = os.path.join(output_dir, f"{report}.{fmt}")
+        summary['archivos'].append(path)
+        return path
+
+    if 'chats' in reports:
+        chats = chat_summary(repository, chunksize)
+        write_table(chats, output('chats'), fmt)
+        summary['chats'] = len(chats)
+        summary['mensajes'] = int(chats['mensajes'].sum()) if len(chats) else 0
+
+    if 'llamadas' in reports:
+        calls = call_summary(repository, chunksize)
+        write_table(calls, output('llamadas'), fmt)
+        summary['llamadas'] = int(calls['total_llamadas'].sum()) if len(calls) else 0
+        summary['contactos_llamadas'] = len(calls)
+        detail = os.path.join(output_dir, f"llamadas_detalle.{fmt}")
+        if export_call_details(db_path, detail, fmt, chunksize=chunksize)[1]:
+            summary['archivos'].append(detail)
+
+    if 'ubicaciones' in reports:
+        summary['ubicaciones'] = export_locations(repository, output('ubicaciones'), fmt, chunksize)
+        dataset = load_location_dataset(db_path)
+        places = find_places(dataset)
+        for column in ('primera_visita', 'ultima_visita'):
+            places[column] = format_timestamps(places[column]).to_numpy()
+        write_table(places, output('lugares'), fmt)
+        summary['lugares'] = len(places)
+        tracks = track_points(dataset)
+        write_table(tracks, output('recorridos'), fmt)
+        summary['puntos_recorridos'] = len(tracks)
+
+    summary['segundos'] = round(time.perf_counter() - start, 2)
+    return summary
+
+
+def run(sources, output_root, reports=REPORTS, fmt='csv', chunksize=DEFAULT_CHUNK_SIZE,
+        workers=None, progress=None):
+    """
+    Analiza varias fuentes (cases.CaseSource) en paralelo, un proceso por
+    base. Devuelve {nombre: resumen o Exception}; progress(nombre,
+    resultado) se llama al terminar cada base.
+    """
+    results = {}
+    workers = min(len(sources), workers or os.cpu_count() or 1)
+    jobs = [(os.path.abspath(s.db_path), s.name, os.path.join(output_root, s.name)) for s in sources]
+    if workers <= 1:
+        for db_path, name, output_dir in jobs:
+            try:
+                results[name] = analyze_database(db_path, name, output_dir, reports, fmt, chunksize)
+            except Exception as e:
+                results[name] = e
+            if progress:
+                progress(name, results[name])
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze_database, db_path, name, output_dir, reports, fmt, chunksize): name
+                   for db_path, name, output_dir in jobs}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+            if progress:
+                progress(name, results[name])
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Informes de chats, llamadas y ubicaciones sin interfaz gráfica.")
+    parser.add_argument('bases', nargs='*', help="Rutas de msgstore.db")
+    parser.add_argument('--casos', action='store_true', help="Usar los teléfonos registrados en casos.json")
+    parser.add_argument('--salida', default='informes', help="Carpeta de salida (una subcarpeta por base)")
+    parser.add_argument('--formato', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--informes', nargs='+', choices=REPORTS, default=list(REPORTS))
+    parser.add_argument('--procesos', type=int, default=None, help="Bases analizadas a la vez")
+    parser.add_argument('--bloque', type=int, default=DEFAULT_CHUNK_SIZE, help="Filas leídas por bloque")
+    args = parser.parse_args(argv)
+
+    sources = load_registry()[0] if args.casos else []
+    names = unique_names(args.bases, [s.name for s in sources])
+    sources += [CaseSource(name, path) for name, path in zip(names, args.bases)]
+    if not sources:
+        parser.error("indique al menos un msgstore.db o --casos")
+
+    total = len(sources)
+    done = []
+
+    def progress(name, result):
+        done.append(name)
+        if isinstance(result, Exception):
+            print(f"[{len(done)}/{total}] {name}: ERROR {result}", flush=True)
+        else:
+            print(f"[{len(done)}/{total}] {name}: {result['segundos']} s", flush=True)
+
+    start = time.perf_counter()
+    results = run(sources, args.salida, args.informes, args.formato, max(1, args.bloque), args.procesos, progress)
+
+    summary = {
+        'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'formato': args.formato,
+        'informes': args.informes,
+        'segundos': round(time.perf_counter() - start, 2),
+        'bases': [{'nombre': name, 'error': str(result)} if isinstance(result, Exception) else result
+                  for name, result in ((s.name, results[s.name]) for s in sources)],
+    }
+    os.makedirs(args.salida, exist_ok=True)
+    with open(os.path.join(args.salida, SUMMARY_FILE), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    errors = sum(isinstance(r, Exception) for r in results.values())
+    print(f"{total - errors} de {total} bases analizadas en {summary['segundos']} s; "
+          f"resumen en {os.path.join(args.salida, SUMMARY_FILE)}")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())